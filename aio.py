@@ -0,0 +1,195 @@
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from lumentum import Lumentum
+from ila import ILA
+from teraflex import TFlex
+from quadflex import QFlex
+
+AIO_WORKERS = 32  # threads of the shared executor, one per device of the testbed with room to spare
+
+_executor = None
+_executor_lock = threading.Lock()
+# Locks of the devices, per event loop since an asyncio lock belongs to one loop
+_locks = weakref.WeakKeyDictionary()
+_locks_lock = threading.Lock()
+
+
+def shared_executor():
+    """Get the executor the facades run the blocking driver calls on, creating it on first use.
+
+    :return: Thread pool of ``AIO_WORKERS`` threads
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=AIO_WORKERS, thread_name_prefix="aio"
+            )
+        return _executor
+
+
+def device_lock(device):
+    """Get the lock serializing the calls to a device in the running event loop, shared by all the facades of the device.
+
+    :param device: Device name
+    :type device: str
+
+    :return: Lock of the device
+    :rtype: asyncio.Lock
+    """
+
+    loop = asyncio.get_running_loop()
+    with _locks_lock:
+        locks = _locks.setdefault(loop, {})
+        if device not in locks:
+            locks[device] = asyncio.Lock()
+        return locks[device]
+
+
+def _device_name(driver):
+    # Name the driver was opened with, which the retrying session of the driver also holds
+    name = getattr(driver, "device_name", None)
+    for attribute in ("m", "conn"):
+        if name is None:
+            name = getattr(getattr(driver, attribute, None), "device", None)
+    return name if name is not None else "%s-%x" % (type(driver).__name__, id(driver))
+
+
+def _release(lock, future):
+    lock.release()
+    # Retrieve the error of a call nobody awaits any more, e.g. after a cancellation
+    if not future.cancelled():
+        future.exception()
+
+
+class AsyncDevice:
+
+    """Asyncio facade of a synchronous driver. Every public method of the driver is available as a coroutine function of the same name and arguments, e.g. ``await device.wss_get_connections()``; other attributes are those of the driver. The blocking calls run on the shared executor, so one event loop drives many devices concurrently, while the calls to one device wait for each other on the lock of the device and run one at a time, in the order they were made. A call that is cancelled still runs to completion on the device, and the device is only released once it has.
+
+    :param driver: Driver of the device, e.g. a :class:`lumentum.Lumentum`
+    :type driver: object
+
+    :param device: Device name the calls are serialized on, the name the driver was opened with by default
+    :type device: str
+
+    :param executor: Executor to run the calls on, :func:`shared_executor` by default
+    :type executor: concurrent.futures.Executor
+    """
+
+    #: Driver class built by :meth:`open`
+    driver_class = None
+
+    def __init__(self, driver, device=None, executor=None):
+
+        self.driver = driver
+        self.device = device or _device_name(driver)
+        self.executor = executor
+
+    @classmethod
+    async def open(cls, *args, executor=None, **kwargs):
+        """Open the driver on the executor, as connecting blocks, and wrap it.
+
+        :param args: Arguments of the driver class, e.g. the device name
+
+        :param executor: Executor to run the calls on, :func:`shared_executor` by default
+        :type executor: concurrent.futures.Executor
+
+        :return: Facade of the driver
+        :rtype: AsyncDevice
+        """
+
+        loop = asyncio.get_running_loop()
+        driver = await loop.run_in_executor(
+            executor or shared_executor(),
+            functools.partial(cls.driver_class, *args, **kwargs),
+        )
+        return cls(driver, executor=executor)
+
+    async def call(self, function, *args, **kwargs):
+        """Run a blocking function of the device on the executor once the device is free.
+
+        :param function: Function to call with the remaining arguments
+        :type function: callable
+
+        :return: Result of the function
+        """
+
+        lock = device_lock(self.device)
+        await lock.acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor or shared_executor(),
+                functools.partial(function, *args, **kwargs),
+            )
+        except BaseException:
+            lock.release()
+            raise
+        future.add_done_callback(functools.partial(_release, lock))
+        return await asyncio.shield(future)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.driver, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        async def call(*args, **kwargs):
+            return await self.call(attribute, *args, **kwargs)
+
+        return call
+
+    def __repr__(self):
+        return "<%s %s>" % (type(self).__name__, self.device)
+
+
+class AsyncLumentum(AsyncDevice):
+
+    """Asyncio facade of :class:`lumentum.Lumentum`, e.g. ``await roadm.edfa_get_info()``, ``await roadm.wss_get_connections()``, ``await roadm.wss_add_connections(connections)`` or ``await roadm.wss_atten(wss_id, port, [(connection, atten), ...])``. Opened with ``await AsyncLumentum.open('roadm_1')``."""
+
+    driver_class = Lumentum
+
+
+class AsyncILA(AsyncDevice):
+
+    """Asyncio facade of :class:`ila.ILA`, e.g. ``await ila.get_telemetry()``, ``await ila.get_state()`` or ``await ila.apply_state(state)``. Opened with ``await AsyncILA.open('ila_1')``."""
+
+    driver_class = ILA
+
+
+class AsyncTFlex(AsyncDevice):
+
+    """Asyncio facade of :class:`teraflex.TFlex`, e.g. ``await tf.get_params()`` or ``await tf.change_configuration(...)``. Opened with ``await AsyncTFlex.open('tf_1')``."""
+
+    driver_class = TFlex
+
+
+class AsyncQFlex(AsyncDevice):
+
+    """Asyncio facade of :class:`quadflex.QFlex`, e.g. ``await qf.get_params()`` or ``await qf.get_interface_state()``. Opened with ``await AsyncQFlex.open('qf_1')``."""
+
+    driver_class = QFlex
+
+
+async def gather_calls(devices, method, *args, **kwargs):
+    """Call the same method on several devices concurrently.
+
+    :param devices: Facades of the devices
+    :type devices: list
+
+    :param method: Name of the driver method
+    :type method: str
+
+    :return: Result of each device keyed by device name, or the error it raised
+    :rtype: dict
+    """
+
+    results = await asyncio.gather(
+        *(getattr(device, method)(*args, **kwargs) for device in devices),
+        return_exceptions=True,
+    )
+    return {device.device: result for device, result in zip(devices, results)}
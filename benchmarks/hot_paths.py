@@ -0,0 +1,349 @@
+"""Benchmarks of the driver hot paths.
+
+Each benchmark times a driver method against recorded replies, so that only the work done by the driver is measured: building requests and parsing replies. The replies are recorded once from the offline emulators (``lumentum_emulator``, ``polatis_simulator``, ``osa_emulator``) or read from the fixtures directory, and a sqlite database stands in for the port database of ``check_patch_owners``.
+
+Usage, from the repository root::
+
+    python benchmarks/hot_paths.py --output results.json
+    python benchmarks/hot_paths.py osa.get_trace[5001] --compare results.json
+
+Results are written as json with the commit they were measured on. With ``--compare``, the exit status is 1 when any benchmark is slower than in the given results by more than the tolerance.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from types import SimpleNamespace
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, REPO_DIR)
+
+BENCHMARK_REPEAT = 7
+BENCHMARK_TOLERANCE = 0.2  # slowdown over the compared results reported as a regression
+
+
+class Recorder:
+
+    """Session proxy recording the replies of the calls made on a session, in call order per method."""
+
+    def __init__(self, session):
+
+        self.session = session
+        self.replies = {}
+
+    def __getattr__(self, name):
+        call = getattr(self.session, name)
+
+        def record(*args, **kwargs):
+            reply = call(*args, **kwargs)
+            self.replies.setdefault(name, []).append(reply)
+            return reply
+
+        return record
+
+
+class Replay:
+
+    """Session replaying recorded replies, cycling through the replies of each method."""
+
+    def __init__(self, replies):
+
+        self.replies = replies
+        self.position = {}
+
+    def __getattr__(self, name):
+        replies = self.replies[name]
+
+        def replay(*args, **kwargs):
+            position = self.position.get(name, 0)
+            self.position[name] = position + 1
+            return replies[position % len(replies)]
+
+        return replay
+
+
+class RecordedTelnet:
+
+    """Telnet connection answering each TL1 command with the response the simulator gave to it the first time."""
+
+    def __init__(self, simulator):
+
+        self.simulator = simulator
+        self.replies = {}
+        self.pending = b""
+
+    def write(self, data):
+        command = data.decode("ascii").strip().rstrip(";")
+        if command not in self.replies:
+            self.replies[command] = self.simulator.execute(command).encode("ascii")
+        self.pending = self.replies[command]
+
+    def read_until(self, expected, timeout=None):
+        return self.pending
+
+    def close(self):
+        pass
+
+
+class RecordedOSA:
+
+    """VISA resource answering queries with recorded replies, decoding traces with pyvisa like a real resource."""
+
+    def __init__(self, replies):
+
+        self.replies = replies
+
+    def query(self, cmd):
+        return self.replies[cmd]
+
+    def query_ascii_values(self, cmd, converter="f", separator=",", container=list):
+        from pyvisa.util import from_ascii_block
+
+        return from_ascii_block(self.replies[cmd], converter, separator, container)
+
+    def write(self, cmd):
+        pass
+
+
+class SqliteConnection:
+
+    """DB-API connection to a sqlite database accepting the '%s' placeholders of the MySQL queries."""
+
+    def __init__(self, connection):
+
+        self.connection = connection
+
+    def cursor(self):
+        cursor = self.connection.cursor()
+        return SimpleNamespace(
+            execute=lambda query, params=(): cursor.execute(
+                query.replace("%s", "?"), params
+            ),
+            fetchone=cursor.fetchone,
+            close=cursor.close,
+        )
+
+    def close(self):
+        self.connection.close()
+
+
+def _roadm():
+    from lumentum import Lumentum
+    from lumentum_emulator import LumentumEmulator
+
+    roadm = Lumentum("roadm_1", session=LumentumEmulator())
+    roadm.make_grid(open_channels=list(range(1, 96)))
+    return roadm
+
+
+def _replayed(device, attribute, call):
+    # Run the call once against the emulator and replay its replies afterwards
+    recorder = Recorder(getattr(device, attribute))
+    setattr(device, attribute, recorder)
+    call()
+    setattr(device, attribute, Replay(recorder.replies))
+    return call
+
+
+def wss_get_connections():
+    roadm = _roadm()
+    return _replayed(roadm, "m", roadm.wss_get_connections)
+
+
+def record_monitor_data():
+    from monitor import RoadmMonitor
+    from lumentum_emulator import write_ports_file
+
+    roadm = _roadm()
+    ports_file = write_ports_file(os.path.join(tempfile.mkdtemp(), "ports.tsv"))
+    monitor = RoadmMonitor(roadm, ports_file=ports_file)
+    return _replayed(roadm, "m", lambda: monitor.record_monitor_data(WAIT_TIME=0))
+
+
+def wss_add_connections(channels):
+    roadm = _roadm()
+    connections = roadm.wss_gen_connections_dwdm(1, 4101, 4201)
+    if channels > len(connections):
+        connections += roadm.wss_gen_connections_dwdm(2, 5101, 5201)
+    return _replayed(roadm, "m", lambda: roadm.wss_add_connections(connections))
+
+
+def polatis_getall(tcp=False):
+    from polatis import Polatis
+    from polatis_simulator import PolatisSimulator
+
+    simulator = PolatisSimulator(power={port: -3.0 for port in range(1, 321)})
+    simulator.start()
+    for port in range(1, 321):
+        simulator.execute("ENT-PATCH::%d,%d:123:" % (port, port + 320))
+    polatis = Polatis(host=simulator.host, port=simulator.port)
+    reply = polatis.login()
+    if "COMPLD" not in reply:
+        raise RuntimeError("Polatis login refused by the simulator: %s" % reply)
+    if not tcp:
+        polatis.telnet.close()
+        simulator.stop()
+        polatis.telnet = RecordedTelnet(simulator)
+    return polatis.getall
+
+
+def teraflex_get_params():
+    from teraflex import TFlex
+
+    replies = []
+    for name in ("teraflex_pm_data.xml", "teraflex_fec_ber.xml"):
+        with open(os.path.join(FIXTURES_DIR, name)) as file_input:
+            replies.append(SimpleNamespace(xml=file_input.read()))
+    # The constructor reads the configuration from the device, set what get_params uses instead
+    teraflex = object.__new__(TFlex)
+    teraflex.line_port = "1/1/n1"
+    teraflex._config = {"1/1/n1": {"line_port": "1/1/n1", "logical_interface": "ot400"}}
+    teraflex.conn = Replay({"dispatch": replies})
+    return teraflex.get_params
+
+
+def osa_get_trace(points):
+    from osa import OSA
+    from osa_emulator import VirtualOSA
+
+    virtual = VirtualOSA(seed=0)
+    # Not limited to the sampling points of the MS9710C, to see how decoding scales
+    virtual.points = points
+    replies = {
+        cmd: virtual.query(cmd) for cmd in ("DQA?", "STA?", "STO?", "MPT?", "ARED?")
+    }
+    osa = OSA(resource=RecordedOSA(replies))
+    return osa.get_trace
+
+
+def check_patch_owners():
+    from utils import check_patch_owners
+
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    connection.execute("CREATE TABLE ports_new (Name TEXT PRIMARY KEY, Owner TEXT)")
+    connection.executemany(
+        "INSERT INTO ports_new VALUES (?, ?)",
+        [("port_%d" % port, "") for port in range(1, 641)],
+    )
+    patches = [("port_%d" % port, "port_%d" % (port + 320)) for port in range(1, 21)]
+    connection = SqliteConnection(connection)
+    return lambda: check_patch_owners(patches, connection=connection)
+
+
+#: Setup of each benchmark, returning the function to time
+BENCHMARKS = {
+    "lumentum.wss_get_connections": wss_get_connections,
+    "monitor.record_monitor_data": record_monitor_data,
+    "lumentum.wss_add_connections[95]": lambda: wss_add_connections(95),
+    "lumentum.wss_add_connections[190]": lambda: wss_add_connections(190),
+    "polatis.getall": polatis_getall,
+    "polatis.getall[tcp]": lambda: polatis_getall(tcp=True),
+    "teraflex.get_params": teraflex_get_params,
+    "osa.get_trace[1001]": lambda: osa_get_trace(1001),
+    "osa.get_trace[5001]": lambda: osa_get_trace(5001),
+    "osa.get_trace[50001]": lambda: osa_get_trace(50001),
+    "utils.check_patch_owners": check_patch_owners,
+}
+
+
+def measure(name, repeat=BENCHMARK_REPEAT):
+    """Time a benchmark. The number of calls per sample is chosen like ``python -m timeit`` does, so that a sample takes at least 0.2 s.
+
+    :param name: Benchmark name, a key of ``BENCHMARKS``
+    :type name: str
+
+    :param repeat: Number of samples
+    :type repeat: int
+
+    :return: Median, minimum and maximum time per call in ms, and the number of calls per sample
+    :rtype: dict
+    """
+
+    # The drivers print progress, which would dominate the timings on a terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        function = BENCHMARKS[name]()
+        timer = timeit.Timer(function)
+        number, _ = timer.autorange()
+        samples = [1000.0 * t / number for t in timer.repeat(repeat, number)]
+    return {
+        "median_ms": statistics.median(samples),
+        "min_ms": min(samples),
+        "max_ms": max(samples),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def commit():
+    """Get the commit the repository is at, or None outside a git checkout."""
+
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument("--output", help="json file to write the results to")
+    parser.add_argument("--compare", help="json results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file_input:
+            baseline = json.load(file_input)["results"]
+
+    results = {}
+    regressions = []
+    for name in args.benchmarks:
+        results[name] = result = measure(name, args.repeat)
+        line = "%-36s %10.3f ms  (min %.3f, max %.3f)" % (
+            name,
+            result["median_ms"],
+            result["min_ms"],
+            result["max_ms"],
+        )
+        if name in baseline:
+            ratio = result["median_ms"] / baseline[name]["median_ms"]
+            line += "  %5.2fx" % ratio
+            if ratio > 1.0 + args.tolerance:
+                line += "  SLOWER"
+                regressions.append(name)
+        print(line)
+
+    if args.output:
+        report = {
+            "commit": commit(),
+            "time": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }
+        with open(args.output, "w") as file_output:
+            json.dump(report, file_output, indent=4)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
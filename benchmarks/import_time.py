@@ -0,0 +1,129 @@
+"""Import-time benchmark for the tcdona3 modules.
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter for each module, several times, and reports the median cumulative import time of the module itself. Short CLI invocations should only pay for what they use, so every module is checked against a startup budget.
+
+Usage, from the repository root::
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py monitor utils --target 100 --repeat 7
+
+The exit status is 1 when any module exceeds its target.
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TIME_TARGET = 150.0  # ms, budget for importing a module of the package
+IMPORT_TIME_REPEAT = 5
+
+#: Modules imported by short CLI invocations. Per-module budgets override IMPORT_TIME_TARGET.
+IMPORT_TIME_MODULES = {
+    "utils": 50.0,
+    "monitor": None,
+    "lumentum": None,
+    "polatis": None,
+    "ila": None,
+    "osa": None,
+    "cassini": None,
+    "teraflex": None,
+    "quadflex": None,
+}
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(stderr, module):
+    """Parse the ``-X importtime`` output of an interpreter.
+
+    :param stderr: Standard error of the interpreter
+    :type stderr: str
+
+    :param module: Module imported by the interpreter
+    :type module: str
+
+    :return: Cumulative import time of the module in ms, and the cumulative import times in ms of its direct dependencies keyed by module name
+    :rtype: tuple
+    """
+
+    dependencies = {}
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        # Imports are printed after their own dependencies, indented by two spaces per level
+        depth = (len(match.group(3)) - 1) // 2
+        name, cumulative = match.group(4), int(match.group(2)) / 1000.0
+        if depth == 0:
+            if name == module:
+                return cumulative, dependencies
+            dependencies = {}
+        elif depth == 1:
+            dependencies[name] = cumulative
+    raise ValueError("%s not found in the -X importtime output" % module)
+
+
+def measure(module, repeat=IMPORT_TIME_REPEAT):
+    """Measure the import time of a module in fresh interpreters.
+
+    :param module: Module name
+    :type module: str
+
+    :param repeat: Number of interpreters to start
+    :type repeat: int
+
+    :return: Median cumulative import time in ms, and the three slowest direct dependencies of the module in the last run
+    :rtype: tuple
+    """
+
+    samples = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError("Importing %s failed:\n%s" % (module, proc.stderr))
+        samples.append(parse_importtime(proc.stderr, module))
+
+    total = statistics.median(sample[0] for sample in samples)
+    dependencies = sorted(samples[-1][1].items(), key=lambda item: -item[1])
+    return total, dependencies[:3]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=list(IMPORT_TIME_MODULES))
+    parser.add_argument("--target", type=float, default=IMPORT_TIME_TARGET)
+    parser.add_argument("--repeat", type=int, default=IMPORT_TIME_REPEAT)
+    args = parser.parse_args(argv)
+
+    failed = []
+    for module in args.modules:
+        target = IMPORT_TIME_MODULES.get(module) or args.target
+        total, dependencies = measure(module, args.repeat)
+        status = "ok" if total <= target else "SLOW"
+        if status != "ok":
+            failed.append(module)
+        print(
+            "%-10s %8.1f ms  (target %6.1f ms)  %-4s  %s"
+            % (
+                module,
+                total,
+                target,
+                status,
+                ", ".join("%s %.1f ms" % item for item in dependencies),
+            )
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+import os
+import re
+import json
+import time
+import hashlib
+from datetime import datetime
+from graphlib import TopologicalSorter
+from concurrent.futures import ThreadPoolExecutor
+
+CAMPAIGN_SETTLE_TIMEOUT = 60.0  # s
+CAMPAIGN_POLL_INTERVAL = 0.1  # s, first delay between two settle polls
+CAMPAIGN_POLL_MAX_INTERVAL = 5.0  # s
+#: Placeholder of a point parameter in a string argument, with an optional format spec
+CAMPAIGN_PLACEHOLDER = re.compile(r"\{(\w+)(?::([^{}]*))?\}")
+
+
+class Stable:
+
+    """Settle condition that holds once two successive readings of a device differ by at most a tolerance, e.g. ``Stable(lambda roadm: roadm.get_mux_edfa_output_power(), 0.1)``.
+
+    :param read: Function reading a number, or a list of numbers, from the device
+    :type read: callable
+
+    :param tolerance: Largest difference between two successive readings
+    :type tolerance: float
+    """
+
+    def __init__(self, read, tolerance):
+
+        self.read = read
+        self.tolerance = tolerance
+        self.last = None
+
+    def reset(self):
+        """Forget the previous reading, called at the start of every wait."""
+
+        self.last = None
+
+    def __call__(self, device):
+        value = self.read(device)
+        values = value if isinstance(value, (list, tuple)) else [value]
+        last, self.last = self.last, values
+        if last is None or len(last) != len(values):
+            return False
+        return all(
+            abs(float(a) - float(b)) <= self.tolerance for a, b in zip(last, values)
+        )
+
+
+class Campaign:
+
+    """Run a declarative measurement sweep over the testbed devices. For every point of the sweep, the write steps are run in dependency order, the devices they changed are waited on until their settle condition holds, and the read steps are run concurrently, one thread per device. Progress is appended to a checkpoint file after every point, so an interrupted campaign resumes with the first point not yet completed.
+
+    A plan is a dictionary::
+
+        {
+            "points": [{"atten": 3.0}, {"atten": 6.0}],
+            "writes": [
+                {"name": "grid", "device": "roadm", "call": "make_grid", "args": [...]},
+                {"name": "atten", "device": "roadm", "call": "set_mux_atten",
+                 "kwargs": {"connection_id": 1, "atten": "{atten}"}, "after": ["grid"]},
+                {"name": "tf", "device": "tf", "call": "change_configuration", "kwargs": {...}},
+            ],
+            "reads": [
+                {"name": "roadm", "device": "roadm_monitor", "call": "write_json_data",
+                 "kwargs": {"measurement_label": "atten {atten}", "get_only": True}},
+                {"name": "osa", "device": "osa_monitor", "call": "get_component_info"},
+                {"name": "pm", "device": "tf", "call": "read_pm_data"},
+            ],
+        }
+
+    In arguments that are strings, placeholders naming a parameter of the point, such as ``"{atten}"`` or ``"{atten:.1f}"``, are replaced by its formatted value, and other braces are kept as they are; a string that is a single placeholder without format spec is replaced by the parameter itself, keeping its type. A write with ``"settle": False`` does not make its device wait. Writes only run again for a point when their formatted arguments differ from the previous point.
+
+    :param devices: Device objects keyed by the device names used in the plan
+    :type devices: dict
+
+    :param plan: Sweep plan
+    :type plan: dict
+
+    :param settle: Settle conditions keyed by device name. Each condition is called with the device object and returns True once the device has settled. Devices without a condition do not wait.
+    :type settle: dict
+
+    :param checkpoint: Path of the checkpoint file, in json lines: the hash of the points of the plan, then one line per completed point. No checkpoint is written by default
+    :type checkpoint: str
+
+    :param settle_timeout: Maximum time to wait for a device to settle in seconds
+    :type settle_timeout: float
+
+    :raises ValueError: If a step names an unknown device or step, or the write dependencies contain a cycle
+    """
+
+    def __init__(
+        self,
+        devices,
+        plan,
+        settle=None,
+        checkpoint=None,
+        settle_timeout=CAMPAIGN_SETTLE_TIMEOUT,
+    ):
+
+        self.devices = devices
+        self.points = plan.get("points") or [{}]
+        self.writes = {step["name"]: step for step in plan.get("writes", [])}
+        self.reads = plan.get("reads", [])
+        self.settle = settle or {}
+        self.checkpoint = checkpoint
+        self.settle_timeout = settle_timeout
+
+        for step in list(self.writes.values()) + self.reads:
+            if step["device"] not in devices:
+                raise ValueError(
+                    "Step %s uses unknown device %s" % (step["name"], step["device"])
+                )
+        graph = {}
+        for name, step in self.writes.items():
+            for dependency in step.get("after", []):
+                if dependency not in self.writes:
+                    raise ValueError(
+                        "Step %s runs after unknown step %s" % (name, dependency)
+                    )
+            graph[name] = step.get("after", [])
+        # graphlib.CycleError is a ValueError
+        self.write_order = list(TopologicalSorter(graph).static_order())
+
+        self.completed = []
+        self.applied = {}
+
+    def run(self):
+        """Run the points of the plan not completed yet.
+
+        :return: One entry per point with the point index, its parameters, the time and the results of the reads keyed by step name
+        :rtype: list
+        """
+
+        self.__load_checkpoint()
+        done = {entry["point"] for entry in self.completed}
+        for point, params in enumerate(self.points):
+            if point in done:
+                continue
+            print("Campaign point %d/%d: %s" % (point + 1, len(self.points), params))
+            changed = self.apply(params)
+            self.wait_settled(changed)
+            results = self.measure(params)
+            self.completed.append(
+                {
+                    "point": point,
+                    "params": params,
+                    "time": str(datetime.now()),
+                    "results": results,
+                }
+            )
+            self.__save_checkpoint(self.completed[-1])
+        return self.completed
+
+    def apply(self, params):
+        """Run the write steps for a point in dependency order.
+
+        :param params: Parameters of the point
+        :type params: dict
+
+        :return: Names of the devices to wait on
+        :rtype: set
+        """
+
+        changed = set()
+        for name in self.write_order:
+            step = self.writes[name]
+            args, kwargs = self.__arguments(step, params)
+            # Skip writes whose arguments are the same as for the previous point
+            if self.applied.get(name) == (args, kwargs):
+                continue
+            getattr(self.devices[step["device"]], step["call"])(*args, **kwargs)
+            self.applied[name] = (args, kwargs)
+            if step.get("settle", True):
+                changed.add(step["device"])
+        return changed
+
+    def wait_settled(self, devices):
+        """Wait concurrently until the settle condition of each device holds.
+
+        :param devices: Names of the devices
+        :type devices: set
+
+        :raises TimeoutError: If a device does not settle within the settle timeout
+        """
+
+        waiting = [device for device in devices if device in self.settle]
+        if not waiting:
+            return
+        with ThreadPoolExecutor(len(waiting)) as executor:
+            for future in [
+                executor.submit(self.__wait_device, device) for device in waiting
+            ]:
+                future.result()
+
+    def __wait_device(self, name):
+        condition = self.settle[name]
+        if hasattr(condition, "reset"):
+            condition.reset()
+        deadline = time.monotonic() + self.settle_timeout
+        interval = CAMPAIGN_POLL_INTERVAL
+        while not condition(self.devices[name]):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(
+                    "%s did not settle in %s s" % (name, self.settle_timeout)
+                )
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, CAMPAIGN_POLL_MAX_INTERVAL)
+
+    def measure(self, params):
+        """Run the read steps for a point. Reads on different devices run concurrently, reads on the same device run one after another in plan order.
+
+        :param params: Parameters of the point
+        :type params: dict
+
+        :return: Results of the reads keyed by step name
+        :rtype: dict
+        """
+
+        by_device = {}
+        for step in self.reads:
+            by_device.setdefault(step["device"], []).append(step)
+        if not by_device:
+            return {}
+
+        def read_device(steps):
+            results = {}
+            for step in steps:
+                args, kwargs = self.__arguments(step, params)
+                device = self.devices[step["device"]]
+                results[step["name"]] = getattr(device, step["call"])(*args, **kwargs)
+            return results
+
+        results = {}
+        with ThreadPoolExecutor(len(by_device)) as executor:
+            for future in [
+                executor.submit(read_device, steps) for steps in by_device.values()
+            ]:
+                results.update(future.result())
+        return {step["name"]: results[step["name"]] for step in self.reads}
+
+    def __arguments(self, step, params):
+        args = tuple(self.__format(value, params) for value in step.get("args", []))
+        kwargs = {
+            key: self.__format(value, params)
+            for key, value in step.get("kwargs", {}).items()
+        }
+        return args, kwargs
+
+    def __format(self, value, params):
+        if isinstance(value, str):
+            if value.startswith("{") and value.endswith("}") and value[1:-1] in params:
+                return params[value[1:-1]]
+            return CAMPAIGN_PLACEHOLDER.sub(
+                lambda match: (
+                    format(params[match.group(1)], match.group(2) or "")
+                    if match.group(1) in params
+                    else match.group(0)
+                ),
+                value,
+            )
+        elif isinstance(value, list):
+            return [self.__format(item, params) for item in value]
+        elif isinstance(value, dict):
+            return {key: self.__format(item, params) for key, item in value.items()}
+        return value
+
+    def __plan_hash(self):
+        points = json.dumps(self.points, sort_keys=True, default=str)
+        return hashlib.sha256(points.encode()).hexdigest()
+
+    def __load_checkpoint(self):
+        if self.checkpoint is None:
+            return
+        plan = self.__plan_hash()
+        if not os.path.exists(self.checkpoint):
+            with open(self.checkpoint, "w") as file_output:
+                file_output.write(json.dumps({"plan": plan}) + "\n")
+            return
+        completed = []
+        with open(self.checkpoint, "rb") as file_input:
+            try:
+                header = json.loads(file_input.readline())
+            except ValueError:
+                header = None
+            if not isinstance(header, dict) or header.get("plan") != plan:
+                raise ValueError(
+                    "Checkpoint %s belongs to a different plan" % self.checkpoint
+                )
+            end = file_input.tell()
+            for line in file_input:
+                # A line cut short by an interruption ends the checkpoint
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    completed.append(json.loads(line))
+                except ValueError:
+                    break
+                end = file_input.tell()
+        if end < os.path.getsize(self.checkpoint):
+            os.truncate(self.checkpoint, end)
+        self.completed = completed
+        print(
+            "Resuming campaign, %d of %d points already completed"
+            % (len(self.completed), len(self.points))
+        )
+
+    def __save_checkpoint(self, entry):
+        if self.checkpoint is None:
+            return
+        # Only the new point is written, an interruption leaves the previous ones intact
+        with open(self.checkpoint, "a") as file_output:
+            file_output.write(json.dumps(entry, default=str) + "\n")
@@ -1,7 +1,4 @@
-import pandas as pd
-import numpy as np
 import os
-from paramiko import *
 import re
 import sys
 import time
@@ -17,11 +14,14 @@ class Cassini:
 
     :param verbose: Print the output of the commands
     :type verbose: bool
+
+    :param client: Connected SSH client to use instead of connecting to the Cassini host, e.g. a :class:`cassini_emulator.CassiniEmulator`. The authorization check is skipped when given.
+    :type client: paramiko.SSHClient
     """
 
-    def __init__(self, cassini_num, verbose=True):
+    def __init__(self, cassini_num, verbose=True, client=None):
 
-        if not check_patch_owners([(cassini_num, cassini_num)]):
+        if client is None and not check_patch_owners([(cassini_num, cassini_num)]):
             raise Exception(
                 "You are not authorized to use this device! Please contact the administrator."
             )
@@ -35,10 +35,15 @@ class Cassini:
         elif cassini_num == "cassini_4":
             self.module = "/dev/piu7"
 
-        self.client = SSHClient()
-        # https://stackoverflow.com/questions/53635843/paramiko-ssh-failing-with-server-not-found-in-known-hosts-when-run-on-we
-        self.client.set_missing_host_key_policy(AutoAddPolicy())
-        self.client.connect("10.10.10.39", username="root", password="x1")
+        if client is not None:
+            self.client = client
+        else:
+            from paramiko import SSHClient, AutoAddPolicy
+
+            self.client = SSHClient()
+            # https://stackoverflow.com/questions/53635843/paramiko-ssh-failing-with-server-not-found-in-known-hosts-when-run-on-we
+            self.client.set_missing_host_key_policy(AutoAddPolicy())
+            self.client.connect("10.10.10.39", username="root", password="x1")
         command = "kubectl get pods"
         stdin, stdout, stderr = self.client.exec_command(command)
         lines = stdout.read().decode().split("\n")
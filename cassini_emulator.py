@@ -0,0 +1,348 @@
+import os
+import csv
+import time
+import random
+import shlex
+import threading
+
+EMULATOR_TAI_POD = "tai-657d7d4647-xhdnj"
+EMULATOR_MODULES = ("/dev/piu1", "/dev/piu3", "/dev/piu5", "/dev/piu7")
+EMULATOR_PROMPT = "root@cassini:~# "
+EMULATOR_ATTRIBUTES_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "cassini_attributes.csv"
+)
+
+#: Values of a module in service, the other attributes default to the first value of their type
+EMULATOR_VALUES = {
+    "tx-dis": "false",
+    "output-power": "0.000000",
+    "tx-laser-freq": "193700000000000",
+    "modulation-format": "dp-16-qam",
+    "differential-encoding": "false",
+    "dsp-oper-status": "ready",
+    "hd-fec-type": "hgfec",
+    "sd-fec-type": "on",
+    "mld": "4-lanes",
+    "tx-grid-spacing": "50-ghz",
+    "laser-grid-support": "50-ghz",
+    "ber-period": "1000000",
+    "current-output-power": "0.010000",
+    "current-input-power": "-9.870000",
+    "current-post-voa-total-power": "-9.870000",
+    "current-provisioned-channel-power": "-9.870000",
+    "current-post-voa-provisioned-channel-power": "-9.870000",
+    "current-pre-fec-ber": "0.001210",
+    "current-post-fec-ber": "0.000000",
+    "current-prbs-ber": "0.000000",
+    "current-ber-period": "1000000",
+    "current-snr": "17.530000",
+    "current-chromatic-dispersion": "12",
+    "current-differential-group-delay": "3",
+    "current-sd-fec-ber": "0.001210,0.001180",
+    "current-hd-fec-ber": "0.000000,0.000000",
+    "oper-status": "ready",
+    "min-laser-freq": "191150000000000",
+    "max-laser-freq": "196100000000000",
+    "current-tx-laser-freq": "193700000000000",
+    "custom-trb100-rx-power-low-warning-threshold": "-18.000000",
+    "custom-trb100-rx-power-low-alarm-threshold": "-20.000000",
+}
+#: Writable attributes whose value is also reported by a read-only attribute
+EMULATOR_REPORTED = {
+    "output-power": "current-output-power",
+    "tx-laser-freq": "current-tx-laser-freq",
+}
+
+
+def _default_value(kind):
+    if kind == "<bool>":
+        return "false"
+    elif kind == "<float>":
+        return "0.000000"
+    elif kind in ("<notification>", "<attribute-list>"):
+        return ""
+    elif kind in ("<pointer>", "<object-id>"):
+        return "oid:0x0"
+    elif kind.endswith("-list>") or kind.endswith("-range>"):
+        return "0,0"
+    elif kind.startswith("["):
+        # Enumerations list their values, flag sets without 'max' start empty
+        return kind[1:-1].split("|")[0] if "max" in kind else ""
+    return "0"
+
+
+class _File:
+
+    """File object of an emulated channel or command, as returned by ``makefile`` and ``exec_command``."""
+
+    def __init__(self, channel=None, data=b""):
+
+        self.channel = channel
+        self.data = data
+
+    def write(self, data):
+        self.channel.send(data)
+
+    def flush(self):
+        pass
+
+    def read(self):
+        return self.data
+
+    def close(self):
+        pass
+
+
+class CassiniChannel:
+
+    """Interactive shell of :class:`CassiniEmulator`, answering ``kubectl exec <pod> -- bash -c "echo topper; taish -c '...'"`` lines like the shell of the Cassini host. Like a paramiko channel, :meth:`recv` returns one chunk of output per call: the prompt, the echo of the command, 'topper' and the output of taish."""
+
+    def __init__(self, emulator):
+
+        self.emulator = emulator
+        self.output = [EMULATOR_PROMPT.encode()]
+        self.buffer = ""
+        self.condition = threading.Condition()
+        self.closed = False
+        self.timeout = None
+        # Command lines run one after another, like in a shell
+        self.running = threading.Lock()
+
+    def makefile(self, mode="r", bufsize=-1):
+        return _File(self)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def send(self, data):
+        """Write to the shell. Complete lines are run in the background.
+
+        :param data: Input
+        :type data: str or bytes
+
+        :return: Number of bytes sent
+        :rtype: int
+        """
+
+        if isinstance(data, bytes):
+            data = data.decode()
+        self.buffer += data
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.__push((line + "\r\n").encode())
+            threading.Thread(target=self.__run, args=(line,), daemon=True).start()
+        return len(data)
+
+    def recv(self, nbytes):
+        """Read the next chunk of output, waiting for it if needed.
+
+        :param nbytes: Maximum number of bytes
+        :type nbytes: int
+
+        :return: Output, empty once the channel is closed
+        :rtype: bytes
+
+        :raises TimeoutError: If no output arrives within the channel timeout
+        """
+
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.output or self.closed, self.timeout
+            ):
+                raise TimeoutError("No output from the emulated shell")
+            if not self.output:
+                return b""
+            chunk = self.output.pop(0)
+            if len(chunk) > nbytes:
+                chunk, rest = chunk[:nbytes], chunk[nbytes:]
+                self.output.insert(0, rest)
+            return chunk
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __push(self, chunk):
+        with self.condition:
+            self.output.append(chunk)
+            self.condition.notify_all()
+
+    def __run(self, line):
+        with self.running:
+            for chunk in self.emulator.shell(line):
+                self.__push(chunk.encode())
+            self.__push(EMULATOR_PROMPT.encode())
+
+
+class CassiniEmulator:
+
+    """In-process stand-in for the paramiko ``SSHClient`` connected to the Cassini host, to pass as ``Cassini(cassini_num, client=CassiniEmulator())``. It answers ``kubectl get pods`` with a tai pod, and ``kubectl exec`` of taish commands on the ``/dev/piu*`` modules through :meth:`exec_command` and :meth:`invoke_shell`. Each module serves the attributes of ``cassini_attributes.csv``; 'get' returns the value, 'set' changes the writable ones.
+
+    Every taish invocation takes ``latency`` seconds, plus ``command_latency`` for each command it runs, so opening a shell per attribute costs what it costs on the host. ``shell_count`` and ``command_count`` count the shells opened and taish commands run.
+
+    :param latency: Delay of every ``kubectl exec`` in seconds
+    :type latency: float
+
+    :param command_latency: Delay of every taish command in seconds
+    :type command_latency: float
+
+    :param jitter: Maximum random delay added to every ``kubectl exec`` in seconds
+    :type jitter: float
+
+    :param values: Attribute values overriding the defaults, the same for every module
+    :type values: dict
+
+    :param seed: Seed of the latency jitter
+    :type seed: int
+    """
+
+    def __init__(
+        self, latency=0.0, command_latency=0.0, jitter=0.0, values=None, seed=None
+    ):
+
+        self.latency = latency
+        self.command_latency = command_latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.writable = {}
+        defaults = {}
+        with open(EMULATOR_ATTRIBUTES_FILE) as file_input:
+            for row in csv.DictReader(file_input):
+                defaults[row["Name"]] = EMULATOR_VALUES.get(
+                    row["Name"], _default_value(row["Value"])
+                )
+                self.writable[row["Name"]] = row["Type"] == "r/w"
+        defaults.update(values or {})
+        self.modules = {module: dict(defaults) for module in EMULATOR_MODULES}
+        self.shell_count = 0
+        self.command_count = 0
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, hostname, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+    def invoke_shell(self, **kwargs):
+        """Open an interactive shell.
+
+        :return: Shell channel
+        :rtype: CassiniChannel
+        """
+
+        with self.lock:
+            self.shell_count += 1
+        return CassiniChannel(self)
+
+    def exec_command(self, command, **kwargs):
+        """Run a command without a shell.
+
+        :param command: Command line
+        :type command: str
+
+        :return: stdin, stdout and stderr of the command
+        :rtype: tuple
+        """
+
+        output = "".join(self.shell(command))
+        return _File(), _File(data=output.encode()), _File()
+
+    def shell(self, line):
+        """Run a command line of the host.
+
+        :param line: Command line
+        :type line: str
+
+        :return: Chunks of output
+        :rtype: list
+        """
+
+        words = shlex.split(line)
+        if words[:3] == ["kubectl", "get", "pods"]:
+            return [
+                "NAME                   READY   STATUS    RESTARTS   AGE\n"
+                "%s   1/1     Running   0          12d\n" % EMULATOR_TAI_POD
+            ]
+        if words[:2] != ["kubectl", "exec"] or "--" not in words:
+            return ["bash: %s: command not found\r\n" % (words[0] if words else "")]
+        if words[2] != EMULATOR_TAI_POD:
+            return ['Error from server (NotFound): pods "%s" not found\r\n' % words[2]]
+
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        chunks = []
+        script = words[words.index("--") + 1 :]
+        if script[:2] == ["bash", "-c"] and len(script) > 2:
+            for statement in self.__statements(script[2]):
+                if statement[0] == "echo":
+                    chunks.append(" ".join(statement[1:]) + "\r\n")
+                elif statement[:2] == ["taish", "-c"]:
+                    count, output = self.taish(statement[2:])
+                    delay += self.command_latency * count
+                    chunks.append(output)
+        time.sleep(delay)
+        return chunks
+
+    def __statements(self, script):
+        # Split a bash script on the semicolons outside quotes
+        lexer = shlex.shlex(script, posix=True, punctuation_chars=";")
+        lexer.whitespace_split = True
+        statements = [[]]
+        for token in lexer:
+            if token == ";":
+                statements.append([])
+            else:
+                statements[-1].append(token)
+        return [statement for statement in statements if statement]
+
+    def taish(self, args):
+        """Run ``taish -c '<commands>'``.
+
+        :param args: Arguments after ``-c``
+        :type args: list
+
+        :return: Number of commands run and their output
+        :rtype: tuple
+        """
+
+        module = None
+        lines = []
+        count = 0
+        for command in " ".join(args).split(";"):
+            words = command.split()
+            if not words:
+                continue
+            count += 1
+            if words[0] == "module" and len(words) > 1:
+                module = self.modules.get(words[1])
+                if module is None:
+                    lines.append("module %s not found" % words[1])
+            elif words[0] == "netif":
+                continue
+            elif module is None:
+                lines.append("no module selected")
+            elif words[0] == "get" and len(words) > 1:
+                with self.lock:
+                    value = module.get(words[1])
+                lines.append(
+                    value if value is not None else "unknown attribute: %s" % words[1]
+                )
+            elif words[0] == "set" and len(words) > 2:
+                if not self.writable.get(words[1]):
+                    lines.append("failed to set attribute: %s" % words[1])
+                    continue
+                with self.lock:
+                    module[words[1]] = words[2]
+                    if words[1] in EMULATOR_REPORTED:
+                        module[EMULATOR_REPORTED[words[1]]] = words[2]
+            else:
+                lines.append("unknown command: %s" % words[0])
+        with self.lock:
+            self.command_count += count
+        return count, "".join(line + "\r\n" for line in lines)
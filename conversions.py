@@ -0,0 +1,127 @@
+import numpy as np
+
+NO_LIGHT_DBM = -99.99  # dBm, reported for dark ports and for powers that are not positive
+NO_LIGHT_DB = -99.99  # dB, reported for ratios that are not positive
+
+
+def _result(value, result):
+    # Scalars give floats, lists and arrays give arrays
+    return float(result) if np.ndim(value) == 0 else result
+
+
+def _log(linear, floor):
+    # 10 log10 of the positive values, and the floor for the others, without warnings
+    linear = np.asarray(linear, dtype=np.float64)
+    result = np.full(linear.shape, float(floor))
+    positive = linear > 0
+    np.log10(linear, out=result, where=positive)
+    return np.where(positive, 10.0 * result, floor)
+
+
+def db_to_linear(db):
+    """Convert decibels to linear ratios.
+
+    :param db: Value in dB
+    :type db: float or list or numpy.ndarray
+
+    :return: Linear ratio, a float for a scalar and an array otherwise
+    :rtype: float or numpy.ndarray
+    """
+
+    return _result(db, 10.0 ** (np.asarray(db, dtype=np.float64) / 10.0))
+
+
+def linear_to_db(linear, floor=NO_LIGHT_DB):
+    """Convert linear ratios to decibels. Ratios that are not positive give the floor.
+
+    :param linear: Linear ratio
+    :type linear: float or list or numpy.ndarray
+
+    :param floor: Value in dB returned for ratios that are not positive
+    :type floor: float
+
+    :return: Value in dB, a float for a scalar and an array otherwise
+    :rtype: float or numpy.ndarray
+    """
+
+    return _result(linear, _log(linear, floor))
+
+
+def dbm_to_mw(dbm):
+    """Convert powers in dBm to mW.
+
+    :param dbm: Power in dBm
+    :type dbm: float or list or numpy.ndarray
+
+    :return: Power in mW, a float for a scalar and an array otherwise
+    :rtype: float or numpy.ndarray
+    """
+
+    return db_to_linear(dbm)
+
+
+def mw_to_dbm(mw, floor=NO_LIGHT_DBM):
+    """Convert powers in mW to dBm. Powers that are not positive give the floor.
+
+    :param mw: Power in mW
+    :type mw: float or list or numpy.ndarray
+
+    :param floor: Power in dBm returned for powers that are not positive
+    :type floor: float
+
+    :return: Power in dBm, a float for a scalar and an array otherwise
+    :rtype: float or numpy.ndarray
+    """
+
+    return _result(mw, _log(mw, floor))
+
+
+def dbm_to_w(dbm):
+    """Convert powers in dBm to W.
+
+    :param dbm: Power in dBm
+    :type dbm: float or list or numpy.ndarray
+
+    :return: Power in W, a float for a scalar and an array otherwise
+    :rtype: float or numpy.ndarray
+    """
+
+    return _result(dbm, 1e-3 * 10.0 ** (np.asarray(dbm, dtype=np.float64) / 10.0))
+
+
+def w_to_dbm(w, floor=NO_LIGHT_DBM):
+    """Convert powers in W to dBm. Powers that are not positive give the floor.
+
+    :param w: Power in W
+    :type w: float or list or numpy.ndarray
+
+    :param floor: Power in dBm returned for powers that are not positive
+    :type floor: float
+
+    :return: Power in dBm, a float for a scalar and an array otherwise
+    :rtype: float or numpy.ndarray
+    """
+
+    return _result(w, _log(np.asarray(w, dtype=np.float64) / 1e-3, floor))
+
+
+def total_power(dbm, axis=None, floor=NO_LIGHT_DBM):
+    """Total power of channel powers, summed in mW. Channels at or below the floor, such as the ``NO_LIGHT_DBM`` reported for dark ports, and NaN channels add nothing.
+
+    :param dbm: Channel powers in dBm, e.g. the 95 channels of an OCM reading
+    :type dbm: list or numpy.ndarray
+
+    :param axis: Axis to sum along, e.g. 1 for one total per row of a 2D array of readings. All the values by default
+    :type axis: int
+
+    :param floor: Power in dBm of dark channels, which add nothing, and of a total without light
+    :type floor: float
+
+    :return: Total power in dBm, a float when summing all the values and an array otherwise
+    :rtype: float or numpy.ndarray
+    """
+
+    dbm = np.asarray(dbm, dtype=np.float64)
+    lit = dbm > floor
+    mw = np.where(lit, 10.0 ** (np.where(lit, dbm, 0.0) / 10.0), 0.0)
+    return _result(np.sum(mw, axis=axis), _log(np.sum(mw, axis=axis), floor))
@@ -0,0 +1,192 @@
+import time
+import numpy as np
+from instrumentation import parse_xml
+from lumentum import LUMENTUM_MUX, LUMENTUM_DEMUX
+
+EQUALIZER_TOLERANCE = 0.5  # dB, largest channel error at convergence
+EQUALIZER_MAX_ITERATIONS = 10
+EQUALIZER_GAIN = 1.0  # fraction of the error corrected per iteration
+EQUALIZER_SETTLE = 1.0  # s, wait for the OCM after changing the attenuations
+EQUALIZER_MIN_ATTENUATION = 0.0  # dB
+EQUALIZER_MAX_ATTENUATION = 25.0  # dB
+EQUALIZER_STEP = 0.1  # dB, attenuation resolution of the WSS
+#: WSS module id and output port passed to ``Lumentum.wss_atten``
+EQUALIZER_WSS = {"mux": (LUMENTUM_MUX, 4101), "demux": (LUMENTUM_DEMUX, 5201)}
+
+
+class PowerEqualizer:
+
+    """Closed-loop per-channel power equalization of a Lumentum WSS. Every iteration reads the connections once, which gives the attenuation and the output power the OCM measures for each connection, computes the attenuation correction of every open connection against the target profile as one vector, and applies all the changed attenuations in a single bulk ``wss_atten`` edit-config. It stops when every channel is within the tolerance of its target, when no attenuation can change any more, or after ``max_iterations``, so a run costs at most two NETCONF round trips per iteration.
+
+    :param roadm: Lumentum ROADM
+    :type roadm: lumentum.Lumentum
+
+    :param wss_module: WSS to equalize, 'mux' or 'demux'
+    :type wss_module: str
+
+    :param tolerance: Largest error of a channel from its target at convergence in dB
+    :type tolerance: float
+
+    :param max_iterations: Maximum number of corrections
+    :type max_iterations: int
+
+    :param gain: Fraction of the error corrected at each iteration, lower than 1 to damp the loop
+    :type gain: float
+
+    :param settle: Time in seconds to wait after a correction before reading the OCM again
+    :type settle: float
+
+    :param min_attenuation: Lowest attenuation to set in dB
+    :type min_attenuation: float
+
+    :param max_attenuation: Highest attenuation to set in dB
+    :type max_attenuation: float
+    """
+
+    def __init__(
+        self,
+        roadm,
+        wss_module="mux",
+        tolerance=EQUALIZER_TOLERANCE,
+        max_iterations=EQUALIZER_MAX_ITERATIONS,
+        gain=EQUALIZER_GAIN,
+        settle=EQUALIZER_SETTLE,
+        min_attenuation=EQUALIZER_MIN_ATTENUATION,
+        max_attenuation=EQUALIZER_MAX_ATTENUATION,
+    ):
+
+        if wss_module not in EQUALIZER_WSS:
+            raise ValueError("Invalid wss_module (not 'mux' or 'demux').")
+        self.roadm = roadm
+        self.wss_module = wss_module
+        self.wss_id, self.output_port = EQUALIZER_WSS[wss_module]
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.gain = gain
+        self.settle = settle
+        self.min_attenuation = min_attenuation
+        self.max_attenuation = max_attenuation
+
+    def read(self):
+        """Read the open connections of the WSS in one get of the connections subtree.
+
+        :return: Connection numbers, centre frequencies in GHz, attenuations in dB and output powers in dBm of the open connections, as arrays
+        :rtype: tuple
+        """
+
+        command = """<filter>
+                  <connections xmlns="http://www.lumentum.com/lumentum-ote-connection">
+                  </connections></filter>"""
+        reply = self.roadm.m.get(command)
+        connections = (
+            parse_xml(reply.data_xml, force_list=("connection",))["data"]["connections"]
+            or {}
+        ).get("connection", [])
+
+        ids, centres, attenuations, powers = [], [], [], []
+        for connection in connections:
+            dn = dict(
+                item.split("=", 1)
+                for item in connection["dn"].split(";")
+                if "=" in item
+            )
+            state = connection["state"]
+            if int(dn["module"]) != self.wss_id or state["blocked"] != "false":
+                continue
+            if state["output-channel-attributes"]["valid-data"] != "true":
+                continue
+            ids.append(int(dn["connection"]))
+            centres.append((float(state["start-freq"]) + float(state["end-freq"])) / 2)
+            attenuations.append(float(state["attenuation"]))
+            powers.append(float(state["output-channel-attributes"]["power"]))
+        return (
+            np.array(ids, dtype=int),
+            np.array(centres),
+            np.array(attenuations),
+            np.array(powers),
+        )
+
+    def target_power(self, ids, centres, powers, target):
+        """Get the target power of each connection.
+
+        :param target: Target profile: None for the mean measured power, a power in dBm for all the channels, a dictionary of powers keyed by connection number, or a function of the centre frequencies in GHz returning the powers
+        :type target: float or dict or callable
+
+        :return: Target power of each connection in dBm, NaN for the connections to leave unchanged
+        :rtype: numpy.ndarray
+        """
+
+        if target is None:
+            return np.full(len(ids), powers.mean())
+        if callable(target):
+            return np.asarray(target(centres), dtype=float) * np.ones(len(ids))
+        if isinstance(target, dict):
+            return np.array([float(target.get(i, np.nan)) for i in ids])
+        return np.full(len(ids), float(target))
+
+    def run(self, target=None):
+        """Equalize the output power of the open connections.
+
+        :param target: Target profile, see :meth:`target_power`. With None, the channels are flattened to the mean power of the first reading
+        :type target: float or dict or callable
+
+        :return: Whether it converged, the number of corrections, the largest error in dB after each reading, and the final attenuation, power and error of each connection keyed by connection number
+        :rtype: dict
+
+        :raises ValueError: If the WSS has no open connection to equalize
+        """
+
+        ids, centres, attenuations, powers = self.read()
+        if not len(ids):
+            raise ValueError("No open %s connection to equalize." % self.wss_module)
+        profile = self.target_power(ids, centres, powers, target)
+        targets = dict(zip(ids.tolist(), profile.tolist()))
+
+        iterations = 0
+        history = []
+        converged = False
+        while True:
+            goal = np.array([targets.get(i, np.nan) for i in ids.tolist()])
+            error = np.nan_to_num(powers - goal)
+            worst = float(np.abs(error).max())
+            history.append(worst)
+            if worst <= self.tolerance:
+                converged = True
+                break
+            if iterations >= self.max_iterations:
+                break
+
+            # Attenuate the channels above their target, and the reverse
+            updated = np.clip(
+                np.round((attenuations + self.gain * error) / EQUALIZER_STEP)
+                * EQUALIZER_STEP,
+                self.min_attenuation,
+                self.max_attenuation,
+            )
+            changed = np.abs(updated - attenuations) > EQUALIZER_STEP / 2
+            if not changed.any():
+                # Every remaining error is below the step or against a limit
+                break
+            self.roadm.wss_atten(
+                self.wss_id,
+                self.output_port,
+                [
+                    (connection, "%.1f" % attenuation)
+                    for connection, attenuation in zip(
+                        ids[changed].tolist(), updated[changed].tolist()
+                    )
+                ],
+            )
+            iterations += 1
+            if self.settle:
+                time.sleep(self.settle)
+            ids, centres, attenuations, powers = self.read()
+
+        return {
+            "converged": converged,
+            "iterations": iterations,
+            "history": history,
+            "attenuation": dict(zip(ids.tolist(), attenuations.tolist())),
+            "power": dict(zip(ids.tolist(), powers.tolist())),
+            "error": dict(zip(ids.tolist(), error.tolist())),
+        }
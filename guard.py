@@ -0,0 +1,194 @@
+import time
+import threading
+from instrumentation import REGISTRY
+
+GUARD_MAX_WAITING = 16  # calls that may wait for a busy device, more are rejected
+GUARD_TIMEOUT = 120.0  # s, longest wait for a busy device
+
+
+class DeviceBusyError(RuntimeError):
+
+    """Raised when a call cannot get a device, because too many calls are already waiting for it or the wait timed out."""
+
+
+class DeviceGuard:
+
+    """Reentrant lock of a device with a bounded queue of waiting calls. The thread holding the guard has the device to itself: its calls to the device, and those of the driver methods it calls, go through, while the calls of other threads wait in turn. A thread can take the guard around several calls that must not be interleaved, e.g. an edit of the candidate datastore and its commit, with ``with guard:``. When ``max_waiting`` calls are already waiting, further calls are rejected at once with :class:`DeviceBusyError` rather than piling up. The time calls wait is recorded into the instrumentation registry under the 'guard' kind.
+
+    :param device: Device name
+    :type device: str
+
+    :param max_waiting: Largest number of calls waiting for the device
+    :type max_waiting: int
+
+    :param timeout: Longest wait for the device in seconds, None to wait forever
+    :type timeout: float
+    """
+
+    def __init__(self, device, max_waiting=GUARD_MAX_WAITING, timeout=GUARD_TIMEOUT):
+
+        self.device = device
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.owner = None
+        self.depth = 0
+        self.waiting = 0
+        self.counts = {"calls": 0, "waited": 0, "rejected": 0, "timed_out": 0}
+
+    def acquire(self, name=""):
+        """Take the device, waiting for the thread holding it if any.
+
+        :param name: Name of the operation in the metrics
+        :type name: str
+
+        :raises DeviceBusyError: If too many calls are waiting, or the wait times out
+        """
+
+        me = threading.get_ident()
+        with self.condition:
+            if self.owner == me:
+                self.depth += 1
+                return
+            self.counts["calls"] += 1
+            if self.owner is None:
+                self.owner = me
+                self.depth = 1
+                return
+            if self.waiting >= self.max_waiting:
+                self.counts["rejected"] += 1
+                raise DeviceBusyError(
+                    "%s is busy with %d calls waiting" % (self.device, self.waiting)
+                )
+            self.counts["waited"] += 1
+            self.waiting += 1
+            start = time.monotonic()
+            try:
+                free = self.condition.wait_for(lambda: self.owner is None, self.timeout)
+            finally:
+                self.waiting -= 1
+            if not free:
+                self.counts["timed_out"] += 1
+                raise DeviceBusyError(
+                    "%s was not released within %.1f s" % (self.device, self.timeout)
+                )
+            self.owner = me
+            self.depth = 1
+        REGISTRY.observe(
+            "wait_seconds", self.device, "guard", name, time.monotonic() - start
+        )
+
+    def release(self):
+        """Give the device back once the outermost hold of the thread ends.
+
+        :raises RuntimeError: If the calling thread does not hold the device
+        """
+
+        with self.condition:
+            if self.owner != threading.get_ident():
+                raise RuntimeError("%s is not held by this thread" % self.device)
+            self.depth -= 1
+            if not self.depth:
+                self.owner = None
+                self.condition.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def to_dict(self):
+        """Get the state and counters of the guard.
+
+        :return: Whether the device is held, the number of calls waiting, and counts of calls, calls that waited, rejected calls and timed out waits
+        :rtype: dict
+        """
+
+        with self.condition:
+            return dict(self.counts, held=self.owner is not None, waiting=self.waiting)
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def guard(device):
+    """Get the guard shared by all the users of a device, creating it on first use.
+
+    :param device: Device name
+    :type device: str
+
+    :return: Guard of the device
+    :rtype: DeviceGuard
+    """
+
+    with _guards_lock:
+        if device not in _guards:
+            _guards[device] = DeviceGuard(device)
+        return _guards[device]
+
+
+def guard_states():
+    """Get the state and counters of the guard of every device used so far.
+
+    :return: Guard states (see :meth:`DeviceGuard.to_dict`) keyed by device name
+    :rtype: dict
+    """
+
+    with _guards_lock:
+        guards = dict(_guards)
+    return {device: guards[device].to_dict() for device in sorted(guards)}
+
+
+class GuardedSession:
+
+    """Proxy of a device session making every call to the device under the :class:`DeviceGuard` of the device, so that the requests and replies of two threads never interleave on the session. Other attributes are those of the session.
+
+    :param session: Session of the device, e.g. an ncclient manager
+    :type session: ncclient.manager.Manager
+
+    :param device: Device name
+    :type device: str
+    """
+
+    def __init__(self, session, device):
+
+        object.__setattr__(self, "session", session)
+        object.__setattr__(self, "device", device)
+        object.__setattr__(self, "guard", guard(device))
+
+    def __getattr__(self, name):
+        attribute = getattr(self.session, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            self.guard.acquire(name)
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                self.guard.release()
+
+        return call
+
+    def __setattr__(self, name, value):
+        # Settings such as raise_mode belong to the session
+        setattr(self.session, name, value)
+
+
+def guarded(session, device):
+    """Wrap a device session to serialize the calls of all the threads using the device.
+
+    :param session: Session of the device
+    :type session: ncclient.manager.Manager
+
+    :param device: Device name
+    :type device: str
+
+    :return: Guarded session
+    :rtype: GuardedSession
+    """
+
+    return GuardedSession(session, device)
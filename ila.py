@@ -1,9 +1,48 @@
-from ncclient import manager
-import xmltodict
+from instrumentation import instrument, parse_xml, parse_etree
+from retry import retrying
+from guard import guard, guarded
 from utils import *
 
 user = "fslyne"
 password = "password"
+#: Id of the EVOA at the output of the amplifier of each direction
+ILA_EVOA_ID = {"ab": 1, "ba": 2}
+#: Positions in the ports list of the ports reported as 'ports1' and 'ports2' for each direction
+ILA_TELEMETRY_PORTS = {"ab": (1, 2), "ba": (0, 3)}
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _typed(text):
+    # Numbers of a leaf as floats, so a field keeps its type from one sample to the next, and booleans as bools
+    text = (text or "").strip()
+    if text in ("true", "false"):
+        return text == "true"
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def _flatten(element, record, prefix=""):
+    # Flatten the leaves of a subtree into record, naming them like ILAMonitor.iterate_dict
+    children = {}
+    for child in element:
+        children.setdefault(_local(child.tag), []).append(child)
+    for name, elements in children.items():
+        key = prefix + "-" + name if prefix else name
+        if len(elements) > 1:
+            record[key] = [
+                _flatten(child, {}) if len(child) else _typed(child.text)
+                for child in elements
+            ]
+        elif len(elements[0]):
+            _flatten(elements[0], record, key)
+        else:
+            record[key] = _typed(elements[0].text)
+    return record
 
 
 class ILA:
@@ -32,9 +71,25 @@ class ILA:
 
         if not check_patch_owners([(f"{device}_fwd", f"{device}_bck")]):
             raise Exception("You are not authorized to use this device")
-        self.m = manager.connect(
-            host=host, port=830, username=user, password=password, hostkey_verify=False
+        from ncclient import manager
+
+        self.m = retrying(
+            guarded(
+                instrument(
+                    manager.connect(
+                        host=host,
+                        port=830,
+                        username=user,
+                        password=password,
+                        hostkey_verify=False,
+                    ),
+                    device,
+                ),
+                device,
+            ),
+            device,
         )
+        self.guard = guard(device)
 
     def get_pm_xml(self):
         """Get the performance monitoring XML file from the device. The XML file dumps the current state, configuration, and performance metrics of the ILA. Additional data cleaning is required to extract the relevant information.
@@ -46,6 +101,93 @@ class ILA:
         xml_file = self.m.get().data_xml
         return xml_file
 
+    def get_telemetry(self):
+        """Get the measurements of the amplifiers of both directions with a single get of the subtrees they come from: the configuration and state of the amplifiers, the OSC monitors, the EVOAs, the ports and the operational state of the device. The reply is parsed straight into one flat record per direction, with the keys of :meth:`monitor.ILAMonitor.parse_measurement_v1`, e.g. 'target-gain', 'osc-...', 'evoa-attn-value', 'ports1-...', and numbers converted to floats and booleans to bools.
+
+        :return: Record of each direction, keyed by 'ab' and 'ba'
+        :rtype: dict
+        """
+
+        filter = """
+                <open-optical-device xmlns="http://org/openroadm/device">
+                <state><operational-state></operational-state></state>
+                <optical-amplifier><amplifiers><amplifier></amplifier></amplifiers></optical-amplifier>
+                <oscs><osc><osc-monitor></osc-monitor></osc></oscs>
+                <evoas></evoas>
+                <ports></ports>
+                </open-optical-device>
+                """
+        reply = self.m.get(filter=("subtree", filter))
+        device = next(
+            element
+            for element in parse_etree(reply.data_xml).iter()
+            if _local(element.tag) == "open-optical-device"
+        )
+
+        amplifiers = []
+        oscs = []
+        evoas = {}
+        ports = []
+        state = {}
+        for element in device:
+            name = _local(element.tag)
+            if name == "optical-amplifier":
+                amplifiers = [
+                    amplifier
+                    for amplifiers_element in element
+                    for amplifier in amplifiers_element
+                ]
+            elif name == "oscs":
+                oscs.extend(
+                    monitor
+                    for child in element
+                    if _local(child.tag) == "osc"
+                    for monitor in child
+                    if _local(monitor.tag) == "osc-monitor"
+                )
+            elif name == "evoas":
+                evoa_id = None
+                for child in element:
+                    if _local(child.tag) == "evoa-id":
+                        evoa_id = _typed(child.text)
+                    elif _local(child.tag) == "evoa":
+                        evoas[evoa_id if evoa_id is not None else len(evoas) + 1] = (
+                            child
+                        )
+            elif name == "ports":
+                ports.append(element)
+            elif name == "state":
+                _flatten(element, state)
+
+        telemetry = {}
+        for index, amp in enumerate(ILA_EVOA_ID):
+            record = {}
+            amplifier = next(
+                (
+                    amplifier
+                    for amplifier in amplifiers
+                    if any(
+                        _local(child.tag) == "name" and child.text == amp
+                        for child in amplifier
+                    )
+                ),
+                amplifiers[index] if index < len(amplifiers) else None,
+            )
+            if amplifier is not None:
+                for child in amplifier:
+                    if _local(child.tag) in ("config", "state"):
+                        _flatten(child, record)
+            if index < len(oscs):
+                _flatten(oscs[index], record, "osc")
+            if ILA_EVOA_ID[amp] in evoas:
+                _flatten(evoas[ILA_EVOA_ID[amp]], record, "evoa")
+            record.update(state)
+            for prefix, position in zip(("ports1", "ports2"), ILA_TELEMETRY_PORTS[amp]):
+                if position < len(ports):
+                    _flatten(ports[position], record, prefix)
+            telemetry[amp] = record
+        return telemetry
+
     def get_target_gain(self, amp):
         """Get the target gain of the amplifier.
 
@@ -72,7 +214,7 @@ class ILA:
             amp
         )
         config = self.m.get_config(source="running", filter=("subtree", filter))
-        config_details = xmltodict.parse(config.data_xml)
+        config_details = parse_xml(config.data_xml)
         target_gain = config_details["data"]["open-optical-device"][
             "optical-amplifier"
         ]["amplifiers"]["amplifier"]["config"]["target-gain"]
@@ -106,10 +248,12 @@ class ILA:
             amp,
             gain,
         )
-        reply = self.m.edit_config(rpc, target="candidate")
-        # print(reply)
-        reply = self.m.commit()
-        # print(reply)
+        # Keep the edit and its commit together
+        with self.guard:
+            reply = self.m.edit_config(rpc, target="candidate")
+            # print(reply)
+            reply = self.m.commit()
+            # print(reply)
 
     def get_amp_state(self, amp):
         """Get the state of the amplifier.
@@ -138,7 +282,7 @@ class ILA:
             amp
         )
         config = self.m.get_config(source="running", filter=("subtree", filter))
-        config_details = xmltodict.parse(config.data_xml)
+        config_details = parse_xml(config.data_xml)
         target_gain = config_details["data"]["open-optical-device"][
             "optical-amplifier"
         ]["amplifiers"]["amplifier"]["config"]["enabled"]
@@ -173,10 +317,12 @@ class ILA:
             amp,
             state,
         )
-        reply = self.m.edit_config(rpc, target="candidate")
-        # print(reply)
-        reply = self.m.commit()
-        # print(reply)
+        # Keep the edit and its commit together
+        with self.guard:
+            reply = self.m.edit_config(rpc, target="candidate")
+            # print(reply)
+            reply = self.m.commit()
+            # print(reply)
 
     # def get_amp_autolos(self, amp):
     #     filter = """
@@ -256,7 +402,7 @@ class ILA:
             num
         )
         config = self.m.get_config(source="running", filter=("subtree", filter))
-        config_details = xmltodict.parse(config.data_xml)
+        config_details = parse_xml(config.data_xml)
         target_gain = config_details["data"]["open-optical-device"]["evoas"]["evoa"][
             "attn-value"
         ]
@@ -293,7 +439,121 @@ class ILA:
             num,
             atten,
         )
-        reply = self.m.edit_config(rpc, target="candidate")
-        # print(reply)
-        reply = self.m.commit()
-        # print(reply)
+        # Keep the edit and its commit together
+        with self.guard:
+            reply = self.m.edit_config(rpc, target="candidate")
+            # print(reply)
+            reply = self.m.commit()
+            # print(reply)
+
+    def get_state(self):
+        """Get the target gain, state and EVOA attenuation of the amplifiers of both directions with a single get-config.
+
+        :return: For each direction ('ab' and 'ba'), a dictionary with the target gain in dB ('target_gain'), the state of the amplifier, 'true' or 'false' ('enabled'), and the attenuation of its EVOA in dB ('evoa_atten')
+        :rtype: dict
+        """
+
+        filter = """
+                <open-optical-device xmlns="http://org/openroadm/device">
+                <optical-amplifier>
+                <amplifiers>
+                <amplifier>
+                <name></name>
+                <config>
+                <target-gain></target-gain>
+                <enabled></enabled>
+                </config>
+                </amplifier>
+                </amplifiers>
+                </optical-amplifier>
+                <evoas>
+                <evoa-id></evoa-id>
+                <evoa>
+                <attn-value></attn-value>
+                </evoa>
+                </evoas>
+                </open-optical-device>
+                """
+        config = self.m.get_config(source="running", filter=("subtree", filter))
+        config_details = parse_xml(config.data_xml, force_list=("amplifier", "evoas"))[
+            "data"
+        ]["open-optical-device"]
+
+        evoa_atten = {
+            int(evoa["evoa-id"]): float(evoa["evoa"]["attn-value"])
+            for evoa in config_details["evoas"]
+        }
+        state = {}
+        for amplifier in config_details["optical-amplifier"]["amplifiers"]["amplifier"]:
+            amp = amplifier["name"]
+            state[amp] = {
+                "target_gain": float(amplifier["config"]["target-gain"]),
+                "enabled": str(amplifier["config"]["enabled"]),
+            }
+            if amp in ILA_EVOA_ID:
+                state[amp]["evoa_atten"] = evoa_atten.get(ILA_EVOA_ID[amp])
+        return state
+
+    def apply_state(self, state):
+        """Apply changes to the amplifiers of one or both directions with a single edit of the candidate datastore and a single commit. The candidate is discarded if the edit or the commit fails.
+
+        :param state: Changes keyed by direction ('ab' or 'ba'), each a dictionary with any of 'target_gain' in dB, 'enabled' ('true' or 'false') and 'evoa_atten' in dB, e.g. ``{"ab": {"target_gain": 18.0}, "ba": {"target_gain": 17.5, "evoa_atten": 3.0}}``
+        :type state: dict
+
+        :raises ValueError: If a direction or a setting is invalid.
+        """
+
+        amplifiers = ""
+        evoas = ""
+        for amp, changes in state.items():
+            if amp not in ILA_EVOA_ID:
+                raise ValueError("Invalid amp name, please enter ab or ba")
+            unknown = set(changes) - {"target_gain", "enabled", "evoa_atten"}
+            if unknown:
+                raise ValueError(
+                    "Invalid ILA settings: %s" % ", ".join(sorted(unknown))
+                )
+
+            config = ""
+            if "target_gain" in changes:
+                config += "<target-gain>%.1f</target-gain>" % changes["target_gain"]
+            if "enabled" in changes:
+                enabled = changes["enabled"]
+                if isinstance(enabled, bool):
+                    enabled = str(enabled).lower()
+                config += "<enabled>%s</enabled>" % enabled
+            if config:
+                amplifiers += (
+                    "<amplifier><name>%s</name><config>%s</config></amplifier>"
+                    % (amp, config)
+                )
+            if "evoa_atten" in changes:
+                evoas += (
+                    "<evoas><evoa-id>%d</evoa-id><evoa><attn-value>%.1f</attn-value></evoa></evoas>"
+                    % (ILA_EVOA_ID[amp], changes["evoa_atten"])
+                )
+
+        if not amplifiers and not evoas:
+            return
+        if amplifiers:
+            amplifiers = (
+                "<optical-amplifier><amplifiers>%s</amplifiers></optical-amplifier>"
+                % amplifiers
+            )
+        rpc = """
+            <nc:config xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">
+            <open-optical-device xmlns="http://org/openroadm/device">
+            %s%s
+            </open-optical-device>
+            </nc:config>
+            """ % (
+            amplifiers,
+            evoas,
+        )
+        with self.guard:
+            try:
+                self.m.edit_config(rpc, target="candidate")
+                self.m.commit()
+            except Exception:
+                self.m.discard_changes()
+                raise
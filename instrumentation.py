@@ -0,0 +1,422 @@
+import re
+import time
+import bisect
+import threading
+
+INSTRUMENTED_CALLS = ("get", "get_config", "edit_config", "dispatch", "commit")
+INSTRUMENTATION_PORT = 9464  # default port of the metrics endpoint
+INSTRUMENTATION_PREFIX = "tcdona3"
+#: Upper bounds of the histogram buckets of each metric
+INSTRUMENTATION_BUCKETS = {
+    "rpc_seconds": (
+        0.001,
+        0.0025,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+        30.0,
+    ),
+    "parse_seconds": (
+        0.0001,
+        0.00025,
+        0.0005,
+        0.001,
+        0.0025,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        1.0,
+    ),
+    "request_bytes": (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+    "reply_bytes": (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+    "attempts": (1, 2, 3, 5, 10, 20),
+    "retry_delay_seconds": (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    "wait_seconds": (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+}
+INSTRUMENTATION_HELP = {
+    "rpc_seconds": "Wall time of the NETCONF RPCs, from the request to the reply",
+    "parse_seconds": "Time spent parsing the replies into dictionaries",
+    "request_bytes": "Size of the NETCONF requests",
+    "reply_bytes": "Size of the NETCONF replies",
+    "attempts": "Attempts made by the calls under a retry policy, 0 when rejected by an open circuit breaker",
+    "retry_delay_seconds": "Delays waited before retrying a call",
+    "wait_seconds": "Time the calls waited for a device held by another thread",
+}
+
+# Tags that wrap the payload of a request rather than name it
+_WRAPPER_TAGS = ("config", "filter", "rpc")
+_TAG = re.compile(r"<\s*(?:[\w.-]+:)?([\w.-]+)[\s/>]")
+
+
+class Histogram:
+
+    """Distribution of the observed values of a metric over fixed buckets, like a Prometheus histogram.
+
+    :param buckets: Upper bounds of the buckets, in increasing order
+    :type buckets: tuple
+    """
+
+    def __init__(self, buckets):
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Add a value.
+
+        :param value: Observed value
+        :type value: float
+        """
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket holding it.
+
+        :param q: Quantile between 0 and 1
+        :type q: float
+
+        :return: Upper bound of the bucket, infinity for the overflow bucket, None without observations
+        :rtype: float
+        """
+
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self):
+        """Convert the histogram to a json serialisable dictionary.
+
+        :return: Count, sum, mean, median and 90th percentile estimates, and the count of each bucket keyed by its upper bound
+        :rtype: dict
+        """
+
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "buckets": dict(
+                zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)
+            ),
+        }
+
+
+class Registry:
+
+    """Histograms of the RPC metrics, per device, RPC kind and filter name."""
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.enabled = True
+        self.histograms = {}
+
+    def observe(self, metric, device, kind, name, value):
+        """Add a value to the histogram of a metric.
+
+        :param metric: Metric, a key of ``INSTRUMENTATION_BUCKETS``
+        :type metric: str
+
+        :param device: Device name
+        :type device: str
+
+        :param kind: RPC kind, e.g. 'get' or 'dispatch'
+        :type kind: str
+
+        :param name: Name of the filter, configuration or RPC, i.e. its first element
+        :type name: str
+
+        :param value: Observed value
+        :type value: float
+        """
+
+        key = (metric, device, kind, name)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(
+                    INSTRUMENTATION_BUCKETS[metric]
+                )
+            histogram.observe(value)
+
+    def reset(self):
+        """Drop all the observations."""
+
+        with self.lock:
+            self.histograms = {}
+
+    def snapshot(self, device=None):
+        """Get the histograms.
+
+        :param device: Only return the histograms of this device
+        :type device: str
+
+        :return: Histogram dictionaries (see :meth:`Histogram.to_dict`) keyed by device, RPC kind, name and metric
+        :rtype: dict
+        """
+
+        result = {}
+        with self.lock:
+            for (metric, dev, kind, name), histogram in sorted(self.histograms.items()):
+                if device is None or dev == device:
+                    result.setdefault(dev, {}).setdefault(kind, {}).setdefault(
+                        name, {}
+                    )[metric] = histogram.to_dict()
+        return result
+
+    def prometheus_text(self):
+        """Render the histograms in the Prometheus text exposition format.
+
+        :return: Metrics page
+        :rtype: str
+        """
+
+        lines = []
+        with self.lock:
+            items = sorted(self.histograms.items())
+            for metric in INSTRUMENTATION_BUCKETS:
+                family = "%s_%s" % (INSTRUMENTATION_PREFIX, metric)
+                lines.append("# HELP %s %s" % (family, INSTRUMENTATION_HELP[metric]))
+                lines.append("# TYPE %s histogram" % family)
+                for (name, device, kind, label), histogram in items:
+                    if name != metric:
+                        continue
+                    labels = 'device="%s",kind="%s",name="%s"' % (
+                        _escape(device),
+                        _escape(kind),
+                        _escape(label),
+                    )
+                    total = 0
+                    for bound, count in zip(
+                        [repr(float(b)) for b in histogram.buckets] + ["+Inf"],
+                        histogram.counts,
+                    ):
+                        total += count
+                        lines.append(
+                            '%s_bucket{%s,le="%s"} %d' % (family, labels, bound, total)
+                        )
+                    lines.append("%s_sum{%s} %r" % (family, labels, histogram.sum))
+                    lines.append("%s_count{%s} %d" % (family, labels, histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+#: Registry the drivers record into
+REGISTRY = Registry()
+
+# Last RPC of each thread, to which the parse time of its reply is attributed
+_last_rpc = threading.local()
+
+
+def _payload(value):
+    # Serialized request and its size: strings are used as they are, elements are serialized
+    if value is None:
+        return ""
+    if isinstance(value, tuple):
+        return "".join(_payload(item) for item in value[1:])
+    if isinstance(value, bytes):
+        return value.decode(errors="replace")
+    if isinstance(value, str):
+        return value
+    from lxml import etree
+
+    return etree.tostring(value, encoding="unicode")
+
+
+def _name(payload):
+    # The first element that is not a wrapper names the request
+    for match in _TAG.finditer(payload):
+        if match.group(1) not in _WRAPPER_TAGS:
+            return match.group(1)
+    return ""
+
+
+class InstrumentedSession:
+
+    """Proxy of a NETCONF session recording, for every ``get``, ``get_config``, ``edit_config``, ``dispatch`` and ``commit``, the wall time and the request and reply sizes into a :class:`Registry`, per device, RPC kind and name of the filter, configuration or RPC. Other attributes are those of the session.
+
+    :param session: NETCONF session, e.g. an ncclient manager
+    :type session: ncclient.manager.Manager
+
+    :param device: Device name the metrics are recorded under
+    :type device: str
+
+    :param registry: Registry to record into
+    :type registry: Registry
+    """
+
+    def __init__(self, session, device, registry=REGISTRY):
+
+        object.__setattr__(self, "session", session)
+        object.__setattr__(self, "device", device)
+        object.__setattr__(self, "registry", registry)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.session, name)
+        if name not in INSTRUMENTED_CALLS:
+            return attribute
+
+        def call(*args, **kwargs):
+            if not self.registry.enabled:
+                return attribute(*args, **kwargs)
+            request = args[0] if args else None
+            for key in ("filter", "config", "rpc_command"):
+                request = kwargs.get(key, request)
+            payload = _payload(request)
+            label = _name(payload)
+            start = time.perf_counter()
+            reply = attribute(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            reply_xml = getattr(reply, "xml", None)
+            if reply_xml is None:
+                reply_xml = str(reply)
+            self.registry.observe("rpc_seconds", self.device, name, label, elapsed)
+            self.registry.observe(
+                "request_bytes", self.device, name, label, len(payload)
+            )
+            self.registry.observe(
+                "reply_bytes", self.device, name, label, len(reply_xml)
+            )
+            _last_rpc.key = (self.device, name, label)
+            return reply
+
+        return call
+
+    def __setattr__(self, name, value):
+        # Settings such as raise_mode belong to the session
+        setattr(self.session, name, value)
+
+
+def instrument(session, device, registry=REGISTRY):
+    """Wrap a NETCONF session to record its RPC metrics.
+
+    :param session: NETCONF session
+    :type session: ncclient.manager.Manager
+
+    :param device: Device name the metrics are recorded under
+    :type device: str
+
+    :param registry: Registry to record into
+    :type registry: Registry
+
+    :return: Instrumented session
+    :rtype: InstrumentedSession
+    """
+
+    return InstrumentedSession(session, device, registry)
+
+
+def parse_xml(xml, registry=REGISTRY, **kwargs):
+    """Parse an XML reply with ``xmltodict.parse``, recording the parse time against the last RPC made by the calling thread.
+
+    :param xml: XML document
+    :type xml: str
+
+    :param registry: Registry to record into
+    :type registry: Registry
+
+    :return: Parsed document
+    :rtype: dict
+    """
+    import xmltodict
+
+    if not registry.enabled:
+        return xmltodict.parse(xml, **kwargs)
+    start = time.perf_counter()
+    result = xmltodict.parse(xml, **kwargs)
+    elapsed = time.perf_counter() - start
+    device, kind, name = getattr(_last_rpc, "key", ("", "", ""))
+    registry.observe("parse_seconds", device, kind, name, elapsed)
+    return result
+
+
+def parse_etree(xml, registry=REGISTRY):
+    """Parse an XML reply into an ElementTree element, recording the parse time against the last RPC made by the calling thread.
+
+    :param xml: XML document
+    :type xml: str
+
+    :param registry: Registry to record into
+    :type registry: Registry
+
+    :return: Root element
+    :rtype: xml.etree.ElementTree.Element
+    """
+    from xml.etree import ElementTree
+
+    if not registry.enabled:
+        return ElementTree.fromstring(xml)
+    start = time.perf_counter()
+    result = ElementTree.fromstring(xml)
+    elapsed = time.perf_counter() - start
+    device, kind, name = getattr(_last_rpc, "key", ("", "", ""))
+    registry.observe("parse_seconds", device, kind, name, elapsed)
+    return result
+
+
+def start_http_server(
+    port=INSTRUMENTATION_PORT, address="127.0.0.1", registry=REGISTRY
+):
+    """Serve the metrics in the Prometheus text format at ``/metrics`` from a background thread.
+
+    :param port: TCP port, 0 picks a free port
+    :type port: int
+
+    :param address: Address to listen on
+    :type address: str
+
+    :param registry: Registry to serve
+    :type registry: Registry
+
+    :return: HTTP server, ``server.server_address`` holds the bound address and ``server.shutdown()`` stops it
+    :rtype: http.server.ThreadingHTTPServer
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    return server
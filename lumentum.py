@@ -1,8 +1,8 @@
 import time
 
-import xmltodict
-from ncclient import manager
-from ncclient.xml_ import to_ele
+from instrumentation import instrument, parse_xml
+from retry import retrying
+from guard import guard, guarded
 from utils import *
 import pprint
 
@@ -23,8 +23,12 @@ LUMENTUM_CHANNEL_SHORT = range(4, LUMENTUM_CHANNEL_QUANTITY + 1, 4)
 LUMENTUM_POWER_READING_LOWER_LIMIT = -30
 LUMENTUM_MAX_CHANNEL_POWER_READING_TRIES = 10
 LUMENTUM_CHACEL_OA_LOSS = 13
+LUMENTUM_EDFA_SETTLE_TIMEOUT = 10.0  # s, maximum wait for an EDFA configuration step
+LUMENTUM_EDFA_POLL_INTERVAL = 0.1  # s
+LUMENTUM_EDFA_SETTLE_TOLERANCE = 0.1  # dB, output power change between two polls of a settled EDFA
 LUMENTUM_WSS_CHANNEL_FREQ_CENTER_LIST = [
-    191350.0 + idx * 50.0 for idx in range(LUMENTUM_CHANNEL_QUANTITY)
+    FIRST_CENTRAL_FREQ + idx * CHANNEL_SPACING
+    for idx in range(LUMENTUM_CHANNEL_QUANTITY)
 ]
 
 ip_map = {
@@ -42,29 +46,51 @@ ip_map = {
 }
 
 
+def _same_leaf_value(value, expected):
+    # Compare a configuration leaf read back from the ROADM, numbers by value
+    if value is None:
+        return False
+    try:
+        return abs(float(value) - float(expected)) < 1e-6
+    except ValueError:
+        return str(value) == str(expected)
+
+
 class Lumentum(object):
     """
     A class used to interact with Lumentum ROADMs. The class provides methods to configure EDFA, WSS, and flex-grid connections. It also checks if the user is authorized to use the device. If the user is not authorized, it raises an Exception and does not connect to the device.
 
     :param roadm_name: The name of the roadm (e.g. roadm_1, roadm_2, etc.)
     :type roadm_name: str
+
+    :param session: An already open NETCONF session to use instead of connecting to the ROADM, such as a :class:`lumentum_emulator.LumentumEmulator`. The authorization check is skipped.
+    :type session: object
     """
 
-    def __init__(self, roadm_name, DEBUG=False):
+    def __init__(self, roadm_name, DEBUG=False, session=None):
 
         if roadm_name not in ip_map:
             raise ValueError("Invalid roadm_name")
 
-        if not check_patch_owners([(roadm_name + "_p1", roadm_name + "_line")]):
-            raise Exception("You are not authorized to use this device")
+        if session is not None:
+            self.m = session
+        else:
+            if not check_patch_owners([(roadm_name + "_p1", roadm_name + "_line")]):
+                raise Exception("You are not authorized to use this device")
 
-        self.m = manager.connect(
-            host=ip_map[roadm_name],
-            port=830,
-            username=LUMENTUM_USERNAME,
-            password=LUMENTUM_PASSWORD,
-            hostkey_verify=False,
+            from ncclient import manager
+
+            self.m = manager.connect(
+                host=ip_map[roadm_name],
+                port=830,
+                username=LUMENTUM_USERNAME,
+                password=LUMENTUM_PASSWORD,
+                hostkey_verify=False,
+            )
+        self.m = retrying(
+            guarded(instrument(self.m, roadm_name), roadm_name), roadm_name
         )
+        self.guard = guard(roadm_name)
         self.device_name = roadm_name
         self.DEBUG = DEBUG
         if self.DEBUG:
@@ -123,7 +149,7 @@ class Lumentum(object):
 
         try:
             edfa_data = self.m.get(command)
-            edfa_info_raw = xmltodict.parse(edfa_data.data_xml)["data"]["edfas"]["edfa"]
+            edfa_info_raw = parse_xml(edfa_data.data_xml)["data"]["edfas"]["edfa"]
 
             # Append booster EDFA info
             self.edfa_info["booster"]["control_mode"] = str(
@@ -194,7 +220,96 @@ class Lumentum(object):
         except Exception as e:
             print("Encountered the following RPC error!")
             print(e)
-            exit(0)
+            raise
+
+    def __edfa_state(self, target_module_id):
+        # Read the configuration and the operational state of one EDFA module
+        command = """<filter><edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" 
+                  xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa">
+                  <edfa><dn>ne=1;chassis=1;card=1;edfa=%s</dn></edfa>
+                  </edfas></filter>""" % target_module_id
+        edfa_data = self.m.get(command)
+        edfa = parse_xml(edfa_data.data_xml)["data"]["edfas"]["edfa"]
+        config, state = (
+            {
+                key.split(":")[-1]: value
+                for key, value in (edfa.get(part) or {}).items()
+                if not key.startswith("@")
+            }
+            for part in ("config", "state")
+        )
+        return config, state
+
+    def __edfa_wait(self, target_module_id, expected, timeout):
+        # Poll the EDFA until it reports the expected configuration and maintenance state, and its output power has stopped changing
+        deadline = time.monotonic() + timeout
+        previous_output = None
+        polls = 0
+        while True:
+            config, state = self.__edfa_state(target_module_id)
+            polls += 1
+            pending = [
+                "%s=%s (expected %s)" % (leaf, config.get(leaf), value)
+                for leaf, value in expected.items()
+                if not _same_leaf_value(config.get(leaf), value)
+            ]
+            if "maintenance-state" in expected and "maintenance-state" in state:
+                if state["maintenance-state"] != expected["maintenance-state"]:
+                    pending.append(
+                        "operational maintenance-state=%s (expected %s)"
+                        % (state["maintenance-state"], expected["maintenance-state"])
+                    )
+            output = state.get("output-power")
+            output = float(output) if output is not None else None
+            # The first reading has nothing to compare with
+            if polls == 1 or (
+                output is not None
+                and previous_output is not None
+                and abs(output - previous_output) > LUMENTUM_EDFA_SETTLE_TOLERANCE
+            ):
+                pending.append(
+                    "output-power=%s (previous %s)" % (output, previous_output)
+                )
+            if not pending:
+                return config, state
+            if time.monotonic() >= deadline:
+                raise TimeoutError(
+                    "EDFA %s did not settle within %s s: %s"
+                    % (target_module_id, timeout, ", ".join(pending))
+                )
+            previous_output = output
+            time.sleep(LUMENTUM_EDFA_POLL_INTERVAL)
+
+    def __edfa_apply(self, target_module_id, config, timeout):
+        # Apply EDFA settings in one out-of-service / in-service transaction
+        command = """<xc:config xmlns:xc="urn:ietf:params:xml:ns:netconf:base:1.0">
+            <edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa">
+            <edfa><dn>ne=1;chassis=1;card=1;edfa=%s</dn>
+            <config>%s</config></edfa></edfas></xc:config>"""
+        if config.get("maintenance-state") != "out-of-service":
+            config = dict(config, **{"maintenance-state": LUMENTUM_INSERVICE})
+        leaves = "".join(
+            "<%s>%s</%s>" % (leaf, value, leaf) for leaf, value in config.items()
+        )
+
+        # Other threads must not change the EDFA while it is out of service
+        with self.guard:
+            self.m.edit_config(
+                target="running",
+                config=command
+                % (
+                    target_module_id,
+                    "<maintenance-state>out-of-service</maintenance-state>",
+                ),
+            )
+            self.__edfa_wait(
+                target_module_id, {"maintenance-state": "out-of-service"}, timeout
+            )
+            rpc_reply = self.m.edit_config(
+                target="running", config=command % (target_module_id, leaves)
+            )
+            self.__edfa_wait(target_module_id, config, timeout)
+        return rpc_reply
 
     def __edfa_los_mode(self, edfa_module, los_shutdown):
 
@@ -210,36 +325,13 @@ class Lumentum(object):
                 target_module_id = 1
             elif edfa_module == "preamp":
                 target_module_id = 2
-            rpc_reply = 0
-
-            target_edfa_info = self.edfa_get_info()[edfa_module]
-            print(target_edfa_info)
-
-            command_out_of_service = """<xc:config xmlns:xc="urn:ietf:params:xml:ns:netconf:base:1.0">
-                <edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa">
-                <edfa><dn>ne=1;chassis=1;card=1;edfa=%s</dn>
-                <config><maintenance-state>out-of-service</maintenance-state>
-                </config></edfa></edfas></xc:config>""" % (
-                target_module_id
-            )
 
             try:
-                command = """<xc:config xmlns:xc="urn:ietf:params:xml:ns:netconf:base:1.0">
-                <edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa">
-                <edfa><dn>ne=1;chassis=1;card=1;edfa=%s</dn>
-                <config>
-                <maintenance-state>in-service</maintenance-state>
-                <los-shutdown>%s</los-shutdown>
-                </config></edfa></edfas></xc:config>""" % (
-                    str(target_module_id),
-                    str(los_shutdown),
-                )
-
-                rpc_reply = self.m.edit_config(
-                    target="running", config=command_out_of_service
+                rpc_reply = self.__edfa_apply(
+                    target_module_id,
+                    {"los-shutdown": str(los_shutdown)},
+                    LUMENTUM_EDFA_SETTLE_TIMEOUT,
                 )
-                time.sleep(0.5)
-                rpc_reply = self.m.edit_config(target="running", config=command)
 
                 if "<ok/>" in str(rpc_reply):
                     if self.DEBUG:
@@ -266,14 +358,23 @@ class Lumentum(object):
         target_power=-10.0,
         target_gain_tilt=0.0,
         optical_loo_threshold=-50.0,
+        timeout=None,
     ):
         """Configure the EDFA module in the ROADM. The method allows the user to set the EDFA module in-service or out-of-service, set the control mode (constant power or constant gain), set the gain switch mode (low-gain or high-gain), set the target gain, target power, target gain tilt, and optical LOO threshold.
 
+        All the settings are applied in a single transaction: the module is taken out of service once, then put back in service with every setting in one edit, unless ``maintenance_state`` is 'out-of-service'. Each step is confirmed by reading back the EDFA configuration until it matches, instead of waiting a fixed time.
+
         IMPORTANT: This method should be used with caution as it can affect the optical power levels in the network. Do NOT use this method in quick succesion. Ideally, this method should only be used once before setting up the topology.
 
         :param edfa_module: The EDFA module to be configured (either 'booster' or 'preamp')
         :type edfa_module: str
 
+        :param los_shutdown: Set to 'false' to disable the shutdown of the EDFA on loss of signal. With 'true', the current setting is kept.
+        :type los_shutdown: str
+
+        :param maintenance_state: The maintenance state the EDFA module is left in (either 'in-service' or 'out-of-service')
+        :type maintenance_state: str
+
         :param control_mode: The control mode to be set (either 'constant-power' or 'constant-gain')
         :type control_mode: str
 
@@ -288,114 +389,41 @@ class Lumentum(object):
 
         :param target_gain_tilt: Sets the gain tilt applied over the spectrum. This is a a measure in dB of the gain slope from low to high frequency. For boosters, this can be set in the range [-3,+1] dB. The tilt cannot be set for preamps.
         :type target_gain_tilt: float
+
+        :param optical_loo_threshold: The optical loss of output threshold in dBm. With -50, the current setting is kept.
+        :type optical_loo_threshold: float
+
+        :param timeout: Maximum time in seconds to wait for each step to be reflected in the EDFA state, ``LUMENTUM_EDFA_SETTLE_TIMEOUT`` by default
+        :type timeout: float
         """
         # Assert
         if edfa_module != "booster" and edfa_module != "preamp":
             raise Exception("Invalid edfa_module: Please choose 'booster' or 'preamp'.")
-            exit(0)
         elif edfa_module == "booster":
             target_module_id = 1
         elif edfa_module == "preamp":
             target_module_id = 2
+        if timeout is None:
+            timeout = LUMENTUM_EDFA_SETTLE_TIMEOUT
         rpc_reply = 0
 
-        target_edfa_info = self.edfa_get_info()[edfa_module]
-        print(target_edfa_info)
-
-        command_out_of_service = """<xc:config xmlns:xc="urn:ietf:params:xml:ns:netconf:base:1.0">
-            <edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa">
-            <edfa><dn>ne=1;chassis=1;card=1;edfa=%s</dn>
-            <config><maintenance-state>out-of-service</maintenance-state>
-            </config></edfa></edfas></xc:config>""" % (
-            target_module_id
-        )
+        config = {"maintenance-state": maintenance_state}
+        if control_mode == "constant-power":
+            config["control-mode"] = "constant-power"
+            config["gain-switch-mode"] = str(gain_switch_mode)
+            config["target-power"] = str(target_power)
+            config["target-gain-tilt"] = str(target_gain_tilt)
+        elif control_mode == "constant-gain":
+            config["control-mode"] = "constant-gain"
+            config["target-gain"] = str(target_gain)
+            config["target-gain-tilt"] = str(target_gain_tilt)
+        if los_shutdown == "false":
+            config["los-shutdown"] = str(los_shutdown)
+        if optical_loo_threshold != -50:
+            config["optical-loo-threshold"] = str(optical_loo_threshold)
 
         try:
-            if maintenance_state == "out-of-service":
-                rpc_reply = self.m.edit_config(
-                    target="running", config=command_out_of_service
-                )
-
-            if control_mode == "constant-power":
-                command = """<xc:config xmlns:xc="urn:ietf:params:xml:ns:netconf:base:1.0">
-                <edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa">
-                <edfa><dn>ne=1;chassis=1;card=1;edfa=%s</dn>
-                <config>
-                <maintenance-state>in-service</maintenance-state>
-                <control-mode>constant-power</control-mode>
-                <gain-switch-mode>%s</gain-switch-mode>
-                <target-power>%s</target-power>
-                <target-gain-tilt>%s</target-gain-tilt>
-                </config></edfa></edfas></xc:config>""" % (
-                    str(target_module_id),
-                    str(gain_switch_mode),
-                    str(target_power),
-                    str(target_gain_tilt),
-                )
-
-                rpc_reply = self.m.edit_config(
-                    target="running", config=command_out_of_service
-                )
-                time.sleep(0.5)
-                rpc_reply = self.m.edit_config(target="running", config=command)
-
-            elif control_mode == "constant-gain":
-                command = """<xc:config xmlns:xc="urn:ietf:params:xml:ns:netconf:base:1.0">
-                <edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa">
-                <edfa><dn>ne=1;chassis=1;card=1;edfa=%s</dn>
-                <config>
-                <maintenance-state>in-service</maintenance-state>
-                <control-mode>constant-gain</control-mode>
-                <target-gain>%s</target-gain>
-                <target-gain-tilt>%s</target-gain-tilt>
-                </config></edfa></edfas></xc:config>""" % (
-                    target_module_id,
-                    target_gain,
-                    target_gain_tilt,
-                )
-
-                rpc_reply = self.m.edit_config(
-                    target="running", config=command_out_of_service
-                )
-                time.sleep(0.5)
-                rpc_reply = self.m.edit_config(target="running", config=command)
-
-            if los_shutdown == "false":
-                command = """<xc:config xmlns:xc="urn:ietf:params:xml:ns:netconf:base:1.0">
-                <edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa">
-                <edfa><dn>ne=1;chassis=1;card=1;edfa=%s</dn>
-                <config>
-                <maintenance-state>in-service</maintenance-state>
-                <los-shutdown>%s</los-shutdown>
-                </config></edfa></edfas></xc:config>""" % (
-                    str(target_module_id),
-                    str(los_shutdown),
-                )
-
-                rpc_reply = self.m.edit_config(
-                    target="running", config=command_out_of_service
-                )
-                time.sleep(0.5)
-                rpc_reply = self.m.edit_config(target="running", config=command)
-
-            if optical_loo_threshold != -50:
-
-                command = """<xc:config xmlns:xc="urn:ietf:params:xml:ns:netconf:base:1.0">
-                <edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa">
-                <edfa><dn>ne=1;chassis=1;card=1;edfa=%s</dn>
-                <config>
-                <maintenance-state>in-service</maintenance-state>
-                <optical-loo-threshold>%s</optical-loo-threshold>
-                </config></edfa></edfas></xc:config>""" % (
-                    str(target_module_id),
-                    str(optical_loo_threshold),
-                )
-
-                rpc_reply = self.m.edit_config(
-                    target="running", config=command_out_of_service
-                )
-                time.sleep(1.0)
-                rpc_reply = self.m.edit_config(target="running", config=command)
+            rpc_reply = self.__edfa_apply(target_module_id, config, timeout)
 
             if "<ok/>" in str(rpc_reply):
                 if self.DEBUG:
@@ -413,7 +441,7 @@ class Lumentum(object):
         except Exception as e:
             print("Encountered the following RPC error!")
             print(e)
-            exit(1)
+            raise
 
     def __set_mux_offline(self):
         target_module_id = 1
@@ -619,7 +647,7 @@ class Lumentum(object):
             % target_module_id
         )
         config = self.m.get_config(source="running", filter=("subtree", filter))
-        config_details = xmltodict.parse(config.data_xml)
+        config_details = parse_xml(config.data_xml)
         target_gain = config_details["data"]["edfas"]["edfa"]["config"][
             "lotee:target-gain"
         ]
@@ -644,7 +672,7 @@ class Lumentum(object):
             % target_module_id
         )
         config = self.m.get_config(source="running", filter=("subtree", filter))
-        config_details = xmltodict.parse(config.data_xml)
+        config_details = parse_xml(config.data_xml)
         target_gain = config_details["data"]["edfas"]["edfa"]["config"][
             "lotee:target-gain"
         ]
@@ -670,7 +698,7 @@ class Lumentum(object):
             % target_module_id
         )
         config = self.m.get_config(source="running", filter=("subtree", filter))
-        config_details = xmltodict.parse(config.data_xml)
+        config_details = parse_xml(config.data_xml)
         target_power = config_details["data"]["edfas"]["edfa"]["config"][
             "lotee:target-power"
         ]
@@ -691,7 +719,7 @@ class Lumentum(object):
             % target_module_id
         )
         config = self.m.get_config(source="running", filter=("subtree", filter))
-        config_details = xmltodict.parse(config.data_xml)
+        config_details = parse_xml(config.data_xml)
         target_power = config_details["data"]["edfas"]["edfa"]["config"][
             "lotee:target-power"
         ]
@@ -707,7 +735,7 @@ class Lumentum(object):
         filter = """<filter><edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" 
                   xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa"></edfas></filter>"""
         edfa_data = self.m.get(filter)
-        edfa_info_raw = xmltodict.parse(edfa_data.data_xml)["data"]["edfas"]["edfa"]
+        edfa_info_raw = parse_xml(edfa_data.data_xml)["data"]["edfas"]["edfa"]
         input_power = float(edfa_info_raw[0]["state"]["input-power"])
         return input_power
 
@@ -721,7 +749,7 @@ class Lumentum(object):
         filter = """<filter><edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" 
                   xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa"></edfas></filter>"""
         edfa_data = self.m.get(filter)
-        edfa_info_raw = xmltodict.parse(edfa_data.data_xml)["data"]["edfas"]["edfa"]
+        edfa_info_raw = parse_xml(edfa_data.data_xml)["data"]["edfas"]["edfa"]
         output_power = float(edfa_info_raw[0]["state"]["output-power"])
         return output_power
 
@@ -735,7 +763,7 @@ class Lumentum(object):
         filter = """<filter><edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" 
                   xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa"></edfas></filter>"""
         edfa_data = self.m.get(filter)
-        edfa_info_raw = xmltodict.parse(edfa_data.data_xml)["data"]["edfas"]["edfa"]
+        edfa_info_raw = parse_xml(edfa_data.data_xml)["data"]["edfas"]["edfa"]
         input_power = float(edfa_info_raw[1]["state"]["input-power"])
         return input_power
 
@@ -749,7 +777,7 @@ class Lumentum(object):
         filter = """<filter><edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" 
                   xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa"></edfas></filter>"""
         edfa_data = self.m.get(filter)
-        edfa_info_raw = xmltodict.parse(edfa_data.data_xml)["data"]["edfas"]["edfa"]
+        edfa_info_raw = parse_xml(edfa_data.data_xml)["data"]["edfas"]["edfa"]
         output_power = float(edfa_info_raw[1]["state"]["output-power"])
         return output_power
 
@@ -766,7 +794,7 @@ class Lumentum(object):
         filter = """<filter><edfas xmlns="http://www.lumentum.com/lumentum-ote-edfa" 
                   xmlns:lotee="http://www.lumentum.com/lumentum-ote-edfa"></edfas></filter>"""
         edfa_data = self.m.get(filter)
-        edfa_info_raw = xmltodict.parse(edfa_data.data_xml)
+        edfa_info_raw = parse_xml(edfa_data.data_xml)
         if DEBUG:
             print(edfa_info_raw)
         return edfa_info_raw
@@ -792,9 +820,9 @@ class Lumentum(object):
 
         try:
             rpc_reply = self.m.get(command)
-            port_info_raw = xmltodict.parse(rpc_reply.data_xml)["data"][
-                "physical-ports"
-            ]["physical-port"]
+            port_info_raw = parse_xml(rpc_reply.data_xml)["data"]["physical-ports"][
+                "physical-port"
+            ]
             for port_idx in range(len(port_info_raw)):
                 cur_port_info = port_info_raw[port_idx]
                 cur_port_id = int(str(cur_port_info["dn"]).split("port=", 4)[1])
@@ -846,7 +874,7 @@ class Lumentum(object):
         except Exception as e:
             print("Encountered the following RPC error!")
             print(e)
-            exit(1)
+            raise
 
         return self.port_info
 
@@ -883,28 +911,23 @@ class Lumentum(object):
                 raise Exception(
                     "Invalid WSS wss_id is not 1 or 2. Please select WSS 1 (MUX) or WSS 2 (DEMUX)"
                 )
-                exit(0)
             elif wss_id == 1:
                 if input_port < 4101 or input_port > 4120 or output_port != 4201:
                     raise Exception(
                         "Invalid WSS1 input_port range (4101-4120) or output_port range (4201)"
                     )
-                    exit(0)
             elif wss_id == 2:
                 if input_port != 5101 or output_port < 5201 or output_port > 5220:
                     raise Exception(
                         "Invalid WSS1 input_port range (5101) or output_port range (5201-5220)"
                     )
-                    exit(0)
 
             if operation != "in-service" and operation != "out-of-service":
                 raise Exception(
                     "Invalid WSS operation: not 'in-service' or 'out-of-service'"
                 )
-                exit(0)
             if blocked != "true" and blocked != "false":
                 raise Exception("Invalid WSS blocked: not 'true' or 'false'")
-                exit(0)
 
             self.wss_id = wss_id
             self.connection_id = connection_id
@@ -1011,7 +1034,7 @@ class Lumentum(object):
         try:
             wss_data = self.m.get(command)
             # An ordered dict exported from xml
-            wss_details = xmltodict.parse(wss_data.data_xml)
+            wss_details = parse_xml(wss_data.data_xml)
             if "module=1" in str(wss_details) or "module=2" in str(wss_details):
                 # A list of connections
                 connections = wss_details["data"]["connections"]["connection"]
@@ -1024,7 +1047,7 @@ class Lumentum(object):
         except Exception as e:
             print("Encountered the following RPC error!")
             print(e)
-            exit(0)
+            raise
 
         # With only MUX connections
         if "module=1" in str(connections) and "module=2" not in str(connections):
@@ -1381,7 +1404,7 @@ class Lumentum(object):
         try:
             wss_data = self.m.get(command)
             # An ordered dict exported from xml
-            wss_details = xmltodict.parse(wss_data.data_xml)
+            wss_details = parse_xml(wss_data.data_xml)
             if "port=3101" in str(wss_details) or "port=6201" in str(wss_details):
                 # A list of connections
                 monitored_channels = wss_details["data"]["monitored-channels"][
@@ -1396,38 +1419,43 @@ class Lumentum(object):
         except Exception as e:
             print("Encountered the following RPC error!")
             print(e)
-            exit(0)
+            raise
 
+        frequencies = [
+            float(cur_monchan["state"]["measured-frequency"])
+            for cur_monchan in monitored_channels
+        ]
+        # Channel whose band holds the measured frequency, 0 outside the grid
+        channel_ids = (
+            channel_grid(channel_quantity=LUMENTUM_CHANNEL_QUANTITY)
+            .channel_of(frequencies)
+            .tolist()
+        )
         mon_mux_id = 0
         mon_demux_id = 0
-        for cur_monchan_idx in range(len(monitored_channels)):
-            cur_monchan = monitored_channels[cur_monchan_idx]
-            power = cur_monchan["state"]["power"]
-            frequency = cur_monchan["state"]["measured-frequency"]
+        for cur_monchan, frequency, channel_id in zip(
+            monitored_channels, frequencies, channel_ids
+        ):
             if "port=6201" in str(cur_monchan):
                 # print('mux')
                 mon_mux_id += 1
                 cur_mon_name = "mon-" + str(mon_mux_id)
                 self.monitored_channels["mux"][cur_mon_name] = {}
-                self.monitored_channels["mux"][cur_mon_name]["id"] = mon_mux_id
+                self.monitored_channels["mux"][cur_mon_name]["id"] = channel_id
                 self.monitored_channels["mux"][cur_mon_name]["power"] = float(
                     cur_monchan["state"]["power"]
                 )
-                self.monitored_channels["mux"][cur_mon_name]["frequency"] = float(
-                    cur_monchan["state"]["measured-frequency"]
-                )
+                self.monitored_channels["mux"][cur_mon_name]["frequency"] = frequency
             elif "port=3101" in str(cur_monchan):
                 # print('demux')
                 mon_demux_id += 1
                 cur_mon_name = "mon-" + str(mon_demux_id)
                 self.monitored_channels["demux"][cur_mon_name] = {}
-                self.monitored_channels["demux"][cur_mon_name]["id"] = mon_demux_id
+                self.monitored_channels["demux"][cur_mon_name]["id"] = channel_id
                 self.monitored_channels["demux"][cur_mon_name]["power"] = float(
                     cur_monchan["state"]["power"]
                 )
-                self.monitored_channels["demux"][cur_mon_name]["frequency"] = float(
-                    cur_monchan["state"]["measured-frequency"]
-                )
+                self.monitored_channels["demux"][cur_mon_name]["frequency"] = frequency
 
         return self.monitored_channels
 
@@ -1483,13 +1511,10 @@ class Lumentum(object):
         # Assert
         if wss_id == 1 and output_port != 4201:
             raise Exception("Error: WSS 1 (MUX) output port has to be 4201.")
-            exit(0)
         elif wss_id == 2 and input_port != 5101:
             raise Exception("Error: WSS 2 (DEMUX) input port has to be 5101.")
-            exit(0)
         elif wss_id != 1 and wss_id != 2:
             raise Exception("Error: Invalid WSS wss_id (not 1 or 2).")
-            exit(0)
 
         command = """
                   <add-connection xmlns="http://www.lumentum.com/lumentum-ote-connection">
@@ -1537,7 +1562,7 @@ class Lumentum(object):
         except Exception as e:
             print("Encountered the following RPC error!")
             print(e)
-            exit(0)
+            raise
 
     def set_mux_block(self, connection_id):
         self.wss_block(1, 4201, connection_id, "true")
@@ -1571,7 +1596,7 @@ class Lumentum(object):
                 except Exception as e:
                     print("Encountered the following RPC error!")
                     print(e)
-                    exit(0)
+                    raise
 
         else:
             command = """
@@ -1597,7 +1622,7 @@ class Lumentum(object):
             except Exception as e:
                 print("Encountered the following RPC error!")
                 print(e)
-                exit(0)
+                raise
 
     def set_mux_atten(self, connection_id, atten=0.0):
         self.wss_atten(1, 4101, connection_id, atten)
@@ -1719,7 +1744,7 @@ class Lumentum(object):
                 except Exception as e:
                     print("Encountered the following RPC error!")
                     print(e)
-                    exit(0)
+                    raise
 
         else:
             command = """
@@ -1744,7 +1769,7 @@ class Lumentum(object):
             except Exception as e:
                 print("Encountered the following RPC error!")
                 print(e)
-                exit(0)
+                raise
 
     def wss_outport(self, wss_id, connection_id, port):
         if isinstance(connection_id, list):
@@ -1765,7 +1790,7 @@ class Lumentum(object):
                 except Exception as e:
                     print("Encountered the following RPC error!")
                     print(e)
-                    exit(0)
+                    raise
 
         else:
             command = """
@@ -1792,7 +1817,7 @@ class Lumentum(object):
             except Exception as e:
                 print("Encountered the following RPC error!")
                 print(e)
-                exit(0)
+                raise
 
     def wss_add_connections(self, connections):
         """
@@ -1980,9 +2005,15 @@ class Lumentum(object):
             wss_connections_dwdm: a list of WSSConnection class objects
         """
         wss_connections_dwdm = []
-        center_freq = central_freq_input
+        grid = channel_grid(
+            channel_width,
+            channel_spacing,
+            central_freq_input,
+            LUMENTUM_CHANNEL_QUANTITY,
+        )
+        start_freqs = grid.start.tolist()
+        end_freqs = grid.end.tolist()
         for i in range(1, LUMENTUM_CHANNEL_QUANTITY + 1):
-            cur_center_freq = center_freq + (i - 1) * channel_spacing
             total_loss = float(loss) + (
                 channel_additional_attenuations[i]
                 if channel_additional_attenuations is not None
@@ -1996,8 +2027,8 @@ class Lumentum(object):
                 "false" if i in open_channels else "true",
                 input_port,
                 output_port,
-                str(cur_center_freq - channel_width / 2.0),
-                str(cur_center_freq + channel_width / 2.0),
+                str(start_freqs[i - 1]),
+                str(end_freqs[i - 1]),
                 "{:.2f}".format(total_loss),
                 "CH" + str(i),
             )
@@ -2086,8 +2117,7 @@ class Lumentum(object):
                 "channel_list must be a tuple of integers, or an integer for single channels"
             )
 
-        start_freq = float(get_freq_range(channel_list[0])[0])
-        end_freq = float(get_freq_range(channel_list[-1])[2])
+        start_freq, end_freq = channel_grid().span(channel_list)
 
         total_loss = float(loss) + (
             channel_additional_attenuations
@@ -2142,16 +2172,18 @@ class Lumentum(object):
 
         channel_port_dict = {}
 
+        # The first entry of add_list holding each channel, found once per channel
+        owners = {}
+        for channel_list, port in add_list.items():
+            for channel in (
+                channel_list if isinstance(channel_list, tuple) else (channel_list,)
+            ):
+                owners.setdefault(channel, (channel_list, port))
+
         for channel in range(1, channel_quantity + 1):
-            for channel_list, port in add_list.items():
-                if isinstance(channel_list, tuple):
-                    if channel in channel_list:
-                        channel_port_dict[channel_list] = port
-                        break
-                elif isinstance(channel_list, int):
-                    if channel == channel_list:
-                        channel_port_dict[channel_list] = port
-                        break
+            if channel in owners:
+                channel_list, port = owners[channel]
+                channel_port_dict[channel_list] = port
             else:
                 channel_port_dict[channel] = default_port
 
@@ -2208,8 +2240,7 @@ class Lumentum(object):
                 "channel_list must be a tuple of integers, or an integer for single channels"
             )
 
-        start_freq = float(get_freq_range(channel_list[0])[0])
-        end_freq = float(get_freq_range(channel_list[-1])[2])
+        start_freq, end_freq = channel_grid().span(channel_list)
 
         total_loss = float(loss) + (
             channel_additional_attenuations
@@ -2249,16 +2280,18 @@ class Lumentum(object):
 
         channel_port_dict = {}
 
+        # The first entry of drop_list holding each channel, found once per channel
+        owners = {}
+        for channel_list, port in drop_list.items():
+            for channel in (
+                channel_list if isinstance(channel_list, tuple) else (channel_list,)
+            ):
+                owners.setdefault(channel, (channel_list, port))
+
         for channel in range(1, channel_quantity + 1):
-            for channel_list, port in drop_list.items():
-                if isinstance(channel_list, tuple):
-                    if channel in channel_list:
-                        channel_port_dict[channel_list] = port
-                        break
-                elif isinstance(channel_list, int):
-                    if channel == channel_list:
-                        channel_port_dict[channel_list] = port
-                        break
+            if channel in owners:
+                channel_list, port = owners[channel]
+                channel_port_dict[channel_list] = port
             else:
                 channel_port_dict[channel] = default_port
 
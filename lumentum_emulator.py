@@ -0,0 +1,559 @@
+import re
+import time
+import random
+import threading
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+import numpy as np
+from lumentum import LUMENTUM_CHANNEL_QUANTITY
+from utils import channel_grid
+
+EMULATOR_NOISE_FLOOR = -60.0  # dBm, power reported for blocked or unused channels
+EMULATOR_ADD_POWER = -3.0  # dBm, default per-channel power at the add ports
+EMULATOR_LINE_POWER = -20.0  # dBm, default per-channel power at the line in port
+EMULATOR_ADD_PORTS = range(4101, 4121)
+EMULATOR_DROP_PORTS = range(5201, 5221)
+EMULATOR_MUX_OCM_PORT = 6201
+EMULATOR_DEMUX_OCM_PORT = 3101
+EMULATOR_LINE_PORT = 3001
+
+NETCONF_NS = "urn:ietf:params:xml:ns:netconf:base:1.0"
+EDFA_NS = "http://www.lumentum.com/lumentum-ote-edfa"
+CONNECTION_NS = "http://www.lumentum.com/lumentum-ote-connection"
+MONITORED_CHANNEL_NS = "http://www.lumentum.com/lumentum-ote-monitored-channel"
+PORT_NS = "http://www.lumentum.com/lumentum-ote-port"
+PORT_OPTICAL_NS = "http://www.lumentum.com/lumentum-ote-port-optical"
+
+#: Connection leaves that can be set by add-connection and edit-config
+CONNECTION_LEAVES = (
+    "maintenance-state",
+    "blocked",
+    "start-freq",
+    "end-freq",
+    "attenuation",
+    "input-port-reference",
+    "output-port-reference",
+    "custom-name",
+)
+#: EDFA configuration leaves, reported with the lotee prefix like the ROADM does
+EDFA_CONFIG_LEAVES = (
+    "maintenance-state",
+    "control-mode",
+    "gain-switch-mode",
+    "target-power",
+    "target-gain",
+    "target-gain-tilt",
+    "los-shutdown",
+    "optical-loo-threshold",
+)
+
+
+class EmulatorRPCError(Exception):
+
+    """Error returned by the emulator for an invalid RPC."""
+
+
+class EmulatorReply:
+
+    """Reply of the emulator. Like an ncclient reply, ``str(reply)`` is the rpc-reply xml and ``data_xml`` is the data element of a get or get-config reply.
+
+    :param data_xml: Content of the data element, None for replies with <ok/>
+    :type data_xml: str
+    """
+
+    def __init__(self, data_xml=None):
+
+        self.ok = data_xml is None
+        if self.ok:
+            self.data_xml = None
+            self.xml = '<rpc-reply xmlns="%s"><ok/></rpc-reply>' % NETCONF_NS
+        else:
+            self.data_xml = '<data xmlns="%s">%s</data>' % (NETCONF_NS, data_xml)
+            self.xml = '<rpc-reply xmlns="%s">%s</rpc-reply>' % (
+                NETCONF_NS,
+                self.data_xml,
+            )
+
+    def __str__(self):
+        return self.xml
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1].split(":")[-1]
+
+
+def _leaves(element):
+    return {_local(child.tag): (child.text or "").strip() for child in element}
+
+
+def _dn_values(dn):
+    return dict(item.split("=", 1) for item in dn.split(";") if "=" in item)
+
+
+def _port(reference):
+    return int(_dn_values(reference)["port"])
+
+
+def _to_linear(dbm):
+    return 10 ** (np.asarray(dbm, dtype=float) / 10)
+
+
+def _to_dbm(mw):
+    return 10 * np.log10(np.maximum(mw, _to_linear(EMULATOR_NOISE_FLOOR)))
+
+
+class LumentumEmulator:
+
+    """In-process stand-in for the NETCONF session of a Lumentum ROADM-20, to pass as ``Lumentum(roadm_name, session=LumentumEmulator())``. It implements the get, get_config, edit_config and dispatch calls the driver makes on the connections, monitored-channels, physical-ports and edfas subtrees, and the add-connection, delete-connection, remove-all-connections and disable-als RPCs. Replies use the element names and prefixes of the real ROADM so the driver parses them unchanged.
+
+    Powers follow a simple model of the 95-channel grid: every add port carries ``add_power`` per channel, the line in port carries ``line_power`` per channel, open connections subtract their attenuation, and the EDFAs apply their target gain, or reach their target power in constant-power mode.
+
+    :param latency: Delay of every RPC in seconds, or delays keyed by call name ('get', 'get_config', 'edit_config', 'dispatch')
+    :type latency: float or dict
+
+    :param jitter: Maximum random delay added to every RPC in seconds
+    :type jitter: float
+
+    :param add_power: Per-channel power at the add ports in dBm, a number or one value per channel
+    :type add_power: float or list
+
+    :param line_power: Per-channel power at the line in port in dBm, a number or one value per channel
+    :type line_power: float or list
+
+    :param seed: Seed of the latency jitter
+    :type seed: int
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        add_power=EMULATOR_ADD_POWER,
+        line_power=EMULATOR_LINE_POWER,
+        seed=None,
+    ):
+
+        self.latency = latency
+        self.jitter = jitter
+        self.add_power = np.broadcast_to(
+            np.asarray(add_power, dtype=float), (LUMENTUM_CHANNEL_QUANTITY,)
+        ).copy()
+        self.line_power = np.broadcast_to(
+            np.asarray(line_power, dtype=float), (LUMENTUM_CHANNEL_QUANTITY,)
+        ).copy()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connected = True
+        self.rpc_count = {}
+        self.als_disabled_until = 0.0
+        self.grid = channel_grid(channel_quantity=LUMENTUM_CHANNEL_QUANTITY)
+        self.centres = self.grid.centre
+        # Connections keyed by (module, connection id)
+        self.connections = {}
+        self.edfas = {
+            module: {
+                "maintenance-state": "in-service",
+                "control-mode": "constant-gain",
+                "gain-switch-mode": "low-gain",
+                "target-power": "0.0",
+                "target-gain": "18.0",
+                "target-gain-tilt": "0.0",
+                "los-shutdown": "true",
+                "optical-loo-threshold": "-50.0",
+            }
+            for module in (1, 2)
+        }
+
+    # NETCONF session calls used by the Lumentum driver
+
+    def get(self, filter=None):
+        """Reply to a get of the edfas, connections, monitored-channels or physical-ports subtree."""
+
+        self.__delay("get")
+        with self.lock:
+            return EmulatorReply(self.__subtree(str(filter), config_only=False))
+
+    def get_config(self, source="running", filter=None):
+        """Reply to a get-config of the edfas or connections subtree. A dn in the filter selects a single entry."""
+
+        self.__delay("get_config")
+        if isinstance(filter, tuple):
+            filter = filter[1]
+        with self.lock:
+            return EmulatorReply(self.__subtree(str(filter), config_only=True))
+
+    def edit_config(self, target="running", config=None):
+        """Merge an edfas or connections configuration into the running state."""
+
+        self.__delay("edit_config")
+        root = ET.fromstring(config)
+        with self.lock:
+            for element in root.iter():
+                name = _local(element.tag)
+                if name == "edfa":
+                    self.__edit_edfa(element)
+                elif name == "connection":
+                    self.__edit_connection(element)
+        return EmulatorReply()
+
+    def dispatch(self, rpc):
+        """Run an add-connection, delete-connection, remove-all-connections or disable-als RPC, given as an element or an xml string."""
+
+        self.__delay("dispatch")
+        if isinstance(rpc, ET.Element):
+            rpc = ET.tostring(rpc, encoding="unicode")
+        elif not isinstance(rpc, str):
+            # ncclient builds lxml elements
+            from lxml import etree
+
+            rpc = etree.tostring(rpc, encoding="unicode")
+        root = ET.fromstring(rpc)
+        name = _local(root.tag)
+        leaves = _leaves(root)
+        dn = _dn_values(leaves.get("dn", ""))
+        with self.lock:
+            if name == "add-connection":
+                self.__set_connection(
+                    int(dn["module"]), dn["connection"], leaves, create=True
+                )
+            elif name == "delete-connection":
+                key = (int(dn["module"]), dn["connection"])
+                if key not in self.connections:
+                    raise EmulatorRPCError("Connection %s does not exist" % str(key))
+                del self.connections[key]
+            elif name == "remove-all-connections":
+                module = int(dn["module"])
+                for key in [key for key in self.connections if key[0] == module]:
+                    del self.connections[key]
+            elif name == "disable-als":
+                self.als_disabled_until = time.monotonic() + float(
+                    leaves.get("timeout-period", 0)
+                )
+            else:
+                raise EmulatorRPCError("Unsupported RPC %s" % name)
+        return EmulatorReply()
+
+    def close_session(self):
+        self.connected = False
+
+    # State changes
+
+    def __edit_edfa(self, element):
+        leaves = _leaves(element)
+        module = int(_dn_values(leaves["dn"])["edfa"])
+        config = next(
+            (child for child in element if _local(child.tag) == "config"), None
+        )
+        if config is not None:
+            for leaf, value in _leaves(config).items():
+                if leaf in EDFA_CONFIG_LEAVES:
+                    self.edfas[module][leaf] = value
+
+    def __edit_connection(self, element):
+        leaves = _leaves(element)
+        dn = _dn_values(leaves["dn"])
+        config = next(
+            (child for child in element if _local(child.tag) == "config"), None
+        )
+        self.__set_connection(
+            int(dn["module"]),
+            dn["connection"],
+            _leaves(config) if config is not None else {},
+            create=True,
+        )
+
+    def __set_connection(self, module, connection_id, leaves, create):
+        key = (module, str(connection_id))
+        if key not in self.connections:
+            if not create:
+                raise EmulatorRPCError("Connection %s does not exist" % str(key))
+            self.connections[key] = {
+                "maintenance-state": "in-service",
+                "blocked": "true",
+                "start-freq": "0.0",
+                "end-freq": "0.0",
+                "attenuation": "0.0",
+                "input-port-reference": "ne=1;chassis=1;card=1;port=%d"
+                % (4101 if module == 1 else 5101),
+                "output-port-reference": "ne=1;chassis=1;card=1;port=%d"
+                % (4201 if module == 1 else 5201),
+                "custom-name": "",
+            }
+        for leaf, value in leaves.items():
+            # The driver sends a misspelt output-reference when changing a demux port
+            leaf = "output-port-reference" if leaf == "output-reference" else leaf
+            if leaf in CONNECTION_LEAVES:
+                self.connections[key][leaf] = value
+
+    # Power model
+
+    def __channels(self, connection):
+        start, end = float(connection["start-freq"]), float(connection["end-freq"])
+        return self.grid.slots(start, end) - 1
+
+    def __is_open(self, connection):
+        return (
+            connection["blocked"] == "false"
+            and connection["maintenance-state"] == "in-service"
+        )
+
+    def __edfa_gain(self, module, input_mw):
+        edfa = self.edfas[module]
+        if edfa["maintenance-state"] != "in-service":
+            return None
+        if edfa["control-mode"] == "constant-power":
+            return float(edfa["target-power"]) - float(_to_dbm(input_mw))
+        return float(edfa["target-gain"])
+
+    def __model(self):
+        floor = _to_linear(EMULATOR_NOISE_FLOOR)
+        mux_out = np.zeros(LUMENTUM_CHANNEL_QUANTITY)
+        connection_power = {}
+        for key, connection in sorted(self.connections.items()):
+            if key[0] != 1:
+                continue
+            channels = self.__channels(connection)
+            input_mw = _to_linear(self.add_power[channels]).sum()
+            output_mw = floor
+            if self.__is_open(connection) and len(channels):
+                output_mw = input_mw * _to_linear(-float(connection["attenuation"]))
+                mux_out[channels] += _to_linear(
+                    self.add_power[channels] - float(connection["attenuation"])
+                )
+            connection_power[key] = (input_mw, output_mw)
+
+        booster_in = mux_out.sum()
+        booster_gain = self.__edfa_gain(1, booster_in)
+        line_in = _to_linear(self.line_power)
+        preamp_in = line_in.sum()
+        preamp_gain = self.__edfa_gain(2, preamp_in)
+
+        demux_in = line_in * _to_linear(preamp_gain if preamp_gain is not None else -99)
+        drop = {}
+        for key, connection in sorted(self.connections.items()):
+            if key[0] != 2:
+                continue
+            channels = self.__channels(connection)
+            input_mw = demux_in[channels].sum()
+            output_mw = floor
+            if self.__is_open(connection) and len(channels):
+                output_mw = input_mw * _to_linear(-float(connection["attenuation"]))
+                port = _port(connection["output-port-reference"])
+                drop[port] = drop.get(port, 0.0) + output_mw
+            connection_power[key] = (input_mw, output_mw)
+
+        return {
+            "connections": connection_power,
+            "booster": (booster_in, booster_gain),
+            "preamp": (preamp_in, preamp_gain),
+            "mux_ocm": mux_out
+            * _to_linear(booster_gain if booster_gain is not None else -99),
+            "demux_ocm": demux_in,
+            "drop": drop,
+        }
+
+    # Replies
+
+    def __subtree(self, filter, config_only):
+        dn = re.search(r"<dn>([^<]*)</dn>", filter)
+        dn = _dn_values(dn.group(1)) if dn else {}
+        if "edfas" in filter:
+            return self.__edfas_xml(dn, config_only)
+        elif "monitored-channels" in filter:
+            return self.__monitored_channels_xml()
+        elif "physical-ports" in filter:
+            return self.__physical_ports_xml()
+        elif "connections" in filter:
+            return self.__connections_xml(dn, config_only)
+        raise EmulatorRPCError("Unsupported filter %s" % filter)
+
+    def __edfas_xml(self, dn, config_only):
+        model = self.__model()
+        entries = []
+        for module, name in ((1, "booster"), (2, "preamp")):
+            if "edfa" in dn and int(dn["edfa"]) != module:
+                continue
+            edfa = self.edfas[module]
+            config = "".join(
+                "<lotee:%s>%s</lotee:%s>" % (leaf, escape(edfa[leaf]), leaf)
+                for leaf in EDFA_CONFIG_LEAVES
+            )
+            state = ""
+            if not config_only:
+                input_mw, gain = model[name]
+                input_power = float(_to_dbm(input_mw))
+                output_power = (
+                    EMULATOR_NOISE_FLOOR if gain is None else input_power + gain
+                )
+                state = (
+                    "<state><input-power>%.2f</input-power>"
+                    "<output-power>%.2f</output-power>"
+                    "<voas><voa><voa-input-power>%.2f</voa-input-power>"
+                    "<voa-output-power>%.2f</voa-output-power>"
+                    "<voa-attentuation>0.00</voa-attentuation></voa></voas></state>"
+                    % (input_power, output_power, output_power, output_power)
+                )
+            entries.append(
+                "<edfa><dn>ne=1;chassis=1;card=1;edfa=%d</dn><config>%s</config>%s</edfa>"
+                % (module, config, state)
+            )
+        return '<edfas xmlns="%s" xmlns:lotee="%s">%s</edfas>' % (
+            EDFA_NS,
+            EDFA_NS,
+            "".join(entries),
+        )
+
+    def __connections_xml(self, dn, config_only):
+        model = self.__model()
+        entries = []
+        for (module, connection_id), connection in sorted(
+            self.connections.items(), key=lambda item: (item[0][0], int(item[0][1]))
+        ):
+            if "module" in dn and int(dn["module"]) != module:
+                continue
+            if "connection" in dn and dn["connection"] != connection_id:
+                continue
+            config = "".join(
+                "<%s>%s</%s>" % (leaf, escape(connection[leaf]), leaf)
+                for leaf in CONNECTION_LEAVES
+            )
+            state = ""
+            if not config_only:
+                input_mw, output_mw = model["connections"][(module, connection_id)]
+                valid = "true" if self.__is_open(connection) else "false"
+                state = (
+                    "<state><entity-description>%s</entity-description>"
+                    "<maintenance-state>%s</maintenance-state><blocked>%s</blocked>"
+                    "<start-freq>%s</start-freq><end-freq>%s</end-freq>"
+                    "<attenuation>%s</attenuation>"
+                    "<input-channel-attributes><power>%.2f</power><valid-data>%s</valid-data></input-channel-attributes>"
+                    "<output-channel-attributes><power>%.2f</power><valid-data>%s</valid-data></output-channel-attributes>"
+                    "</state>"
+                    % (
+                        escape(connection["custom-name"]),
+                        connection["maintenance-state"],
+                        connection["blocked"],
+                        connection["start-freq"],
+                        connection["end-freq"],
+                        connection["attenuation"],
+                        float(_to_dbm(input_mw)),
+                        valid,
+                        float(_to_dbm(output_mw)),
+                        valid,
+                    )
+                )
+            entries.append(
+                "<connection><dn>ne=1;chassis=1;card=1;module=%d;connection=%s</dn>"
+                "<config>%s</config>%s</connection>"
+                % (module, connection_id, config, state)
+            )
+        return '<connections xmlns="%s" xmlns:lotet="%s">%s</connections>' % (
+            CONNECTION_NS,
+            CONNECTION_NS,
+            "".join(entries),
+        )
+
+    def __monitored_channels_xml(self):
+        model = self.__model()
+        entries = []
+        for port, powers in (
+            (EMULATOR_MUX_OCM_PORT, model["mux_ocm"]),
+            (EMULATOR_DEMUX_OCM_PORT, model["demux_ocm"]),
+        ):
+            for channel, (centre, power) in enumerate(
+                zip(self.centres, _to_dbm(powers)), start=1
+            ):
+                entries.append(
+                    "<monitored-channel><dn>ne=1;chassis=1;card=1;port=%d;channel=%d</dn>"
+                    "<state><measured-frequency>%.2f</measured-frequency>"
+                    "<power>%.2f</power></state></monitored-channel>"
+                    % (port, channel, centre, power)
+                )
+        return '<monitored-channels xmlns="%s">%s</monitored-channels>' % (
+            MONITORED_CHANNEL_NS,
+            "".join(entries),
+        )
+
+    def __physical_ports_xml(self):
+        model = self.__model()
+        booster_in, booster_gain = model["booster"]
+        preamp_in, _ = model["preamp"]
+        booster_out = (
+            EMULATOR_NOISE_FLOOR
+            if booster_gain is None
+            else float(_to_dbm(booster_in)) + booster_gain
+        )
+        add_power = float(_to_dbm(_to_linear(self.add_power).sum()))
+
+        def port(number, description, powers):
+            state = "".join(
+                "<lotepopt:%s>%.2f</lotepopt:%s>" % (leaf, value, leaf)
+                for leaf, value in powers
+            )
+            return (
+                "<physical-port><dn>ne=1;chassis=1;card=1;port=%d</dn>"
+                "<state><entity-description>%s</entity-description>"
+                "<operational-state>in-service</operational-state>%s</state></physical-port>"
+                % (number, description, state)
+            )
+
+        entries = [
+            port(
+                EMULATOR_LINE_PORT,
+                "Line",
+                (
+                    ("input-power", float(_to_dbm(preamp_in))),
+                    ("output-power", booster_out),
+                    ("outvoa-actual-attenuation", 0.0),
+                ),
+            )
+        ]
+        used = {
+            _port(connection["input-port-reference"])
+            for (module, _), connection in self.connections.items()
+            if module == 1
+        }
+        for number in EMULATOR_ADD_PORTS:
+            power = add_power if number in used else EMULATOR_NOISE_FLOOR
+            entries.append(
+                port(number, "Add %d" % (number - 4100), (("input-power", power),))
+            )
+        for number in EMULATOR_DROP_PORTS:
+            power = float(_to_dbm(model["drop"].get(number, 0.0)))
+            entries.append(
+                port(number, "Drop %d" % (number - 5200), (("output-power", power),))
+            )
+        return (
+            '<physical-ports xmlns="%s" xmlns:lotep="%s" xmlns:lotepopt="%s">%s</physical-ports>'
+            % (PORT_NS, PORT_NS, PORT_OPTICAL_NS, "".join(entries))
+        )
+
+    def __delay(self, call):
+        self.rpc_count[call] = self.rpc_count.get(call, 0) + 1
+        latency = self.latency
+        if isinstance(latency, dict):
+            latency = latency.get(call, 0.0)
+        if self.jitter:
+            latency += self.random.uniform(0, self.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+
+def write_ports_file(path, roadm="Lumentum_5"):
+    """Write a ports file as read by RoadmMonitor, mapping the ROADM add/drop and line ports to Polatis ports.
+
+    :param path: Path of the tab-separated file
+    :type path: str
+
+    :param roadm: Name prefix of the ROADM in the ports file
+    :type roadm: str
+
+    :return: Path of the file
+    :rtype: str
+    """
+
+    with open(path, "w") as file_output:
+        file_output.write("Name\tIn\tOut\n")
+        file_output.write("%s_p1\t1\t2\n" % roadm)
+        file_output.write("%s_line\t3\t4\n" % roadm)
+    return path
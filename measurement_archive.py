@@ -0,0 +1,284 @@
+import os
+import re
+import json
+from concurrent.futures import ProcessPoolExecutor
+from measurement_store import (
+    MeasurementSink,
+    MEASUREMENT_CHUNK_SIZE,
+    MEASUREMENT_PART_PREFIX,
+    MEASUREMENT_SCHEMAS,
+    measurement_row,
+)
+
+ARCHIVE_FILE_PATTERN = re.compile(
+    r"^monitor_(?P<device>.+)_index(?P<index>.*)_uid(?P<uid>.*)\.json$"
+)
+ARCHIVE_CACHE_DIR = ".monitor_cache"
+ARCHIVE_INDEX_FILE = "index.parquet"
+#: Index columns, in order
+ARCHIVE_INDEX_COLUMNS = [
+    "file",
+    "mtime",
+    "size",
+    "monitor",
+    "device",
+    "index",
+    "uid",
+    "time",
+    "measurement_label",
+    "part",
+    "row",
+]
+
+
+def monitor_type(device):
+    """Get the monitor type of the device named in an archive file name. ILAMonitor and OSAMonitor write 'ILA' and 'OSA', RoadmMonitor writes the ROADM name.
+
+    :param device: Device name from the file name
+    :type device: str
+
+    :return: 'roadm', 'ila' or 'osa'
+    :rtype: str
+    """
+
+    if device.upper() == "ILA":
+        return "ila"
+    elif device.upper() == "OSA":
+        return "osa"
+    return "roadm"
+
+
+def _convert(path):
+    # Runs in the worker processes: parse one json file into a row of its monitor type
+    match = ARCHIVE_FILE_PATTERN.match(os.path.basename(path))
+    monitor = monitor_type(match.group("device"))
+    try:
+        with open(path) as file_input:
+            record = json.load(file_input)
+        return monitor, measurement_row(monitor, record, match.group("device"))
+    except (OSError, ValueError, AttributeError, TypeError) as e:
+        print("Skipping %s: %s" % (path, e))
+        return monitor, None
+
+
+class MeasurementArchive:
+
+    """Index and columnar cache for a directory of ``monitor_<device>_index<i>_uid<u>.json`` files written by the monitors. :meth:`build` parses every json file once, in parallel, into the Parquet store of :mod:`measurement_store`, and keeps a compact index of uid, index, device, time and measurement label pointing at the cached rows. Rebuilding only converts files that are new or changed since the last build. :meth:`query` filters the index and reads only the part files and columns it needs.
+
+    :param directory: Directory holding the json files
+    :type directory: str
+
+    :param cache: Directory of the index and the columnar cache. Default is a '.monitor_cache' directory inside ``directory``
+    :type cache: str
+
+    :param workers: Number of worker processes. Default is the number of CPUs
+    :type workers: int
+    """
+
+    def __init__(self, directory, cache=None, workers=None):
+
+        self.directory = directory
+        self.cache = cache or os.path.join(directory, ARCHIVE_CACHE_DIR)
+        self.workers = workers
+        self.index_path = os.path.join(self.cache, ARCHIVE_INDEX_FILE)
+        self.__index = None
+
+    @property
+    def index(self):
+        """Index of the archive as a pandas DataFrame, one row per json file. Empty before the first build."""
+
+        if self.__index is None:
+            import pandas as pd
+
+            if os.path.exists(self.index_path):
+                self.__index = pd.read_parquet(self.index_path)
+            else:
+                self.__index = pd.DataFrame(columns=ARCHIVE_INDEX_COLUMNS)
+        return self.__index
+
+    def scan(self):
+        """List the archive files of the directory.
+
+        :return: Tuples of file name, modification time and size
+        :rtype: list
+        """
+
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and ARCHIVE_FILE_PATTERN.match(entry.name):
+                    stat = entry.stat()
+                    files.append((entry.name, stat.st_mtime, stat.st_size))
+        return files
+
+    def build(self, chunk_size=MEASUREMENT_CHUNK_SIZE):
+        """Bring the index and the cache up to date with the directory. Files already indexed with an unchanged modification time and size are not read again, and files removed from the directory are dropped from the index. Cached rows of changed and removed files are dropped too: part files left with some of them are rewritten without them, and part files left with none are deleted, so the cache can also be read with :func:`measurement_store.load_measurements`.
+
+        :param chunk_size: Number of rows per cache part file
+        :type chunk_size: int
+
+        :return: Number of files converted
+        :rtype: int
+        """
+        import pandas as pd
+
+        index = self.index.set_index("file", drop=False)
+        files = self.scan()
+        pending = [
+            (name, mtime, size)
+            for name, mtime, size in files
+            if name not in index.index
+            or index.at[name, "mtime"] != mtime
+            or index.at[name, "size"] != size
+        ]
+
+        entries = []
+        if pending:
+            paths = [os.path.join(self.directory, name) for name, _, _ in pending]
+            with ProcessPoolExecutor(self.workers) as executor:
+                converted = list(
+                    executor.map(
+                        _convert,
+                        paths,
+                        chunksize=max(1, len(paths) // (4 * (os.cpu_count() or 1))),
+                    )
+                )
+            sinks = {}
+            for (name, mtime, size), (monitor, row) in zip(pending, converted):
+                if row is None:
+                    continue
+                if monitor not in sinks:
+                    sinks[monitor] = (
+                        MeasurementSink(self.cache, monitor, chunk_size=chunk_size),
+                        [],
+                    )
+                sink, waiting = sinks[monitor]
+                match = ARCHIVE_FILE_PATTERN.match(name)
+                waiting.append(
+                    {
+                        "file": name,
+                        "mtime": mtime,
+                        "size": size,
+                        "monitor": monitor,
+                        "device": match.group("device"),
+                        "index": match.group("index"),
+                        "uid": match.group("uid"),
+                        "time": row["time"],
+                        "measurement_label": row["measurement_label"],
+                        "row": len(sink.buffer),
+                    }
+                )
+                # Rows are buffered directly, so that the parts are flushed together with their index entries
+                sink.buffer.append(row)
+                if len(sink.buffer) >= chunk_size:
+                    entries += self.__flush(sink, waiting)
+            for sink, waiting in sinks.values():
+                entries += self.__flush(sink, waiting)
+
+        present = {name for name, _, _ in files}
+        updated = {entry["file"] for entry in entries}
+        kept = index[index["file"].isin(present - updated)]
+        frames = [frame for frame in (kept, pd.DataFrame(entries)) if len(frame)]
+        if frames:
+            new_index = pd.concat(frames, ignore_index=True)
+        else:
+            new_index = pd.DataFrame(columns=ARCHIVE_INDEX_COLUMNS)
+        new_index = new_index[ARCHIVE_INDEX_COLUMNS].reset_index(drop=True)
+        new_index["time"] = pd.to_datetime(new_index["time"])
+        new_index = self.__compact(new_index)
+
+        os.makedirs(self.cache, exist_ok=True)
+        new_index.to_parquet(self.index_path + ".tmp", index=False)
+        os.replace(self.index_path + ".tmp", self.index_path)
+        self.__index = new_index
+        # Only once the index no longer points at them
+        self.__remove_unreferenced(set(new_index["part"]))
+        return len(entries)
+
+    def __compact(self, index):
+        # Rewrite the parts holding rows the index no longer points at, keeping the rows it does
+        import pyarrow.parquet as pq
+
+        index = index.copy()
+        for part, rows in index.groupby("part"):
+            path = os.path.join(self.cache, part)
+            if pq.ParquetFile(path).metadata.num_rows == len(rows):
+                continue
+            rows = rows.sort_values("row")
+            table = pq.read_table(path).take(rows["row"].tolist())
+            sink = MeasurementSink(self.cache, os.path.dirname(part))
+            sink.buffer = table.to_pylist()
+            index.loc[rows.index, "part"] = os.path.relpath(sink.flush(), self.cache)
+            index.loc[rows.index, "row"] = range(len(rows))
+        return index
+
+    def __remove_unreferenced(self, parts):
+        # Delete the part files of the cache the index does not point at
+        for monitor in MEASUREMENT_SCHEMAS:
+            directory = os.path.join(self.cache, monitor)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if (
+                    name.startswith(MEASUREMENT_PART_PREFIX)
+                    and name.endswith(".parquet")
+                    and os.path.join(monitor, name) not in parts
+                ):
+                    os.remove(os.path.join(directory, name))
+
+    def __flush(self, sink, waiting):
+        part = os.path.relpath(sink.flush(), self.cache)
+        for entry in waiting:
+            entry["part"] = part
+        entries = list(waiting)
+        waiting.clear()
+        return entries
+
+    def query(self, device=None, start=None, end=None, label=None, columns=None):
+        """Load the cached measurements matching all the given conditions. Only the part files holding matching rows are read.
+
+        :param device: Device name as written in the file names, e.g. 'ILA', 'OSA' or a ROADM name
+        :type device: str
+
+        :param start: Earliest measurement time, inclusive
+        :type start: datetime or str
+
+        :param end: Latest measurement time, exclusive
+        :type end: datetime or str
+
+        :param label: Measurement label
+        :type label: str
+
+        :param columns: Columns to read, all columns of the schema by default
+        :type columns: list
+
+        :return: One row per measurement, ordered by time, with the name of the json file in the first column
+        :rtype: pandas.DataFrame
+        """
+        import pandas as pd
+        import pyarrow.parquet as pq
+
+        index = self.index
+        selected = pd.Series(True, index=index.index)
+        if device is not None:
+            selected &= index["device"] == device
+        if start is not None:
+            selected &= index["time"] >= pd.Timestamp(start)
+        if end is not None:
+            selected &= index["time"] < pd.Timestamp(end)
+        if label is not None:
+            selected &= index["measurement_label"] == label
+        matches = index[selected]
+
+        frames = []
+        for part, rows in matches.groupby("part"):
+            table = pq.read_table(os.path.join(self.cache, part), columns=columns)
+            frame = table.take(rows["row"].tolist()).to_pandas()
+            frame.insert(0, "file", rows["file"].tolist())
+            frame["_time"] = rows["time"].tolist()
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=["file"] + (columns or []))
+        result = pd.concat(frames, ignore_index=True)
+        result = result.sort_values("_time", kind="stable").drop(columns="_time")
+        return result.reset_index(drop=True)
@@ -0,0 +1,411 @@
+import os
+import json
+import time
+import operator
+from datetime import datetime
+
+MEASUREMENT_CHUNK_SIZE = 500  # records buffered before a part file is written
+MEASUREMENT_FLUSH_INTERVAL = None  # s, longest a record stays buffered, or None
+MEASUREMENT_COMPRESSION = "zstd"
+MEASUREMENT_PART_PREFIX = "part-"
+MEASUREMENT_FILTER_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda field, values: field.isin(values),
+}
+
+#: Columns shared by all monitor types
+MEASUREMENT_COMMON_COLUMNS = [
+    ("uid", "string"),
+    ("index", "string"),
+    ("repeat_index", "int64"),
+    ("device", "string"),
+    ("time", "timestamp"),
+    ("measurement_label", "string"),
+]
+
+#: Typed columns of each ILA direction, 'ab_<field>' and 'ba_<field>', each taken from the first key present in the telemetry record of the direction (see :meth:`ila.ILA.get_telemetry`)
+MEASUREMENT_ILA_FIELDS = {
+    "gain": ("actual-gain", "actual-gain-instant"),
+    "target_gain": ("target-gain",),
+    "input_power": ("input-power-total", "input-power-total-instant"),
+    "output_power": ("output-power-total", "output-power-total-instant"),
+    "osc_power": ("osc-input-power", "osc-input-power-instant"),
+}
+
+#: Stable schema of each monitor type. Whatever a record holds beyond these columns is kept as a JSON string in the 'extra' column.
+MEASUREMENT_SCHEMAS = {
+    "roadm": MEASUREMENT_COMMON_COLUMNS
+    + [
+        ("%s_%s" % (module, column), kind)
+        for module in ("mux", "demux")
+        for column, kind in (
+            ("channel", "int32_list"),
+            ("input_power", "float32_list"),
+            ("output_power", "float32_list"),
+            ("channel_attenuation", "float32_list"),
+            ("open_channel_index", "int32_list"),
+            ("ocm_channel", "int32_list"),
+            ("ocm_power", "float32_list"),
+        )
+    ]
+    + [
+        ("%s_%s" % (amp, column), "float32_list")
+        for amp in ("booster", "preamp")
+        for column in ("input_power", "output_power", "gain_power")
+    ]
+    + [("extra", "string")],
+    "ila": MEASUREMENT_COMMON_COLUMNS
+    + [
+        ("%s_%s" % (amp, field), "float32")
+        for amp in ("ab", "ba")
+        for field in MEASUREMENT_ILA_FIELDS
+    ]
+    + [("extra", "string")],
+    "osa": MEASUREMENT_COMMON_COLUMNS
+    + [("osa_reading", "float32_list"), ("extra", "string")],
+}
+
+
+def _arrow_schema(monitor):
+    import pyarrow as pa
+
+    types = {
+        "string": pa.string(),
+        "int64": pa.int64(),
+        "timestamp": pa.timestamp("us"),
+        "float32": pa.float32(),
+        "int32_list": pa.list_(pa.int32()),
+        "float32_list": pa.list_(pa.float32()),
+    }
+    return pa.schema(
+        [(name, types[kind]) for name, kind in MEASUREMENT_SCHEMAS[monitor]]
+    )
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _time(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _channels(pairs):
+    return [_int(channel) for channel, _ in pairs]
+
+
+def _powers(pairs):
+    return [_float(power) for _, power in pairs]
+
+
+def _roadm_row(record):
+    setup = record.get("measurement_setup") or {}
+    data = dict(record.get("measurement_data") or {})
+    row = {
+        "uid": _text(record.get("uid")),
+        "index": _text(setup.get("index")),
+        "repeat_index": _int(setup.get("repeat_index")),
+        "device": _text(setup.get("device_name")),
+        "time": _time(setup.get("date")),
+        "measurement_label": _text(record.get("measurement_label")),
+    }
+    for module in ("mux", "demux"):
+        input_power = data.pop(module + "_input_power", [])
+        row[module + "_channel"] = _channels(input_power)
+        row[module + "_input_power"] = _powers(input_power)
+        row[module + "_output_power"] = _powers(data.pop(module + "_output_power", []))
+        row[module + "_channel_attenuation"] = _powers(
+            data.pop(module + "_channel_attenuation", [])
+        )
+        row[module + "_open_channel_index"] = [
+            _int(channel) for channel in data.pop(module + "_open_channel_index", [])
+        ]
+        ocm_power = data.pop(module + "_ocm_power", [])
+        row[module + "_ocm_channel"] = _channels(ocm_power)
+        row[module + "_ocm_power"] = _powers(ocm_power)
+    for amp in ("booster", "preamp"):
+        monitor = dict(data.pop(amp, None) or {})
+        for column in ("input_power", "output_power", "gain_power"):
+            row["%s_%s" % (amp, column)] = [
+                _float(power) for power in monitor.pop(column.replace("_", "-"), [])
+            ]
+        if monitor:
+            data[amp] = monitor
+    extra = {
+        key: value
+        for key, value in record.items()
+        if key not in ("uid", "measurement_label", "measurement_data")
+    }
+    extra["measurement_data"] = data
+    row["extra"] = json.dumps(extra)
+    return row
+
+
+def _labelled_row(record, device):
+    return {
+        "uid": _text(record.get("uid")),
+        "index": _text(record.get("index")),
+        "repeat_index": _int(record.get("repeat_index")),
+        "device": _text(record.get("device_name", device)),
+        "time": _time(record.get("time")),
+        "measurement_label": _text(record.get("measurement_label")),
+    }
+
+
+def _ila_row(record, device):
+    row = _labelled_row(record, device)
+    extra = {
+        key: value
+        for key, value in record.items()
+        if key not in ("uid", "index", "repeat_index", "time", "measurement_label")
+    }
+    # Records written before the telemetry format hold the raw reply instead of 'ab' and 'ba'
+    for amp in ("ab", "ba"):
+        telemetry = extra.pop(amp, None)
+        if not isinstance(telemetry, dict):
+            if telemetry is not None:
+                extra[amp] = telemetry
+            telemetry = {}
+        telemetry = dict(telemetry)
+        for field, keys in MEASUREMENT_ILA_FIELDS.items():
+            key = next((key for key in keys if key in telemetry), None)
+            row["%s_%s" % (amp, field)] = (
+                None if key is None else _float(telemetry.pop(key))
+            )
+        if telemetry:
+            extra[amp] = telemetry
+    row["extra"] = json.dumps(extra) if extra else None
+    return row
+
+
+def osa_reading_values(reading):
+    """Get the power levels of the 'osa_reading' field of an OSA measurement, which is a list of numbers, or the comma-separated string returned by the OSA in the files written by earlier versions of ``OSAMonitor``.
+
+    :param reading: OSA reading
+    :type reading: list or str
+
+    :return: Power level [dBm] of each sampled data point, None for the values that are not numbers
+    :rtype: list
+    """
+
+    if reading is None:
+        return []
+    if isinstance(reading, str):
+        reading = reading.strip().split(",") if reading.strip() else []
+    return [_float(power) for power in reading]
+
+
+def _osa_row(record, device):
+    row = _labelled_row(record, device)
+    row["osa_reading"] = osa_reading_values(record.get("osa_reading"))
+    row["extra"] = json.dumps(
+        {
+            key: value
+            for key, value in record.items()
+            if key
+            not in (
+                "uid",
+                "index",
+                "repeat_index",
+                "device_name",
+                "time",
+                "measurement_label",
+                "osa_reading",
+            )
+        }
+    )
+    return row
+
+
+def measurement_row(monitor, record, device=None):
+    """Convert a measurement record to a row of the schema of its monitor type.
+
+    :param monitor: Monitor type, one of 'roadm', 'ila' or 'osa'
+    :type monitor: str
+
+    :param record: Measurement record, i.e. the dictionary a monitor writes to its json file
+    :type record: dict
+
+    :param device: Device name, used when the record does not name its device
+    :type device: str
+
+    :return: Column values keyed by column name
+    :rtype: dict
+    """
+
+    if monitor == "roadm":
+        return _roadm_row(record)
+    elif monitor == "ila":
+        return _ila_row(record, device)
+    return _osa_row(record, device)
+
+
+class MeasurementSink:
+
+    """Append-only store for monitor measurements. Records are buffered in memory and written as compressed Parquet part files of up to ``chunk_size`` records, or of the records buffered for ``flush_interval`` seconds, one directory per monitor type, so long campaigns produce a few large files instead of one json file per measurement. Each monitor type has a stable schema (see ``MEASUREMENT_SCHEMAS``); fields outside the schema are kept as json in the 'extra' column. The sink can be used as a context manager, which flushes the buffer on exit.
+
+    :param path: Root directory of the store
+    :type path: str
+
+    :param monitor: Monitor type, one of 'roadm', 'ila' or 'osa'
+    :type monitor: str
+
+    :param chunk_size: Number of records written per part file
+    :type chunk_size: int
+
+    :param compression: Parquet compression codec
+    :type compression: str
+
+    :param flush_interval: Longest time in seconds a record stays buffered before it is written, checked at every append. A low value bounds what a crash loses, at the cost of smaller part files. Records are written by full chunks only by default
+    :type flush_interval: float
+
+    :raises ValueError: If the monitor type is unknown
+    """
+
+    def __init__(
+        self,
+        path,
+        monitor,
+        chunk_size=MEASUREMENT_CHUNK_SIZE,
+        compression=MEASUREMENT_COMPRESSION,
+        flush_interval=MEASUREMENT_FLUSH_INTERVAL,
+    ):
+
+        if monitor not in MEASUREMENT_SCHEMAS:
+            raise ValueError(
+                "Invalid monitor type, please choose one of %s"
+                % str(list(MEASUREMENT_SCHEMAS))
+            )
+        self.path = os.path.join(path, monitor)
+        self.monitor = monitor
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.buffered_at = None
+        self.part = 0
+        os.makedirs(self.path, exist_ok=True)
+
+    def append(self, record, device=None):
+        """Add a measurement record, i.e. the dictionary a monitor would write to its json file. A part file is written once the buffer holds ``chunk_size`` records, or its oldest record has waited ``flush_interval`` seconds.
+
+        :param record: Measurement record
+        :type record: dict
+
+        :param device: Device name, used when the record does not name its device
+        :type device: str
+        """
+
+        self.append_row(measurement_row(self.monitor, record, device))
+
+    def append_row(self, row):
+        """Add a record already converted with :func:`measurement_row`.
+
+        :param row: Row of the monitor type of the sink
+        :type row: dict
+        """
+
+        if not self.buffer:
+            self.buffered_at = time.monotonic()
+        self.buffer.append(row)
+        if len(self.buffer) >= self.chunk_size or (
+            self.flush_interval is not None
+            and time.monotonic() - self.buffered_at >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records to a new part file.
+
+        :return: Path of the part file, or None if the buffer was empty
+        :rtype: str
+        """
+
+        if not self.buffer:
+            return None
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(self.buffer, schema=_arrow_schema(self.monitor))
+        file_name = "%s%s-%d-%05d.parquet" % (
+            MEASUREMENT_PART_PREFIX,
+            datetime.now().strftime("%Y%m%d%H%M%S%f"),
+            os.getpid(),
+            self.part,
+        )
+        file_path = os.path.join(self.path, file_name)
+        # Readers never see a partially written part
+        pq.write_table(table, file_path + ".tmp", compression=self.compression)
+        os.replace(file_path + ".tmp", file_path)
+        self.part += 1
+        self.buffer = []
+        return file_path
+
+    def close(self):
+        """Flush the buffered records."""
+
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def load_measurements(path, monitor, columns=None, filters=None):
+    """Load the measurements of a monitor type from a store into a pandas DataFrame.
+
+    :param path: Root directory of the store
+    :type path: str
+
+    :param monitor: Monitor type, one of 'roadm', 'ila' or 'osa'
+    :type monitor: str
+
+    :param columns: Columns to read, all columns by default
+    :type columns: list
+
+    :param filters: Conditions combined with 'and', e.g. ``[("device", "==", "roadm_3")]``. Operators are ==, !=, <, <=, >, >= and in.
+    :type filters: list
+
+    :return: One row per measurement
+    :rtype: pandas.DataFrame
+    """
+    import pyarrow.dataset as ds
+
+    directory = os.path.join(path, monitor)
+    files = sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith(MEASUREMENT_PART_PREFIX) and name.endswith(".parquet")
+    )
+    dataset = ds.dataset(files, schema=_arrow_schema(monitor), format="parquet")
+    expression = None
+    for column, op, value in filters or []:
+        condition = MEASUREMENT_FILTER_OPERATORS[op](ds.field(column), value)
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
@@ -1,21 +1,22 @@
 import time
 import json
 from datetime import datetime
-import matplotlib
-import matplotlib.pyplot as plt
-import copy
 from collections import OrderedDict
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from lumentum import (
     Lumentum,
     LUMENTUM_DEFAULT_WSS_LOSS,
     LUMENTUM_CHANNEL_QUANTITY,
-    LUMENTUM_WSS_CHANNEL_FREQ_CENTER_LIST,
+    ip_map,
 )
-import xmltodict
-from polatis import Polatis
-from ila import ILA
-from osa import OSA
+from utils import channel_grid
+from instrumentation import parse_xml
+from measurement_store import MEASUREMENT_ILA_FIELDS
+
+ROADM_PORTS_FILE = "/etc/tcdona2/ports.csv"
+SPAN_ILAS = ("ila_1", "ila_2", "ila_3")
+#: Fields of each ILA direction in the span records, each taken from the first telemetry key present. The typed ILA columns of the measurement store
+SPAN_ILA_FIELDS = MEASUREMENT_ILA_FIELDS
 
 # matplotlib.use('module://drawilleplot')
 # matplotlib.use('svg')
@@ -84,17 +85,20 @@ class Monitor:
 
 
 class RoadmMonitor(Monitor):
-    def __init__(self, roadm_object):
+    def __init__(self, roadm_object, ports_file=ROADM_PORTS_FILE):
         super().__init__(roadm_object)
 
         self.roadm = self.device
         self.device_name = self.roadm.device_name
+        self.roadm_ip_address = ip_map.get(self.device_name)
         self.device_model = "Lumentum ROADM-20 Whitebox"
         self.roadm_wss_channel_freq_center_start = 191350.0
         self.roadm_wss_channel_spacing = 50.0
         self.roadm_wss_channel_bw = 50.0
 
-        ports = pd.read_csv("/etc/tcdona2/ports.csv", sep="\t", index_col="Name")
+        import pandas as pd
+
+        ports = pd.read_csv(ports_file, sep="\t", index_col="Name")
         self.p1_mux_port = int(ports.at["Lumentum_5_p1", "Out"])
         self.p1_demux_port = int(ports.at["Lumentum_5_p1", "In"])
         self.line_out_port = int(ports.at["Lumentum_5_line", "In"])
@@ -103,7 +107,15 @@ class RoadmMonitor(Monitor):
         # Loaded from Lumentum class
         self.roadm_wss_channel_attenuation_default = LUMENTUM_DEFAULT_WSS_LOSS
         self.roadm_wss_num_channel = LUMENTUM_CHANNEL_QUANTITY
-        self.roadm_wss_channel_freq_center_list = LUMENTUM_WSS_CHANNEL_FREQ_CENTER_LIST
+        self.roadm_wss_channel_grid = channel_grid(
+            self.roadm_wss_channel_bw,
+            self.roadm_wss_channel_spacing,
+            self.roadm_wss_channel_freq_center_start,
+            self.roadm_wss_num_channel,
+        )
+        self.roadm_wss_channel_freq_center_list = (
+            self.roadm_wss_channel_grid.centre.tolist()
+        )
         self.start_timer = "NaN"
         self.monitor_flag = False
 
@@ -199,6 +211,7 @@ class RoadmMonitor(Monitor):
         label_measurement_setup=None,
         uid=None,
         get_only=False,
+        sink=None,
     ):
 
         print(measurement_label, "\n")
@@ -234,7 +247,8 @@ class RoadmMonitor(Monitor):
             data_output["measurement_label"] = measurement_label
 
             cur_measurement_data = self.measurement_sweep(debug=debug)
-            data_output["measurement_data"] = copy.deepcopy(cur_measurement_data)
+            # measurement_sweep builds a new dictionary on every call
+            data_output["measurement_data"] = cur_measurement_data
 
         except KeyboardInterrupt:
             print("EDFA measurement canceled by user. Save already collected data.")
@@ -268,8 +282,11 @@ class RoadmMonitor(Monitor):
                 print(
                     "ROADM measurement time:" + str((datetime.now() - self.start_timer))
                 )
-                with open(file_name_json, "w") as file_output:
-                    json.dump(data_output, file_output, indent=4)
+                if sink is not None:
+                    sink.append(data_output, device=self.device_name)
+                else:
+                    with open(file_name_json, "w") as file_output:
+                        json.dump(data_output, file_output, indent=4)
 
     def measurement_sweep(self, debug=True):
 
@@ -396,6 +413,9 @@ class RoadmMonitor(Monitor):
         return_plot=False,
     ):
 
+        import matplotlib
+        import matplotlib.pyplot as plt
+
         if refresh == True or self.monitor_flag == False:
             self.record_monitor_data()
 
@@ -469,8 +489,10 @@ class PolatisMonitor(Monitor):
 
 class ILAMonitor:
     def __init__(self, device=1):
+        from ila import ILA
 
         self.ila = ILA(device)
+        self.device_name = device
         print("ILA initialized...")
 
     @staticmethod
@@ -492,22 +514,14 @@ class ILAMonitor:
                 </open-optical-device>
                 """
 
-        for attempt in range(10):
-            try:
-                xml_data = str(self.ila.m.get(filter=("subtree", filter)))
-            except Exception as e:
-                print(e)
-                print("Retrying... Attempt number %s" % str(attempt + 1))
-            else:
-                break
-        else:
-            print("All Attempts exhausted.. Please debug RPC")
+        # The session of the ILA retries the read, see retry.SESSION_POLICY
+        xml_data = str(self.ila.m.get(filter=("subtree", filter)))
 
         if save == True and fname != "":
             with open(fname, "w") as f:
                 f.write(xml_data)
 
-        parser = xmltodict.parse(xml_data)
+        parser = parse_xml(xml_data)
 
         return parser
 
@@ -517,28 +531,28 @@ class ILAMonitor:
                 <open-optical-device xmlns="http://org/openroadm/device">
                 </open-optical-device>
                 """
-        for attempt in range(10):
-            try:
-                xml_data = str(
-                    self.ila.m.get_config(source="running", filter=("subtree", filter))
-                )
-
-            except Exception as e:
-                print(e)
-                print("Retrying... Attempt number %s" % str(attempt + 1))
-            else:
-                break
-        else:
-            print("All Attempts exhausted.. Please debug RPC")
+        xml_data = str(
+            self.ila.m.get_config(source="running", filter=("subtree", filter))
+        )
 
         if save == True and fname != "":
             with open(fname, "w") as f:
                 f.write(xml_data)
 
-        parser = xmltodict.parse(xml_data)["nc:rpc-reply"]
+        parser = parse_xml(xml_data)["nc:rpc-reply"]
 
         return parser
 
+    def get_edfa_measurement_v3(self):
+        """Get the measurements of both directions of the ILA from the subtrees the measurement uses only, see :meth:`ila.ILA.get_telemetry`. The records have the keys of :meth:`parse_measurement_v1`, with numbers and booleans converted.
+
+        :return: Records of the 'ab' and 'ba' directions
+        :rtype: tuple
+        """
+
+        telemetry = self.ila.get_telemetry()
+        return telemetry["ab"], telemetry["ba"]
+
     def parse_measurement_v1(self, parser):
 
         # activeAlarms = parser['rpc-reply']['data']['active-alarm-list']['activeAlarms']
@@ -646,7 +660,7 @@ class ILAMonitor:
         while flag:
             inp = input("Press Enter to nontinue, Any key to exit...")
             if inp == "":
-                m_ab, m_ba = self.get_edfa_data()
+                m_ab, m_ba = self.get_edfa_measurement_v3()
 
                 if edfa == "ab":
                     m_ = m_ab
@@ -661,13 +675,21 @@ class ILAMonitor:
                 break
 
     def write_json_data(
-        self, measurement_label, DATAPREFIX="", index="", repeat_index=1, uid=None
+        self,
+        measurement_label,
+        DATAPREFIX="",
+        index="",
+        repeat_index=1,
+        uid=None,
+        sink=None,
     ):
 
         self.start_timer = datetime.now()
 
+        data_output = {}
         try:
-            data_output = self.get_edfa_measurement_v1()
+            # Only the subtrees the measurement uses, with one record per direction
+            data_output["ab"], data_output["ba"] = self.get_edfa_measurement_v3()
         except Exception as e:
             print("ILA measurement canceled by exception. Save already collected data.")
             print(e)
@@ -689,36 +711,220 @@ class ILAMonitor:
                 + str(datetime.now().strftime("%Y.%m.%d.%H.%M.%S"))
             )
             print("Measurement time:" + str((datetime.now() - self.start_timer)))
-            with open(file_name_json, "w") as file_output:
-                json.dump(data_output, file_output, indent=4)
+            if sink is not None:
+                sink.append(data_output, device=self.device_name)
+            else:
+                with open(file_name_json, "w") as file_output:
+                    json.dump(data_output, file_output, indent=4)
+
+
+class SpanMonitor:
+
+    """Monitor of a whole span: the ILAs along it and the ROADMs at its ends. Every cycle samples all the devices concurrently, one thread per device, over sessions opened once, so a cycle lasts as long as the slowest device rather than the sum of all of them. The readings are time-aligned into one record per cycle: each device reading is stamped with the middle of its request, the cycle with the mean of those stamps, and 'skew' is the spread between the earliest and the latest reading.
+
+    For each ILA direction ('ab' and 'ba') the record holds the gain, target gain, input and output power and OSC power, taken from the telemetry of :meth:`ila.ILA.get_telemetry` (see ``SPAN_ILA_FIELDS``); for each ROADM, the input and output power, gain and targets of the booster and the preamp. A device that fails is reported under 'errors' without stopping the cycle.
+
+    :param ilas: ILA names, or ILA objects keyed by name
+    :type ilas: list or dict
+
+    :param roadms: ROADM names, or Lumentum objects keyed by name
+    :type roadms: list or dict
+    """
+
+    def __init__(self, ilas=SPAN_ILAS, roadms=()):
+
+        if not isinstance(ilas, dict):
+            from ila import ILA
+
+            ilas = {name: ILA(name) for name in ilas}
+        if not isinstance(roadms, dict):
+            roadms = {name: Lumentum(name) for name in roadms}
+        self.ilas = dict(ilas)
+        self.roadms = dict(roadms)
+        self.cycle = 0
+        self.executor = None
+        print("Span monitor initialized with %s..." % ", ".join(self.devices()))
+
+    def devices(self):
+        """Get the names of the monitored devices.
+
+        :return: ILA names followed by ROADM names
+        :rtype: list
+        """
+
+        return list(self.ilas) + list(self.roadms)
+
+    def sample_ila(self, name):
+        """Read the per-direction measurements of an ILA.
+
+        :param name: ILA name
+        :type name: str
+
+        :return: Readings keyed by direction
+        :rtype: dict
+        """
+
+        telemetry = self.ilas[name].get_telemetry()
+        return {
+            amp: {
+                field: next((record[key] for key in keys if key in record), None)
+                for field, keys in SPAN_ILA_FIELDS.items()
+            }
+            for amp, record in telemetry.items()
+        }
+
+    def sample_roadm(self, name):
+        """Read the EDFA measurements of a ROADM.
+
+        :param name: ROADM name
+        :type name: str
+
+        :return: Readings keyed by EDFA module, 'booster' and 'preamp'
+        :rtype: dict
+        """
+
+        edfa_info = self.roadms[name].edfa_get_info()
+        return {
+            module: {
+                "gain": info["output_power"] - info["input_power"],
+                "input_power": info["input_power"],
+                "output_power": info["output_power"],
+                "control_mode": info["control_mode"],
+                "target_gain": info["target_gain"],
+                "target_power": info["target_power"],
+            }
+            for module, info in edfa_info.items()
+        }
+
+    def __timed(self, read, name):
+        start = time.time()
+        reading = read(name)
+        end = time.time()
+        return start, end, reading
+
+    def sample(self):
+        """Sample all the devices concurrently.
+
+        :return: Record of the cycle, with its number ('cycle'), aligned time ('time'), spread of the reading times in seconds ('skew'), duration in seconds ('duration'), the readings keyed by device name ('devices'), each with the time of the reading and the latency of the device, and the errors keyed by device name ('errors')
+        :rtype: dict
+        """
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max(len(self.devices()), 1), thread_name_prefix="span-monitor"
+            )
+        start = time.time()
+        futures = {
+            name: self.executor.submit(self.__timed, self.sample_ila, name)
+            for name in self.ilas
+        }
+        futures.update(
+            {
+                name: self.executor.submit(self.__timed, self.sample_roadm, name)
+                for name in self.roadms
+            }
+        )
+
+        devices = {}
+        errors = {}
+        times = []
+        for name, future in futures.items():
+            try:
+                request_start, request_end, reading = future.result()
+            except Exception as e:
+                errors[name] = str(e)
+                continue
+            times.append((request_start + request_end) / 2.0)
+            reading["time"] = str(datetime.fromtimestamp(times[-1]))
+            reading["latency"] = request_end - request_start
+            devices[name] = reading
+
+        self.cycle += 1
+        return {
+            "cycle": self.cycle,
+            "time": str(
+                datetime.fromtimestamp(sum(times) / len(times) if times else start)
+            ),
+            "skew": max(times) - min(times) if times else None,
+            "duration": time.time() - start,
+            "devices": devices,
+            "errors": errors,
+        }
+
+    def run(self, cycles, interval=0.0, sink=None):
+        """Sample the span repeatedly.
+
+        :param cycles: Number of cycles
+        :type cycles: int
+
+        :param interval: Time in seconds between the starts of two cycles. Cycles run back to back by default
+        :type interval: float
+
+        :param sink: Measurement sink of the 'ila' type the records are appended to, under the device name 'span', and flushed once the run ends or fails. The records are returned instead by default
+        :type sink: measurement_store.MeasurementSink
+
+        :return: Records of the cycles, empty with a sink
+        :rtype: list
+        """
+
+        records = []
+        next_cycle = time.monotonic()
+        try:
+            for _ in range(cycles):
+                record = self.sample()
+                if sink is not None:
+                    sink.append(record, device="span")
+                else:
+                    records.append(record)
+                next_cycle += interval
+                delay = next_cycle - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            if sink is not None:
+                sink.flush()
+        return records
+
+    def close(self):
+        """Stop the sampling threads."""
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
 class OSAMonitor:
     def __init__(self):
+        from osa import OSA
 
         self.osa = OSA()
+        self.device_name = "OSA"
 
         print("OSA Initialized...")
 
     def measurement_sweep(self):
+        """Sweep the OSA and read the trace in memory A.
 
-        self.osa.osa_sweep()
-        time.sleep(1)
-        self.osa.osa_sweep()
-        time.sleep(2)
+        :return: Power level [dBm] of each sampled data point, rounded to 0.01 dB. Written as the 'osa_reading' field of the json files. Files written before this format hold the comma-separated string returned by the OSA instead, see :func:`measurement_store.osa_reading_values`
+        :rtype: list
+        """
 
-        for attempt in range(3):
-            try:
-                data = self.osa.query("DQA?")
-            except Exception as e:
-                print(e)
-                print("Attempt %s fail, retry..." % str(attempt + 1))
-            else:
-                newdata = data.rstrip("\r\n")
-                return newdata
-        else:
+        self.osa.settled_sweep()
+
+        try:
+            data = self.osa.get_data("A")
+        except RuntimeError as e:
             print("Exiting, all attempts failed")
-            raise Exception("OSA Sweep failed")
+            raise Exception("OSA Sweep failed") from e
+
+        # float32 -> float keeps the 0.01 dB resolution of the OSA in the json output
+        return data.astype(float).round(2).tolist()
 
     def get_component_info(
         self, measurement_label="", index="", repeat_index=1, uid=None
@@ -743,7 +949,13 @@ class OSAMonitor:
         self.osa.get_image(dir=dir, prefix=prefix)
 
     def write_json_data(
-        self, measurement_label, DATAPREFIX="", index="", repeat_index=1, uid=None
+        self,
+        measurement_label,
+        DATAPREFIX="",
+        index="",
+        repeat_index=1,
+        uid=None,
+        sink=None,
     ):
 
         self.start_timer = datetime.now()
@@ -770,5 +982,8 @@ class OSAMonitor:
                 + str(datetime.now().strftime("%Y.%m.%d.%H.%M.%S"))
             )
             print("Measurement time:" + str((datetime.now() - self.start_timer)))
-            with open(file_name_json, "w") as file_output:
-                json.dump(data_output, file_output, indent=4)
+            if sink is not None:
+                sink.append(data_output, device=self.device_name)
+            else:
+                with open(file_name_json, "w") as file_output:
+                    json.dump(data_output, file_output, indent=4)
@@ -1,21 +1,241 @@
-import pyvisa
-import matplotlib.pyplot as plt
-from utils import check_patch_owners
+import time
+import numpy as np
+from datetime import datetime
+from functools import cached_property
+from retry import RetryPolicy
+from conversions import dbm_to_mw, mw_to_dbm
+from utils import (
+    check_patch_owners,
+    channel_grid,
+    wdm_channel_list,
+    CHANNEL_WIDTH,
+    CHANNEL_SPACING,
+    FIRST_CENTRAL_FREQ,
+)
+
+OSA_RESOURCE_NAME = "GPIB0::8::INSTR"
+OSA_DEVICE_NAME = "osa"  # circuit breaker and metrics label of the OSA
+OSA_TRACE_READ_TRIES = 3
+OSA_RETRY_POLICY = RetryPolicy(attempts=OSA_TRACE_READ_TRIES, base_delay=0.5)
+OSA_SWEEP_COMPLETE = 3  # ESR2 value at the end of a sweep, see page 9-58 and 8-16 of the manual: ms9710c.pdf
+OSA_SWEEP_TIMEOUT = 120.0  # s
+OSA_POLL_INTERVAL = 0.05  # s, first delay between two status polls
+OSA_POLL_MAX_INTERVAL = 2.0  # s, the delay doubles after every poll up to this value
+# Settle strategies: one sweep per acquisition, or an extra discarded sweep after a configuration change
+OSA_SETTLE_SINGLE = "single"
+OSA_SETTLE_DISCARD_AFTER_CHANGE = "discard-after-change"
+OSA_SETTLE_POLICIES = (OSA_SETTLE_SINGLE, OSA_SETTLE_DISCARD_AFTER_CHANGE)
+OSA_SPEED_OF_LIGHT = 299792458.0  # m/s, so c / wavelength[nm] gives GHz
+OSA_OSNR_REFERENCE_BANDWIDTH = 0.1  # nm
+OSA_PEAK_MIN_EXCURSION = 10.0  # dB above the median (noise floor) of the trace
+
+
+class OSATrace:
+
+    """A single OSA acquisition: the power samples, their wavelength axis and the sweep configuration read once when the trace was acquired. Derived metrics (peaks, per-channel power, OSNR) are computed on first access and cached, so no further instrument queries are needed once the trace exists.
+
+    :param wavelength: Wavelength of each sampled data point in nm
+    :type wavelength: numpy.ndarray
+
+    :param power: Power level of each sampled data point in dBm
+    :type power: numpy.ndarray
+
+    :param config: Sweep configuration of the acquisition (start, stop, sampling_points, resolution, memory, time)
+    :type config: dict
+    """
+
+    def __init__(self, wavelength, power, config):
+
+        self.wavelength = np.asarray(wavelength, dtype=np.float32)
+        self.power = np.asarray(power, dtype=np.float32)
+        self.config = config
+
+    def __len__(self):
+        return len(self.power)
+
+    @cached_property
+    def frequency(self):
+        """Frequency of each sampled data point in GHz, in the same order as the samples."""
+
+        return OSA_SPEED_OF_LIGHT / self.wavelength.astype(np.float64)
+
+    @cached_property
+    def power_mw(self):
+        """Power of each sampled data point in mW."""
+
+        return dbm_to_mw(self.power)
+
+    @cached_property
+    def resolution(self):
+        """Resolution bandwidth of the acquisition in nm."""
+
+        return float(self.config["resolution"])
+
+    @cached_property
+    def peaks(self):
+        """List of peaks in the trace as (wavelength [nm], power [dBm]) tuples. A peak is a local maximum at least ``OSA_PEAK_MIN_EXCURSION`` dB above the median level of the trace."""
+
+        p = self.power
+        if len(p) < 3:
+            return []
+        floor = np.median(p) + OSA_PEAK_MIN_EXCURSION
+        mid = p[1:-1]
+        idx = np.flatnonzero((mid > p[:-2]) & (mid >= p[2:]) & (mid > floor)) + 1
+        return [(float(self.wavelength[i]), float(p[i])) for i in idx]
+
+    @cached_property
+    def channel_power(self):
+        """Integrated power [dBm] of each channel on the default 95 x 50 GHz grid, see :meth:`get_channel_power`."""
+
+        return self.get_channel_power()
+
+    @cached_property
+    def osnr(self):
+        """OSNR [dB] of each channel on the default 95 x 50 GHz grid, see :meth:`get_osnr`."""
+
+        return self.get_osnr()
+
+    def __channel_bounds(
+        self, channels, channel_width, channel_spacing, first_central_freq
+    ):
+        # Sample index range [lo, hi) of each channel on a frequency-sorted view of the trace
+        order = np.argsort(self.frequency)
+        freq = self.frequency[order]
+        edges = channel_grid(channel_width, channel_spacing, first_central_freq).ranges(
+            channels
+        )
+        lo = np.searchsorted(freq, edges[:, 0], side="left")
+        hi = np.searchsorted(freq, edges[:, 2], side="right")
+        return order, freq, edges, lo, hi
+
+    def get_channel_power(
+        self,
+        channels=wdm_channel_list,
+        channel_width=CHANNEL_WIDTH,
+        channel_spacing=CHANNEL_SPACING,
+        first_central_freq=FIRST_CENTRAL_FREQ,
+    ):
+        """Integrate the power of each channel over its band on the grid given by ``utils.channel_grid``. The linear power of the samples in the band is summed and scaled by the sample spacing over the resolution bandwidth. Channels without samples inside the trace are left out.
+
+        :param channels: Channel numbers to integrate
+        :type channels: list
+
+        :return: Integrated power in dBm keyed by channel number
+        :rtype: dict
+        """
+
+        order, freq, edges, lo, hi = self.__channel_bounds(
+            channels, channel_width, channel_spacing, first_central_freq
+        )
+        cumsum = np.concatenate(([0.0], np.cumsum(self.power_mw[order])))
+        step = abs(float(self.wavelength[-1] - self.wavelength[0])) / max(
+            len(self) - 1, 1
+        )
+        scale = step / self.resolution
+
+        dbm = mw_to_dbm((cumsum[hi] - cumsum[lo]) * scale)
+        return {
+            ch: float(power)
+            for ch, power, found in zip(channels, dbm, hi > lo)
+            if found
+        }
+
+    def get_osnr(
+        self,
+        channels=wdm_channel_list,
+        channel_width=CHANNEL_WIDTH,
+        channel_spacing=CHANNEL_SPACING,
+        first_central_freq=FIRST_CENTRAL_FREQ,
+        reference_bandwidth=OSA_OSNR_REFERENCE_BANDWIDTH,
+    ):
+        """Estimate the OSNR of each channel. The signal is the peak power inside the channel band and the noise is interpolated from the samples at the two channel edges, and the result is normalised to the reference bandwidth. Channels without samples inside the trace are left out.
+
+        :param channels: Channel numbers to evaluate
+        :type channels: list
+
+        :param reference_bandwidth: Noise reference bandwidth in nm. Default is 0.1 nm.
+        :type reference_bandwidth: float
+
+        :return: OSNR in dB keyed by channel number
+        :rtype: dict
+        """
+
+        order, freq, edges, lo, hi = self.__channel_bounds(
+            channels, channel_width, channel_spacing, first_central_freq
+        )
+        power_mw = self.power_mw[order]
+        n = len(freq)
+        bw_correction = 10 * np.log10(self.resolution / reference_bandwidth)
+
+        osnr = {}
+        for ch, l, h in zip(channels, lo, hi):
+            if h <= l:
+                continue
+            signal = power_mw[l:h].max()
+            noise = (power_mw[min(l, n - 1)] + power_mw[min(h - 1, n - 1)]) / 2.0
+            if signal > noise > 0:
+                osnr[ch] = float(
+                    10 * np.log10((signal - noise) / noise) + bw_correction
+                )
+        return osnr
+
+    def to_dict(self):
+        """Convert the trace to a json serialisable dictionary.
+
+        :return: Sweep configuration, wavelength [nm] and power [dBm] of the trace
+        :rtype: dict
+        """
+
+        return {
+            "config": self.config,
+            "wavelength": self.wavelength.astype(float).round(4).tolist(),
+            "power": self.power.astype(float).round(2).tolist(),
+        }
 
 
 class OSA:
 
     """Class to interface with the Anritsu Optical Spectrum Analyzer (OSA). The Anritsu OSA is connected to the testbed by GPIB interface. Hence, the class uses the pyvisa library to interact with the OSA. Initialize the OSA. This method opens the resource manager and connects to the OSA.
 
-    It also checks if the user is authorized to use the device. If the user is not authorized, it raises an Exception and does not connect to the device."""
+    It also checks if the user is authorized to use the device. If the user is not authorized, it raises an Exception and does not connect to the device.
+
+    :param settle: Settle strategy of the acquisition methods. 'discard-after-change' (default) performs an extra, discarded sweep only when the configuration changed since the last sweep, 'single' always performs a single sweep.
+    :type settle: str
+
+    :param resource: Open VISA resource to use instead of the instrument, e.g. an :class:`osa_emulator.VirtualOSA`. The authorization check is skipped when given.
+    :type resource: object
+
+    :raises ValueError: If the settle strategy is invalid
+    """
+
+    #: Query used to read a trace memory in IEEE 488.2 binary block format, with ``{memory}`` replaced by 'A' or 'B'. The MS9710C only answers the ASCII ``DQA?``/``DQB?`` queries, so this is None by default and traces are parsed with ``query_ascii_values`` into a NumPy array. Set it for instruments that support block transfer.
+    binary_trace_query = None
+    #: Struct format of a single point in the binary block (see ``pyvisa`` ``query_binary_values``)
+    binary_trace_datatype = "f"
+    #: Commands written once before the first service-request wait, to route the sweep-end event to SRQ. Empty by default since the status byte mapping depends on the instrument. Without it the waiter still blocks on the adapter's event queue between polls, which costs nothing over sleeping.
+    srq_enable_commands = ()
 
-    def __init__(self):
+    def __init__(self, settle=OSA_SETTLE_DISCARD_AFTER_CHANGE, resource=None):
+
+        if settle not in OSA_SETTLE_POLICIES:
+            raise ValueError(
+                "Invalid settle strategy, please choose one of %s"
+                % str(OSA_SETTLE_POLICIES)
+            )
+
+        if resource is not None:
+            self.osa = resource
+        elif check_patch_owners([("anritsu_osa", "anritsu_osa")]):
+            import pyvisa
 
-        if check_patch_owners([("anritsu_osa", "anritsu_osa")]):
             rm = pyvisa.ResourceManager()
-            self.osa = rm.open_resource("GPIB0::8::INSTR")
+            self.osa = rm.open_resource(OSA_RESOURCE_NAME)
         else:
             raise Exception("You are not authorized to use this device.")
+        self.__srq = None
+        self.settle = settle
+        # The configuration left on the instrument by a previous session is unknown
+        self.config_changed = True
 
     def query(self, cmd):
         """Query the OSA with the given command and return the response. This command is for GET queries only. All useful queries are already implemented as methods in the class. Please refer the documentation to implement new queries."
@@ -28,13 +248,18 @@ class OSA:
         return self.osa.query(cmd)
 
     def write(self, cmd):
-        """Write the command to the OSA. This command is for SET queries only. All useful queries are already implemented as methods in the class. Please refer the documentation to implement new queries.
+        """Write the command to the OSA. This command is for SET queries only. The configuration is considered changed afterwards, see :meth:`settled_sweep`. All useful queries are already implemented as methods in the class. Please refer the documentation to implement new queries.
 
         :param cmd: Command to write to the OSA
         :type cmd: str
 
         :return: None
         """
+        return self.__write_config(cmd)
+
+    def __write_config(self, cmd):
+        # Writes through here may change the sweep configuration
+        self.config_changed = True
         return self.osa.write(cmd)
 
     def identify(self):
@@ -51,7 +276,7 @@ class OSA:
         # Resetting of device at level3
         inp = input("Are you sure..?")
         if inp.upper() in ("Y", "YES"):
-            self.osa.write("*RST")
+            self.__write_config("*RST")
 
     def self_test(self):
         """Perform the self test on the device and return the status of the test."""
@@ -103,7 +328,7 @@ class OSA:
         :return: None
         """
 
-        self.osa.write(f"RES {resolution}")
+        self.__write_config(f"RES {resolution}")
         return
 
     def get_attn_status(self):
@@ -121,9 +346,9 @@ class OSA:
 
         # Turn the internal optical attenuator On/Off
         if status.upper() == "ON":
-            self.osa.write("ATT s")
+            self.__write_config("ATT s")
         else:
-            self.osa.write("ATT ")
+            self.__write_config("ATT ")
 
     def get_auto_measure(self):
         """Carries out auto measurement. The wavelength and resolution are automatically set for the incident light spectrum.
@@ -139,7 +364,7 @@ class OSA:
 
         # Carries out auto measurement. The wavelength anf resolution are automatically set for the incident light spectrum
 
-        self.osa.write("AUT")
+        self.__write_config("AUT")
         return
 
     def get_wavelength_centre(self):
@@ -162,7 +387,7 @@ class OSA:
         """
 
         cmd = "CNT %s" % str(wavelength)
-        self.osa.write(cmd)
+        self.__write_config(cmd)
         return
 
     def get_wavelength_span(self):
@@ -192,6 +417,30 @@ class OSA:
 
         return self.osa.query("STO?")
 
+    def set_wavelength_start(self, wavelength):
+        """Sets the start wavelength (nm) of the OSA.
+
+        :param wavelength: Start wavelength in nm (upto second decimal place)
+        :type wavelength: str
+
+        :return: None
+        """
+
+        self.__write_config("STA %s" % str(wavelength))
+        return
+
+    def set_wavelength_stop(self, wavelength):
+        """Sets the stop wavelength (nm) of the OSA.
+
+        :param wavelength: Stop wavelength in nm (upto second decimal place)
+        :type wavelength: str
+
+        :return: None
+        """
+
+        self.__write_config("STO %s" % str(wavelength))
+        return
+
     def get_wavelength_mkv(self):
         """Converts the trace marker, the delta marker, and the wavelength values obtained from a part of the analysis into frequencies and then displays them.
 
@@ -220,7 +469,7 @@ class OSA:
         """
 
         cmd = "MPT %s" % str(int(n))
-        self.osa.write(cmd)
+        self.__write_config(cmd)
         return
 
     def get_marker_tmk(self):
@@ -236,13 +485,13 @@ class OSA:
         """Sets the spectrum peak wavelength as a center wavelength"""
 
         # Sets the spectrum peak wavelength as a center wavelength
-        self.osa.write("PKC")
+        self.__write_config("PKC")
         return
 
     def set_tmkr_centre(self):
         """Sets the trace marker value as a center wavelength"""
 
-        self.osa.write("TMC")
+        self.__write_config("TMC")
         return
 
     def sweep_single(self):
@@ -260,39 +509,164 @@ class OSA:
 
         self.osa.write("SST")
 
-    def osa_sweep(self):
+    def osa_sweep(self, timeout=OSA_SWEEP_TIMEOUT):
+
+        """Perform a sweep of the OSA. This method is used to perform a sweep of the OSA. This method does not return anything. However, the sweep is stored in the memory of the OSA.
+
+        :param timeout: Maximum time to wait for the sweep to complete in seconds
+        :type timeout: float
+
+        :raises TimeoutError: If the sweep does not complete within the timeout
+        """
+
+        self.__start_sweep()
+        print("Sweep OSA - start")
+        self.wait_sweep(timeout)
+        print("Sweep OSA - end")
+
+    async def osa_sweep_async(self, timeout=OSA_SWEEP_TIMEOUT):
 
-        """Perform a sweep of the OSA. This method is used to perform a sweep of the OSA. This method does not return anything. However, the sweep is stored in the memory of the OSA."""
+        """Asynchronous version of :meth:`osa_sweep`. The status polls run in the default executor and the delays between them are awaited, so the event loop can service other devices while the OSA sweeps.
 
+        :param timeout: Maximum time to wait for the sweep to complete in seconds
+        :type timeout: float
+
+        :raises TimeoutError: If the sweep does not complete within the timeout
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.__start_sweep)
+        print("Sweep OSA - start")
+        await self.wait_sweep_async(timeout)
+        print("Sweep OSA - end")
+
+    def __start_sweep(self):
+        # Reading ESR2 clears it, so a completed earlier sweep is not mistaken for this one
+        try:
+            self.osa.query("ESR2?")
+        except Exception as e:
+            print(e)
         self.sweep_single()
         self.set_peak_search()
-        print("Sweep OSA - start")
-        counter = 0
+
+    def is_sweep_complete(self):
+
+        """Check the END event status register (ESR2) for the end of a sweep. Note that reading the register clears it.
+
+        :return: True if the sweep is complete
+        :rtype: bool
+        """
+
+        return int(self.osa.query("ESR2?")) == OSA_SWEEP_COMPLETE
+
+    def wait_sweep(self, timeout=OSA_SWEEP_TIMEOUT):
+
+        """Wait for the running sweep to complete. Between two status polls the method waits for a service request when the VISA adapter supports event waiting, and sleeps otherwise. The delay between polls starts at ``OSA_POLL_INTERVAL`` and doubles up to ``OSA_POLL_MAX_INTERVAL``.
+
+        :param timeout: Maximum time to wait in seconds
+        :type timeout: float
+
+        :raises TimeoutError: If the sweep does not complete within the timeout
+        """
+
+        self.__wait_for(self.is_sweep_complete, timeout, "sweep")
+
+    async def wait_sweep_async(self, timeout=OSA_SWEEP_TIMEOUT):
+
+        """Asynchronous version of :meth:`wait_sweep`.
+
+        :param timeout: Maximum time to wait in seconds
+        :type timeout: float
+
+        :raises TimeoutError: If the sweep does not complete within the timeout
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        interval = OSA_POLL_INTERVAL
         while True:
             try:
-                data = int(self.osa.query("ESR2?"))
-                break
-            except:
-                print("Something went wrong during the sweep. Retry: ", counter + 1)
-                counter += 1
-                if counter == 3:
-                    data = 0
-                    break
-
-        counter = 0
-        while data != 3:  # more info on page 9-58 and 8-16 of the manual: ms9710c.pdf
-            while True:
-                try:
-                    data = int(self.osa.query("ESR2?"))
-                    break
-                except:
-                    print("Something went wrong during the sweep. Retry: ", counter + 1)
-                    counter += 1
-                    if counter == 3:
-                        data = 0
-                        break
-            pass
-        print("Sweep OSA - end")
+                if await loop.run_in_executor(None, self.is_sweep_complete):
+                    return
+            except Exception as e:
+                print("Something went wrong during the sweep:", e)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError("OSA sweep did not complete in %s s" % timeout)
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 2, OSA_POLL_MAX_INTERVAL)
+
+    def __wait_for(self, condition, timeout, name):
+        deadline = time.monotonic() + timeout
+        interval = OSA_POLL_INTERVAL
+        while True:
+            try:
+                if condition():
+                    return
+            except Exception as e:
+                print("Something went wrong during the %s:" % name, e)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("OSA %s did not complete in %s s" % (name, timeout))
+            self.__wait_srq(min(interval, remaining))
+            interval = min(interval * 2, OSA_POLL_MAX_INTERVAL)
+
+    def __wait_srq(self, seconds):
+        # Block on a service request for at most `seconds`, or sleep when the adapter has no event support
+        import pyvisa
+
+        if self.__srq is None:
+            try:
+                for cmd in self.srq_enable_commands:
+                    self.osa.write(cmd)
+                self.osa.enable_event(
+                    pyvisa.constants.EventType.service_request,
+                    pyvisa.constants.EventMechanism.queue,
+                )
+                self.__srq = True
+            except Exception:
+                self.__srq = False
+        if self.__srq:
+            try:
+                self.osa.wait_on_event(
+                    pyvisa.constants.EventType.service_request, int(seconds * 1000)
+                )
+                return
+            except pyvisa.errors.VisaIOError as e:
+                if e.error_code == pyvisa.constants.StatusCode.error_timeout:
+                    return
+                self.__srq = False
+        time.sleep(seconds)
+
+    def settled_sweep(self, timeout=OSA_SWEEP_TIMEOUT):
+        """Perform the sweep(s) of an acquisition according to the settle strategy. With 'discard-after-change', a first sweep is performed and discarded only if the configuration was changed through this object since the last sweep; repeated measurements with an unchanged configuration take a single sweep.
+
+        :param timeout: Maximum time to wait for each sweep in seconds
+        :type timeout: float
+        """
+
+        if self.settle == OSA_SETTLE_DISCARD_AFTER_CHANGE and self.config_changed:
+            self.osa_sweep(timeout)
+        self.config_changed = False
+        self.osa_sweep(timeout)
+
+    def acquire(self, memory="A", timeout=OSA_SWEEP_TIMEOUT):
+        """Perform the sweep(s) of an acquisition according to the settle strategy and read the trace.
+
+        :param memory: 'A' or 'B' -> it reads form memory A or B. (A default)
+        :type memory: str
+
+        :param timeout: Maximum time to wait for each sweep in seconds
+        :type timeout: float
+
+        :return: Trace with wavelength [nm] and power level [dBm] of each sampled data point
+        :rtype: OSATrace
+        """
+
+        self.settled_sweep(timeout)
+        return self.get_trace(memory)
 
     def get_peak_numbers(self):
 
@@ -307,76 +681,97 @@ class OSA:
         n = self.osa.query("APR? MPKC")
         return n
 
-    def auto_measure(self):
+    def auto_measure(self, timeout=OSA_SWEEP_TIMEOUT):
+
+        """Perform the automeasure function of the OSA. This method does not return anything. However, the sweep is stored in the memory of the OSA.
 
-        """Perform the automeasure function of the OSA. This method does not return anything. However, the sweep is stored in the memory of the OSA."""
+        :param timeout: Maximum time to wait for the automeasure to complete in seconds
+        :type timeout: float
+
+        :raises TimeoutError: If the automeasure does not complete within the timeout
+        """
 
         # Description: Perform the automeasure function of the OSA.
 
         print("Automeasure OSA - start")
         # It returns 0 when it ends the automeasure, 1 otherwise.
-        while int(self.osa.query("AUT?")) != 0:
-            pass
+        self.__wait_for(
+            lambda: int(self.osa.query("AUT?")) == 0, timeout, "automeasure"
+        )
         print("Automeasure OSA - end")
 
     def get_sweep_data(self, memory="A"):
 
-        """Performs a sweep of the OSA and returns the measurement. The data is returned as a list of power level [dbm] of each sampled data point from start lambda to end lambda. The default memory is A.
+        """Performs a sweep of the OSA and returns the measurement. The data is returned as an array of power level [dbm] of each sampled data point from start lambda to end lambda. The default memory is A.
 
         :param memory: 'A' or 'B' -> it reads form memory A or B. (A default)
         :type memory: str
 
         :return: Power level [dbm] of each sampled data point from start lambda to end lambda. Example: -77.65,-120,-77.01,-120,-78.43, ...
-        :rtype: list
+        :rtype: numpy.ndarray
         """
 
-        self.osa_sweep()
-        self.osa_sweep()
-        # time.sleep(0.5)
-        counter = 0
-        while True:
-            try:
-                data = self.osa.query("DQ" + memory + "?")
-                break
-            except:
-                print(
-                    "Something went wrong during the reading of memory A. Retry: ",
-                    counter + 1,
-                )
-                counter += 1
-                if counter == 3:
-                    data = 0
-                    break
-        newdata = data.rstrip("\r\n")
-        return newdata.split(",")
+        self.settled_sweep()
+        return self.get_data(memory)
 
     def get_data(self, memory="A"):
 
-        """Get the data from the screen of the OSA stored into the memory. The data is returned as a list of power level [dbm] of each sampled data point from start lambda to end lambda. The default memory is A.
+        """Get the data from the screen of the OSA stored into the memory. The data is returned as a float32 array of power level [dbm] of each sampled data point from start lambda to end lambda. The default memory is A.
 
         :param memory: 'A' or 'B' -> it reads form memory A or B. (A default)
         :type memory: str
 
         :return: Power level [dbm] of each sampled data point from start lambda to end lambda. Example: -77.65,-120,-77.01,-120,-78.43, ...
-        :rtype: list
+        :rtype: numpy.ndarray
+
+        :raises RuntimeError: If the memory could not be read after all retries
         """
 
-        counter = 0
-        while True:
-            try:
-                data = self.osa.query("DQ" + memory + "?")
-                break
-            except:
-                print(
-                    "Something went wrong during the reading of memory A. Retry: ",
-                    counter + 1,
-                )
-                counter += 1
-                if counter == 3:
-                    data = 0
-                    break
-        newdata = data.rstrip("\r\n")
-        return newdata.split(",")
+        try:
+            return OSA_RETRY_POLICY.call(
+                OSA_DEVICE_NAME, self.__read_trace, memory, name="read_trace"
+            )
+        except Exception as e:
+            raise RuntimeError("Could not read memory %s of the OSA" % memory) from e
+
+    def get_trace(self, memory="A"):
+
+        """Get the trace stored in the memory as an :class:`OSATrace`. The power levels are transferred in binary block format when :attr:`binary_trace_query` is set, and otherwise parsed straight into a NumPy array. The sweep configuration (start/stop wavelength, sampling points and resolution) is read once here and attached to the trace together with the wavelength axis.
+
+        :param memory: 'A' or 'B' -> it reads form memory A or B. (A default)
+        :type memory: str
+
+        :return: Trace with wavelength [nm] and power level [dBm] of each sampled data point
+        :rtype: OSATrace
+        """
+
+        power = self.get_data(memory)
+        config = {
+            "memory": memory,
+            "time": str(datetime.now()),
+            "wavelength_start": float(self.get_wavelength_start()),
+            "wavelength_stop": float(self.get_wavelength_stop()),
+            "sampling_points": int(float(self.get_sampling_points())),
+            "resolution": float(self.get_resolution()),
+        }
+        wavelength = np.linspace(
+            config["wavelength_start"],
+            config["wavelength_stop"],
+            len(power),
+            dtype=np.float32,
+        )
+        return OSATrace(wavelength, power, config)
+
+    def __read_trace(self, memory):
+        if self.binary_trace_query is not None:
+            data = self.osa.query_binary_values(
+                self.binary_trace_query.format(memory=memory),
+                datatype=self.binary_trace_datatype,
+                container=np.array,
+            )
+        else:
+            data = self.osa.query_ascii_values("DQ" + memory + "?", container=np.array)
+        return np.asarray(data, dtype=np.float32)
 
     # def osa_get_data_screen_dashboard(self, memory="A"):
 
@@ -416,11 +811,10 @@ class OSA:
 
         :return: None
         """
+        import matplotlib.pyplot as plt
 
-        self.osa_sweep()
-        self.osa_sweep()
+        self.settled_sweep()
         data = self.get_data()
-        data = [float(i) for i in data]
 
         plt.plot(data)
         if dir[-1] != "/":
@@ -441,13 +835,9 @@ class OSA:
         :return: None
         """
 
-        self.osa_sweep()
-        self.osa_sweep()
+        self.settled_sweep()
         data = self.get_data()
-        data = [float(i) for i in data]
 
         if dir[-1] != "/":
             dir += "/"
-        with open(f"{dir}/{prefix}.csv", "w") as f:
-            for item in data:
-                f.write("%s\n" % item)
+        np.savetxt(f"{dir}/{prefix}.csv", data, fmt="%.2f")
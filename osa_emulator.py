@@ -0,0 +1,296 @@
+import time
+import threading
+import numpy as np
+from utils import (
+    wdm_channel_list,
+    CHANNEL_SPACING,
+    FIRST_CENTRAL_FREQ,
+)
+from osa import OSA_SPEED_OF_LIGHT, OSA_SWEEP_COMPLETE
+
+EMULATOR_IDENTITY = "ANRITSU,MS9710C,EMULATOR,1.0"
+EMULATOR_CHANNEL_POWER = -10.0  # dBm, default per-channel power
+EMULATOR_ASE_POWER = -40.0  # dBm in 0.1 nm, default ASE level between the channels
+EMULATOR_NOISE_FLOOR = -75.0  # dBm, floor of the instrument
+EMULATOR_ATTENUATOR_FLOOR = 20.0  # dB added to the floor when the attenuator is on
+EMULATOR_SIGNAL_WIDTH = 0.05  # nm, -3 dB width of a channel before the resolution filter
+EMULATOR_NOISE = 0.1  # dB, standard deviation of the sample noise
+EMULATOR_SWEEP_BASE = 0.2  # s, fixed part of the duration of a sweep
+EMULATOR_SWEEP_PER_POINT = 0.0005  # s, duration of a sweep per sampling point
+EMULATOR_SAMPLING_POINTS = (51, 101, 251, 501, 1001, 2001, 5001)
+
+
+class VirtualOSA:
+
+    """In-process stand-in for the VISA resource of the Anritsu MS9710C, to pass as ``OSA(resource=VirtualOSA())``. It answers the queries and commands :class:`osa.OSA` sends (``*IDN?``, ``STA``/``STO``/``CNT``/``SPN``, ``MPT``, ``RES``/``ARED?``, ``ATT``, ``SSI``/``SRT``/``SST``, ``ESR2?``, ``DQA?``/``DQB?``, markers and peak count) with the same text formats, so traces go through the ASCII transfer and parsing of the driver unchanged.
+
+    A sweep lasts ``sweep_base + sweep_per_point * sampling points`` seconds after ``SSI``; ``ESR2?`` reports the end of the sweep once, like the instrument. The trace of a sweep is a synthetic WDM spectrum on the 50 GHz grid: each active channel is a peak of ``channel_power`` broadened by the resolution, above an ASE level of ``ase_power`` and the noise floor of the instrument, which rises by 20 dB with the attenuator on.
+
+    :param channels: Active channel numbers
+    :type channels: list
+
+    :param channel_power: Per-channel power in dBm, a number or one value per channel of ``channels``
+    :type channel_power: float or list
+
+    :param ase_power: ASE level between the channels in dBm in 0.1 nm
+    :type ase_power: float
+
+    :param sweep_base: Fixed part of the sweep duration in seconds
+    :type sweep_base: float
+
+    :param sweep_per_point: Sweep duration per sampling point in seconds
+    :type sweep_per_point: float
+
+    :param latency: Delay of every query and write in seconds
+    :type latency: float
+
+    :param transfer_rate: Bus throughput in bytes per second, replies take their length divided by it. No limit by default
+    :type transfer_rate: float
+
+    :param seed: Seed of the sample noise
+    :type seed: int
+    """
+
+    def __init__(
+        self,
+        channels=wdm_channel_list,
+        channel_power=EMULATOR_CHANNEL_POWER,
+        ase_power=EMULATOR_ASE_POWER,
+        sweep_base=EMULATOR_SWEEP_BASE,
+        sweep_per_point=EMULATOR_SWEEP_PER_POINT,
+        latency=0.0,
+        transfer_rate=None,
+        seed=None,
+    ):
+
+        self.channels = list(channels)
+        self.channel_power = np.broadcast_to(
+            np.asarray(channel_power, dtype=float), (len(self.channels),)
+        ).copy()
+        self.ase_power = ase_power
+        self.sweep_base = sweep_base
+        self.sweep_per_point = sweep_per_point
+        self.latency = latency
+        self.transfer_rate = transfer_rate
+        self.random = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.timeout = 2000  # ms, like a pyvisa resource
+        self.query_count = 0
+        self.sweep_count = 0
+        self.reset()
+
+    def reset(self):
+        """Restore the default configuration and clear the trace memories."""
+
+        self.start = 1525.0  # nm
+        self.stop = 1570.0  # nm
+        self.points = 1001
+        self.resolution = 0.1  # nm
+        self.attenuator = False
+        self.sweep_end = None
+        self.auto_end = None
+        self.repeat = False
+        self.end_event = False
+        self.memory = {}
+        self.marker = None
+
+    def sweep_duration(self):
+        """Get the duration of a sweep with the current configuration.
+
+        :return: Duration in seconds
+        :rtype: float
+        """
+
+        return self.sweep_base + self.sweep_per_point * self.points
+
+    def spectrum(self):
+        """Compute a synthetic trace with the current configuration.
+
+        :return: Wavelength in nm and power in dBm of each sampling point
+        :rtype: tuple
+        """
+
+        wavelength = np.linspace(self.start, self.stop, self.points)
+        centre = OSA_SPEED_OF_LIGHT / (
+            FIRST_CENTRAL_FREQ + (np.asarray(self.channels) - 1) * CHANNEL_SPACING
+        )
+        # Each channel is seen through the resolution filter as a gaussian peak
+        sigma = np.hypot(EMULATOR_SIGNAL_WIDTH, self.resolution) / 2.3548
+        peaks = 10 ** (self.channel_power / 10.0)
+        shape = np.exp(
+            -0.5 * ((wavelength[:, np.newaxis] - centre[np.newaxis, :]) / sigma) ** 2
+        )
+        floor = EMULATOR_NOISE_FLOOR + (
+            EMULATOR_ATTENUATOR_FLOOR if self.attenuator else 0.0
+        )
+        power_mw = (
+            shape @ peaks
+            + 10 ** (self.ase_power / 10.0) * self.resolution / 0.1
+            + 10 ** (floor / 10.0)
+        )
+        power = 10 * np.log10(power_mw)
+        power += self.random.normal(0.0, EMULATOR_NOISE, self.points)
+        return wavelength, power
+
+    def query(self, cmd):
+        """Write a query and read the reply, like ``pyvisa.resources.MessageBasedResource.query``.
+
+        :param cmd: Query
+        :type cmd: str
+
+        :return: Reply terminated by CR LF
+        :rtype: str
+
+        :raises ValueError: If the query is not supported
+        """
+
+        reply = self.__reply(cmd.strip()) + "\r\n"
+        if self.transfer_rate:
+            time.sleep(len(reply) / self.transfer_rate)
+        return reply
+
+    def query_ascii_values(self, cmd, converter="f", separator=",", container=list):
+        """Query and parse a reply of comma separated values, like ``pyvisa``.
+
+        :param cmd: Query
+        :type cmd: str
+
+        :return: Values of the reply
+        """
+
+        reply = self.query(cmd).strip()
+        return container([float(value) for value in reply.split(separator)])
+
+    def write(self, cmd):
+        """Write a command.
+
+        :param cmd: Command
+        :type cmd: str
+
+        :raises ValueError: If the command is not supported
+        """
+
+        self.__delay()
+        header, _, argument = cmd.strip().partition(" ")
+        header = header.upper()
+        with self.lock:
+            if header == "STA":
+                self.start = float(argument)
+            elif header == "STO":
+                self.stop = float(argument)
+            elif header == "CNT":
+                span = self.stop - self.start
+                self.start = float(argument) - span / 2.0
+                self.stop = float(argument) + span / 2.0
+            elif header == "SPN":
+                centre = (self.start + self.stop) / 2.0
+                self.start = centre - float(argument) / 2.0
+                self.stop = centre + float(argument) / 2.0
+            elif header == "MPT":
+                if int(argument) not in EMULATOR_SAMPLING_POINTS:
+                    raise ValueError("Unsupported sampling points %s" % argument)
+                self.points = int(argument)
+            elif header == "RES":
+                self.resolution = float(argument)
+            elif header == "ATT":
+                self.attenuator = bool(argument.strip())
+            elif header == "SSI":
+                self.repeat = False
+                self.__start_sweep()
+            elif header == "SRT":
+                self.repeat = True
+                self.__start_sweep()
+            elif header == "SST":
+                self.repeat = False
+                self.sweep_end = None
+            elif header == "AUT":
+                self.auto_end = time.monotonic() + 2 * self.sweep_duration()
+            elif header == "PKS":
+                self.__update_sweep()
+                wavelength, power = self.memory.get("A", self.spectrum())
+                peak = int(np.argmax(power))
+                self.marker = (wavelength[peak], power[peak])
+            elif header == "PKC" or header == "TMC":
+                if self.marker is not None:
+                    span = self.stop - self.start
+                    self.start = self.marker[0] - span / 2.0
+                    self.stop = self.marker[0] + span / 2.0
+            elif header == "*RST":
+                self.reset()
+            else:
+                raise ValueError("Unsupported command %s" % cmd)
+
+    def close(self):
+        """Close the resource."""
+
+    def __start_sweep(self):
+        self.sweep_end = time.monotonic() + self.sweep_duration()
+
+    def __update_sweep(self):
+        # Complete the sweeps whose end has passed, storing their trace into memory A
+        now = time.monotonic()
+        while self.sweep_end is not None and now >= self.sweep_end:
+            self.memory["A"] = self.memory["B"] = self.spectrum()
+            self.sweep_count += 1
+            self.end_event = True
+            if self.repeat:
+                self.sweep_end += self.sweep_duration()
+            else:
+                self.sweep_end = None
+
+    def __reply(self, cmd):
+        self.__delay()
+        with self.lock:
+            self.query_count += 1
+            self.__update_sweep()
+            header = cmd.upper()
+            if header == "*IDN?":
+                return EMULATOR_IDENTITY
+            elif header == "*TST?":
+                return "0"
+            elif header == "ESR2?":
+                # Reading the register clears it
+                status, self.end_event = self.end_event, False
+                return str(OSA_SWEEP_COMPLETE if status else 0)
+            elif header in ("DQA?", "DQB?"):
+                _, power = self.memory.get(header[2], self.spectrum())
+                return ",".join("%.2f" % value for value in power)
+            elif header == "STA?":
+                return "%.2f" % self.start
+            elif header == "STO?":
+                return "%.2f" % self.stop
+            elif header == "CNT?":
+                return "%.2f" % ((self.start + self.stop) / 2.0)
+            elif header == "SPN?":
+                return "%.2f" % (self.stop - self.start)
+            elif header == "MPT?":
+                return str(self.points)
+            elif header in ("RES?", "ARED?"):
+                return "%.2f" % self.resolution
+            elif header == "ATT?":
+                return "ON" if self.attenuator else "OFF"
+            elif header == "AUT?":
+                running = self.auto_end is not None and time.monotonic() < self.auto_end
+                return "1" if running else "0"
+            elif header == "PKS?":
+                return "PEAK"
+            elif header in ("TMK?", "MKV?"):
+                if self.marker is None:
+                    return "0.00,0.00"
+                return "%.2f,%.2f" % self.marker
+            elif header == "APR? MPKC":
+                return str(
+                    sum(
+                        1
+                        for channel in self.channels
+                        if self.start
+                        <= OSA_SPEED_OF_LIGHT
+                        / (FIRST_CENTRAL_FREQ + (channel - 1) * CHANNEL_SPACING)
+                        <= self.stop
+                    )
+                )
+            raise ValueError("Unsupported query %s" % cmd)
+
+    def __delay(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
@@ -1,5 +1,9 @@
 import sys
 import os
+import time
+import threading
+import queue
+from concurrent.futures import Future
 import plotly.express as px
 import plotly.graph_objects as go
 from osa import OSA
@@ -13,19 +17,150 @@ from flask import send_file
 import pandas as pd
 import dash_bootstrap_components as dbc
 
-osa = OSA()
+OSA_SERVER_SWEEP_INTERVAL = 2.0  # s, minimum time between the starts of two sweeps
+OSA_SERVER_POLL_INTERVAL = 1000  # ms, how often each browser session reads the cache
+#: 'virtual' serves the traces of an osa_emulator.VirtualOSA instead of the instrument
+OSA_SERVER_BACKEND = os.environ.get("OSA_SERVER_BACKEND", "gpib")
+OSA_SERVER_CONFIG_TIMEOUT = (
+    300.0  # s, how long a configuration callback waits for the worker
+)
+
+
+class OSAAcquisitionWorker(threading.Thread):
+
+    """Background thread that owns the OSA and sweeps it continuously. The latest trace and OSA configuration are published to an in-process cache, so any number of dashboard sessions share one sweep stream without touching the instrument. Configuration changes are queued and applied by the worker between two sweeps. An error of the OSA is logged and published with the cache, and the worker keeps sweeping.
+
+    :param osa: The OSA to acquire from. Only the worker may use it once started.
+    :type osa: OSA
+
+    :param interval: Minimum time between the starts of two sweeps in seconds
+    :type interval: float
+    """
+
+    def __init__(self, osa, interval=OSA_SERVER_SWEEP_INTERVAL):
+
+        super().__init__(name="osa-acquisition", daemon=True)
+        self.osa = osa
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._latest = None
+        self._published = None
+        self._error = None
+        self._requests = queue.Queue()
+        self._stop_event = threading.Event()
+
+    def latest(self):
+        """Get the latest published acquisition.
+
+        :return: Dictionary with the sweep counter, time, wavelength (x), power (y) and OSA configuration of the latest sweep, its age in seconds, and the error of the OSA since that sweep if any, else None. Before the first sweep completes the sweep counter is 0, the trace empty and the age None. None while nothing happened yet
+        :rtype: dict
+        """
+
+        with self._lock:
+            if self._latest is None:
+                if self._error is None:
+                    return None
+                latest = {"sweep": 0, "time": None, "x": [], "y": [], "config": {}}
+                age = None
+            else:
+                latest = self._latest
+                age = time.monotonic() - self._published
+            return dict(latest, age=age, error=self._error)
+
+    def submit(self, method, *args):
+        """Queue a call to an OSA method, e.g. ``submit("set_wavelength_start", 1530)``. The worker runs it before the next sweep.
+
+        :param method: Name of the OSA method to call
+        :type method: str
+
+        :return: Future resolved with the return value of the call
+        :rtype: concurrent.futures.Future
+        """
+
+        future = Future()
+        self._requests.put((future, method, args))
+        return future
+
+    def stop(self):
+        """Stop the worker after the current sweep."""
+
+        self._stop_event.set()
+        self._requests.put(None)
+
+    def run(self):
+        config = None
+        sweep = 0
+        while not self._stop_event.is_set():
+            started = datetime.now()
+            try:
+                if self.__apply_requests() or config is None:
+                    # Read again on the next sweep if this read fails
+                    config = None
+                    config = get_osa_config(self.osa)
+                trace = self.osa.acquire()
+            except Exception as e:
+                print("OSA acquisition failed:", e)
+                with self._lock:
+                    self._error = str(e) or type(e).__name__
+            else:
+                sweep += 1
+                with self._lock:
+                    self._latest = {
+                        "sweep": sweep,
+                        "time": started.strftime("%Y-%m-%d %H:%M:%S"),
+                        "x": trace.wavelength.astype(float).round(4).tolist(),
+                        "y": trace.power.astype(float).round(2).tolist(),
+                        "config": config,
+                    }
+                    self._published = time.monotonic()
+                    self._error = None
+            elapsed = (datetime.now() - started).total_seconds()
+            # Wait out the rest of the interval, waking up early for configuration requests
+            try:
+                request = self._requests.get(timeout=max(self.interval - elapsed, 0))
+            except queue.Empty:
+                continue
+            self._requests.put(request)
+
+    def __apply_requests(self):
+        applied = False
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                return applied
+            if request is None:
+                continue
+            future, method, args = request
+            try:
+                future.set_result(getattr(self.osa, method)(*args))
+            except Exception as e:
+                future.set_exception(e)
+            applied = True
+
 
+_worker = None
+_worker_lock = threading.Lock()
 
-def get_osa_reading():
-    osa.osa_sweep()
-    osa.osa_sweep()
-    data = osa.osa_get_data_screen_dashboard()
-    y = [float(i) for i in data]
-    x = list(range(len(y)))
-    return x, y
 
+def get_worker():
+    """Get the acquisition worker of this process, connecting to the OSA and starting it on first use."""
 
-def get_osa_config():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            if OSA_SERVER_BACKEND == "virtual":
+                from osa_emulator import VirtualOSA
+
+                osa = OSA(resource=VirtualOSA())
+            else:
+                osa = OSA()
+            _worker = OSAAcquisitionWorker(osa)
+            _worker.start()
+        return _worker
+
+
+def get_osa_config(osa):
     config = {}
     config["Identity"] = osa.identify()
     config["Resolution"] = osa.get_resolution()
@@ -38,19 +173,21 @@ def get_osa_config():
     return config
 
 
+def format_config(config):
+    return "  \n".join([f"**{key}:** {value}" for key, value in config.items()])
+
+
 def plot_figure(x, y):
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=x, y=y, mode="lines", name="OSA Measurement"))
     fig.update_layout(
-        title="OSA Measurement", xaxis_title="X-axis", yaxis_title="Y-axis"
+        title="OSA Measurement",
+        xaxis_title="Wavelength (nm)",
+        yaxis_title="Power (dBm)",
     )
     return fig
 
 
-x, y = get_osa_reading()
-config = get_osa_config()
-fig = plot_figure(x, y)
-
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
 # Define the layout
@@ -83,11 +220,10 @@ app.layout = dbc.Container(
                                             className="btn btn-secondary mb-2",
                                         ),
                                         dcc.Interval(
-                                            id="interval",
-                                            interval=1000,
+                                            id="poll",
+                                            interval=OSA_SERVER_POLL_INTERVAL,
                                             n_intervals=0,
-                                            disabled=True,
-                                        ),  # Interval component for the cooldown
+                                        ),  # Reads the shared acquisition cache
                                         html.Div(
                                             id="timestamp",
                                             children="",
@@ -95,7 +231,7 @@ app.layout = dbc.Container(
                                         ),
                                         dcc.Store(
                                             id="store-data",
-                                            data={"x": x, "y": y, "config": config},
+                                            data={"sweep": 0, "x": [], "y": []},
                                         ),
                                     ]
                                 )
@@ -123,7 +259,13 @@ app.layout = dbc.Container(
                 dbc.Col(
                     [
                         dbc.Card(
-                            dbc.CardBody([dcc.Graph(id="example-graph", figure=fig)]),
+                            dbc.CardBody(
+                                [
+                                    dcc.Graph(
+                                        id="example-graph", figure=plot_figure([], [])
+                                    )
+                                ]
+                            ),
                             className="mb-4",
                         ),
                         dbc.Card(
@@ -163,86 +305,64 @@ app.layout = dbc.Container(
     fluid=True,
 )
 
-# Combined callback to handle both updates and configuration changes
+# Refresh the view from the shared acquisition cache. The refresh button only forces a read of the cache, it never triggers a sweep.
 @app.callback(
     [
         Output("example-graph", "figure"),
         Output("timestamp", "children"),
         Output("additional-data", "children"),
         Output("store-data", "data"),
-        Output("config-status", "children"),
     ],
-    [Input("refresh-button", "n_clicks"), Input("update-config-button", "n_clicks")],
-    [State("wavelength-start-input", "value"), State("store-data", "data")],
+    [Input("poll", "n_intervals"), Input("refresh-button", "n_clicks")],
+    [State("store-data", "data")],
 )
-def update_and_configure(
-    refresh_n_clicks, config_n_clicks, wavelength_start, stored_data
-):
-    # Determine which button was clicked
-    ctx = dash.callback_context
-
-    # Initialize variables
-    fig = dash.no_update
-    timestamp_text = dash.no_update
-    additional_data_text = dash.no_update
-    config_status = dash.no_update
-
-    # If refresh button was clicked
-    if ctx.triggered and ctx.triggered[0]["prop_id"] == "refresh-button.n_clicks":
-        x, y = get_osa_reading()
-        fig = plot_figure(x, y)
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        timestamp_text = f"Last refreshed at {current_time}. The refresh function is locked for 30 seconds."
-        stored_data["x"] = x
-        stored_data["y"] = y
-
-    # If update config button was clicked
-    if ctx.triggered and ctx.triggered[0]["prop_id"] == "update-config-button.n_clicks":
-        try:
-            # Update the OSA configuration
-            osa.set_wavelength_start(wavelength_start)
-
-            # Get updated configuration
-            config = get_osa_config()
-            stored_data["config"] = config
-
-            # Generate updated additional data text
-            additional_data_text = "  \n".join(
-                [f"**{key}:** {value}" for key, value in config.items()]
-            )
-            config_status = "Configuration updated successfully."
-        except Exception as e:
-            config_status = f"Error updating configuration: {str(e)}"
-
-    # Always update the additional data text if config has changed
-    if fig is not dash.no_update:
-        config = get_osa_config()
-        additional_data_text = "  \n".join(
-            [f"**{key}:** {value}" for key, value in config.items()]
-        )
+def update_view(n_intervals, refresh_n_clicks, stored_data):
+    latest = get_worker().latest()
+    refresh = (
+        dash.callback_context.triggered
+        and dash.callback_context.triggered[0]["prop_id"] == "refresh-button.n_clicks"
+    )
+    if latest is None or (
+        not refresh
+        and latest["sweep"] == stored_data.get("sweep")
+        and latest["error"] == stored_data.get("error")
+    ):
+        raise dash.exceptions.PreventUpdate
 
-    return fig, timestamp_text, additional_data_text, stored_data, config_status
+    stored_data = {
+        "sweep": latest["sweep"],
+        "x": latest["x"],
+        "y": latest["y"],
+        "error": latest["error"],
+    }
+    timestamp = (
+        f"Last sweep at {latest['time']}." if latest["sweep"] else "No sweep yet."
+    )
+    if latest["error"] is not None:
+        timestamp += f" Acquisition failing: {latest['error']}"
+    return (
+        plot_figure(latest["x"], latest["y"]),
+        timestamp,
+        format_config(latest["config"]),
+        stored_data,
+    )
 
 
-# Refresh button cooldown callback
+# Configuration changes are queued to the acquisition worker and applied between two sweeps
 @app.callback(
-    [
-        Output("refresh-button", "disabled"),
-        Output("interval", "disabled"),
-        Output("interval", "n_intervals"),
-    ],
-    [Input("refresh-button", "n_clicks"), Input("interval", "n_intervals")],
+    Output("config-status", "children"),
+    Input("update-config-button", "n_clicks"),
+    State("wavelength-start-input", "value"),
+    prevent_initial_call=True,
 )
-def manage_refresh_button(n_clicks, n_intervals):
-    if n_clicks == 0:
-        return False, True, 0
-    # If button clicked, disable and enable interval
-    if dash.callback_context.triggered[0]["prop_id"] == "refresh-button.n_clicks":
-        return True, False, 0
-    # If 30 seconds passed, start button and disable interval
-    if n_intervals >= 30:
-        return False, True, 0
-    raise dash.exceptions.PreventUpdate
+def update_configuration(config_n_clicks, wavelength_start):
+    try:
+        get_worker().submit("set_wavelength_start", wavelength_start).result(
+            timeout=OSA_SERVER_CONFIG_TIMEOUT
+        )
+        return "Configuration updated successfully."
+    except Exception as e:
+        return f"Error updating configuration: {str(e)}"
 
 
 # Download csv callback
@@ -255,10 +375,12 @@ def manage_refresh_button(n_clicks, n_intervals):
 def download_csv(n_clicks, stored_data):
     if n_clicks == 0:
         raise dash.exceptions.PreventUpdate
-    df = pd.DataFrame(stored_data)
+    df = pd.DataFrame({"x": stored_data["x"], "y": stored_data["y"]})
     return dcc.send_data_frame(df.to_csv, "current_osa_reading.csv")
 
 
 # Run the app on localhost:20000. Forward this port to local, and add an alias preferably
 if __name__ == "__main__":
-    app.run_server(debug=True, port=20000)
+    get_worker()
+    # The reloader would start a second process competing for the OSA
+    app.run_server(debug=True, port=20000, use_reloader=False)
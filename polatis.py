@@ -1,13 +1,13 @@
 import sys
-import telnetlib
 import re
-import pandas as pd
 import time
 import os, getpass
 from datetime import datetime
-import sqlite3
 import csv
-import mysql.connector
+from guard import guard
+
+#: Guard and metrics label of a switch, from the host and port of its connection
+POLATIS_DEVICE_NAME = "polatis:%s:%s"
 
 
 def timeStamped(fname, fmt="%Y-%m-%d_{fname}"):
@@ -30,7 +30,11 @@ class Polatis:
 
     def __init__(self, host="10.10.10.28", port="3082"):
         """Constructor method"""
+        import telnetlib
+
         self.telnet = telnetlib.Telnet(host, port)
+        self.device_name = POLATIS_DEVICE_NAME % (host, port)
+        self.guard = guard(self.device_name)
         self.eol = ";"
         self.patch = {}
         self.shutter = {}
@@ -54,15 +58,18 @@ class Polatis:
 
     def logout(self):
         #        print self.telnet.read_all()
-        self.__sendcmd("CANC-USER::root:123:;")
-        self.telnet.close()
+        with self.guard:
+            self.__sendcmd("CANC-USER::root:123:;")
+            self.telnet.close()
 
     def __sendcmd(self, line):
         #        print "sending " + line
         cmd_str = "%s\n" % line
-        self.telnet.write(cmd_str.encode("ascii"))
-        cmd_str = self.eol
-        ret = self.telnet.read_until(cmd_str.encode("ascii"))
+        # The response is read up to the next terminator, so the command and its response must not interleave with those of another thread
+        with self.guard:
+            self.telnet.write(cmd_str.encode("ascii"))
+            cmd_str = self.eol
+            ret = self.telnet.read_until(cmd_str.encode("ascii"))
         ret = ret.decode("utf-8")
         return ret
 
@@ -93,6 +100,8 @@ class Polatis:
         :rtype: int
         """
         # Connect to the MySQL database
+        import mysql.connector
+
         conn = mysql.connector.connect(
             host="127.0.0.1", user="testbed", password="mypassword", database="provdb"
         )
@@ -112,6 +121,8 @@ class Polatis:
         :rtype: int
         """
         # Connect to the MySQL database
+        import mysql.connector
+
         conn = mysql.connector.connect(
             host="127.0.0.1", user="testbed", password="mypassword", database="provdb"
         )
@@ -183,6 +194,8 @@ class Polatis:
             )
 
         # Connect to the MySQL database
+        import mysql.connector
+
         conn = mysql.connector.connect(
             host="127.0.0.1", user="testbed", password="mypassword", database="provdb"
         )
@@ -291,6 +304,8 @@ class Polatis:
             )
 
         # Connect to the MySQL database
+        import mysql.connector
+
         conn = mysql.connector.connect(
             host="127.0.0.1", user="testbed", password="mypassword", database="provdb"
         )
@@ -334,6 +349,8 @@ class Polatis:
             unix_user = os.getenv("USER")
 
         # Connect to the MySQL database
+        import mysql.connector
+
         conn = mysql.connector.connect(
             host="127.0.0.1", user="testbed", password="mypassword", database="provdb"
         )
@@ -408,6 +425,8 @@ class Polatis:
             password = lines[1].strip()
 
         # Connect to the MySQL database
+        import mysql.connector
+
         conn = mysql.connector.connect(
             host="127.0.0.1", user=admin_user, password=password, database="provdb"
         )
@@ -593,7 +612,10 @@ class Polatis:
             m = re.match(r'\W*"(\d+):(\S+)"', line)
             if m:
                 return float(m.group(2))
-        return -99.99
+        # Imported here, as conversions loads numpy which polatis does not need otherwise
+        from conversions import NO_LIGHT_DBM
+
+        return NO_LIGHT_DBM
 
     def get_device_power(self, equipment, io):
         """Get the input/output power of a device.
@@ -0,0 +1,289 @@
+import re
+import time
+import random
+import threading
+import socketserver
+from datetime import datetime
+
+SIMULATOR_PORT_COUNT = 640
+SIMULATOR_INSERTION_LOSS = 1.0  # dB, loss of a patch through the switch
+SIMULATOR_NO_LIGHT = -99.99  # dBm, reported by ports without light
+SIMULATOR_WAVELENGTH = 1550.0  # nm, default PMON wavelength
+SIMULATOR_SID = "POLATIS-SIM"
+#: Commands whose AID is a user ID or a setting name rather than a port list, and which are accepted as they are
+SIMULATOR_SESSION_VERBS = ("ACT-USER", "CANC-USER", "ED-EQPT")
+
+
+class PolatisSimulator:
+
+    """Local TCP stand-in for the TL1 interface of a Polatis switch, for testing and benchmarking :class:`polatis.Polatis` without hardware, e.g. ``Polatis(host="127.0.0.1", port=simulator.port)``.
+
+    It answers ACT-USER, CANC-USER, ENT-PATCH, DLT-PATCH, RTRV-PATCH, RTRV-PORT-POWER, RTRV-PORT-SHUTTER, OPR/RLS-PORT-SHUTTER, RTRV-PORT-PMON, RTRV-PORT-LABEL, RTRV-PORT-ATTEN, RTRV-NETYPE, RTRV-EQPT and ED-EQPT with TL1 responses in the format of the switch: a header, one quoted line per entry and a single ';' terminator, without echoing the command. Ports take a range such as ``1&&640``. ACT-USER, CANC-USER and ED-EQPT complete for any user ID or setting.
+
+    The power of a port is the injected input power of the port, or the power of the port patched to it minus the insertion loss while the shutters of both ports are open.
+
+    :param host: Address to listen on
+    :type host: str
+
+    :param port: TCP port to listen on, 0 picks a free port
+    :type port: int
+
+    :param ports: Number of switch ports
+    :type ports: int
+
+    :param latency: Delay of every command in seconds
+    :type latency: float
+
+    :param port_latency: Additional delay per port addressed by a command in seconds, to model bulk retrievals
+    :type port_latency: float
+
+    :param jitter: Maximum random delay added to every command in seconds
+    :type jitter: float
+
+    :param power: Input power of ports in dBm keyed by port number
+    :type power: dict
+
+    :param insertion_loss: Loss of a patch in dB
+    :type insertion_loss: float
+
+    :param seed: Seed of the latency jitter
+    :type seed: int
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        ports=SIMULATOR_PORT_COUNT,
+        latency=0.0,
+        port_latency=0.0,
+        jitter=0.0,
+        power=None,
+        insertion_loss=SIMULATOR_INSERTION_LOSS,
+        seed=None,
+    ):
+
+        self.ports = ports
+        self.latency = latency
+        self.port_latency = port_latency
+        self.jitter = jitter
+        self.insertion_loss = insertion_loss
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.input_power = dict(power or {})
+        self.patch = {}
+        self.shutter = {p: "OPEN" for p in range(1, ports + 1)}
+        self.label = {p: "port%d" % p for p in range(1, ports + 1)}
+        self.command_count = 0
+        self.server = socketserver.ThreadingTCPServer(
+            (host, port), self.__handler(), bind_and_activate=False
+        )
+        self.server.allow_reuse_address = True
+        self.server.daemon_threads = True
+        self.server.server_bind()
+        self.server.server_activate()
+        self.host, self.port = self.server.server_address[:2]
+        self.thread = None
+
+    def start(self):
+        """Serve connections in a background thread.
+
+        :return: The simulator
+        :rtype: PolatisSimulator
+        """
+
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="polatis-simulator", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket."""
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def set_power(self, port, power):
+        """Inject the input power of a port.
+
+        :param port: Port number
+        :type port: int
+
+        :param power: Power in dBm, None for no light
+        :type power: float
+        """
+
+        with self.lock:
+            if power is None:
+                self.input_power.pop(port, None)
+            else:
+                self.input_power[port] = power
+
+    def port_power(self, port):
+        """Get the power the switch reports for a port.
+
+        :param port: Port number
+        :type port: int
+
+        :return: Power in dBm
+        :rtype: float
+        """
+
+        if port in self.input_power:
+            return self.input_power[port]
+        # Light reaches the port through a patch from an ingress port
+        for source, destination in self.patch.items():
+            if destination == port and source in self.input_power:
+                if self.shutter[source] == "OPEN" and self.shutter[port] == "OPEN":
+                    return self.input_power[source] - self.insertion_loss
+        return SIMULATOR_NO_LIGHT
+
+    def execute(self, command):
+        """Run a TL1 command and build its response.
+
+        :param command: TL1 command without the ';' terminator, e.g. ``RTRV-PORT-POWER::1&&640:123:``
+        :type command: str
+
+        :return: TL1 response ending with ';'
+        :rtype: str
+        """
+
+        fields = command.strip().split(":")
+        verb = fields[0].upper()
+        aid = fields[2] if len(fields) > 2 else ""
+        ctag = fields[3] if len(fields) > 3 and fields[3] else "0"
+        if verb in SIMULATOR_SESSION_VERBS:
+            # Any user ID logs in
+            self.__delay(0)
+            with self.lock:
+                self.command_count += 1
+            return self.__response(ctag, "COMPLD", [])
+        try:
+            ports = self.__ports(aid)
+        except ValueError:
+            return self.__response(ctag, "DENY", ['"IIAC"'])
+        self.__delay(len(ports))
+
+        with self.lock:
+            self.command_count += 1
+            if verb == "ENT-PATCH":
+                source, destination = (int(port) for port in aid.split(","))
+                if source in self.patch or destination in self.patch.values():
+                    return self.__response(ctag, "DENY", ['"SRQN"'])
+                self.patch[source] = destination
+                lines = []
+            elif verb == "DLT-PATCH":
+                if aid.upper() == "ALL":
+                    self.patch.clear()
+                else:
+                    for port in ports:
+                        self.patch.pop(port, None)
+                lines = []
+            elif verb == "RTRV-PATCH":
+                lines = ['"%d,%d"' % item for item in sorted(self.patch.items())]
+            elif verb == "RTRV-PORT-POWER":
+                lines = ['"%d:%.2f"' % (port, self.port_power(port)) for port in ports]
+            elif verb == "RTRV-PORT-SHUTTER":
+                lines = ['"%d:%s"' % (port, self.shutter[port]) for port in ports]
+            elif verb in ("OPR-PORT-SHUTTER", "RLS-PORT-SHUTTER"):
+                state = "CLOSED" if verb.startswith("OPR") else "OPEN"
+                for port in ports:
+                    self.shutter[port] = state
+                lines = []
+            elif verb == "RTRV-PORT-PMON":
+                lines = [
+                    '"%d:%.2f,0.00,0.10"' % (port, SIMULATOR_WAVELENGTH)
+                    for port in ports
+                ]
+            elif verb == "RTRV-EQPT":
+                lines = [
+                    '"PMON::PORT=%d,MODE=AUTO"' % port
+                    for port in range(1, self.ports + 1)
+                ]
+            elif verb == "RTRV-PORT-LABEL":
+                lines = ['"%d:%s"' % (port, self.label[port]) for port in ports]
+            elif verb == "RTRV-PORT-ATTEN":
+                lines = ['"%d:NONE"' % port for port in ports]
+            elif verb == "RTRV-NETYPE":
+                lines = ['"POLATIS,SERIES 7000,OST,%dx%d"' % (self.ports, self.ports)]
+            else:
+                return self.__response(ctag, "DENY", ['"ICNV"'])
+        return self.__response(ctag, "COMPLD", lines)
+
+    def __ports(self, aid):
+        if not aid or aid.upper() in ("ALL", "PMON"):
+            return []
+        ports = []
+        for item in aid.split(","):
+            match = re.fullmatch(r"(\d+)(?:&&(\d+))?", item)
+            if not match:
+                raise ValueError(aid)
+            first = int(match.group(1))
+            last = int(match.group(2) or first)
+            if not 1 <= first <= last <= self.ports:
+                raise ValueError(aid)
+            ports.extend(range(first, last + 1))
+        return ports
+
+    def __response(self, ctag, status, lines):
+        header = "\r\n\n   %s %s\r\nM  %s %s\r\n" % (
+            SIMULATOR_SID,
+            datetime.now().strftime("%y-%m-%d %H:%M:%S"),
+            ctag,
+            status,
+        )
+        return header + "".join("   %s\r\n" % line for line in lines) + ";"
+
+    def __delay(self, ports):
+        delay = self.latency + self.port_latency * ports
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def __handler(self):
+        simulator = self
+
+        class TL1Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                buffer = ""
+                while True:
+                    data = self.request.recv(4096)
+                    if not data:
+                        return
+                    buffer += data.decode("ascii", errors="replace")
+                    # Commands end with ';', several may arrive in one segment
+                    while ";" in buffer:
+                        command, buffer = buffer.split(";", 1)
+                        if command.strip():
+                            response = simulator.execute(command)
+                            self.wfile.write(response.encode("ascii"))
+
+        return TL1Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Polatis TL1 switch simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3082)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--port-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    simulator = PolatisSimulator(
+        args.host, args.port, latency=args.latency, port_latency=args.port_latency
+    )
+    print("Polatis simulator listening on %s:%d" % (simulator.host, simulator.port))
+    try:
+        simulator.server.serve_forever()
+    except KeyboardInterrupt:
+        simulator.stop()
@@ -1,9 +1,9 @@
-from ncclient import manager
-from ncclient.xml_ import *
-import xmltodict
+from instrumentation import instrument, parse_xml
+from retry import retrying
+from guard import guarded
 import logging
 import time
-from utils import check_patch_owners
+from utils import check_patch_owners, to_ele
 
 
 class QFlex:
@@ -29,6 +29,8 @@ class QFlex:
         if not check_patch_owners([(qf_name, qf_name)]):
             raise Exception("You are not authorized to use this device")
 
+        from ncclient import manager
+
         self.conn = manager.connect(
             host="10.10.10.120",
             port=830,
@@ -38,6 +40,7 @@ class QFlex:
             hostkey_verify=False,
         )
         self.conn.raise_mode = 0  # on RPCError, do not throw any exceptions
+        self.conn = retrying(guarded(instrument(self.conn, qf_name), qf_name), qf_name)
 
     def get_params(self, DEBUG=False):
         """Method to get the performance monitoring data of the Quadflex device.
@@ -58,7 +61,7 @@ class QFlex:
         """
 
         reply_pm_data = self.conn.dispatch(to_ele(request_pm_data))
-        perf_details = xmltodict.parse(reply_pm_data.xml)
+        perf_details = parse_xml(reply_pm_data.xml)
 
         return perf_details
         perf_categories = perf_details["nc:rpc-reply"]["pm-data"]["pm-current-data"]
@@ -94,7 +97,7 @@ class QFlex:
 
         reply_fec_ber = self.conn.dispatch(to_ele(request_fec_ber))
 
-        perf_details = xmltodict.parse(reply_fec_ber.xml)
+        perf_details = parse_xml(reply_fec_ber.xml)
         if "pm-data" in perf_details["nc:rpc-reply"].keys():
             perf_categories = perf_details["nc:rpc-reply"]["pm-data"]["pm-current-data"]
             for perf_cat in perf_categories:
@@ -138,7 +141,7 @@ class QFlex:
         """
 
         reply_fec_ber = self.conn.dispatch(to_ele(request_fec_ber))
-        pre_fec_ber = xmltodict.parse(reply_fec_ber.xml)["nc:rpc-reply"]["pm-data"][
+        pre_fec_ber = parse_xml(reply_fec_ber.xml)["nc:rpc-reply"]["pm-data"][
             "pm-current-data"
         ][0]["montype-monval"]["mon-val"]
 
@@ -155,7 +158,7 @@ class QFlex:
         config_dict = {}
 
         response = self.get_interface()
-        response_details = xmltodict.parse(response.xml)
+        response_details = parse_xml(response.xml)
         print(response)
         config = response_details["nc:rpc-reply"]["data"]["terminal-device"][
             "logical-channels"
@@ -177,7 +180,7 @@ class QFlex:
                 continue
             # get admin state
             response = self.get_port_admin_state()
-            response_details = xmltodict.parse(response.xml)
+            response_details = parse_xml(response.xml)
             config_dict[line_port]["admin_state"] = response_details["nc:rpc-reply"][
                 "data"
             ]["managed-element"]["interface"]["physical-interface"]["state"][
@@ -186,7 +189,7 @@ class QFlex:
 
             # read power and frequency
             response = self.get_power_and_frequency()
-            response_details = xmltodict.parse(response.xml)
+            response_details = parse_xml(response.xml)
             component_details = response_details["nc:rpc-reply"]["data"]["components"][
                 "component"
             ]
@@ -327,9 +330,7 @@ class QFlex:
         </nc:config>
         """
         response = self.conn.edit_config(target="running", config=request)
-        assert "ok" in xmltodict.parse(response.xml)["nc:rpc-reply"].keys(), print(
-            response
-        )
+        assert "ok" in parse_xml(response.xml)["nc:rpc-reply"].keys(), print(response)
         return response
 
     def __set_admin_maintenance(self, element):
@@ -432,9 +433,7 @@ class QFlex:
                 </nc:config>
                 """
         response = self.conn.edit_config(target="running", config=request)
-        assert "ok" in xmltodict.parse(response.xml)["nc:rpc-reply"].keys(), print(
-            response
-        )
+        assert "ok" in parse_xml(response.xml)["nc:rpc-reply"].keys(), print(response)
         self._config[self.line_port]["logical_interface"] = None
         return response
 
@@ -458,9 +457,7 @@ class QFlex:
                      </nc:config>
                      """
         response = self.conn.edit_config(target="running", config=request)
-        assert "ok" in xmltodict.parse(response.xml)["nc:rpc-reply"].keys(), print(
-            response
-        )
+        assert "ok" in parse_xml(response.xml)["nc:rpc-reply"].keys(), print(response)
         self._config[self.line_port]["logical_interface"] = logical_interface
         self._config[self.line_port]["modulation"] = self.get_interface_modulation()
         return response
@@ -518,7 +515,7 @@ class QFlex:
         </nc:config>
         """
         response = self.conn.edit_config(target="running", config=request)
-        assert "nc:ok" in xmltodict.parse(response.xml)["nc:rpc-reply"].keys(), print(
+        assert "nc:ok" in parse_xml(response.xml)["nc:rpc-reply"].keys(), print(
             response
         )
         self._config[self.line_port]["frequency"] = frequency
@@ -0,0 +1,395 @@
+import time
+import random
+import threading
+from instrumentation import REGISTRY
+from guard import DeviceBusyError
+
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.1  # s, delay before the first retry
+RETRY_MAX_DELAY = 5.0  # s, the delay doubles after every attempt up to this value
+RETRY_JITTER = 0.2  # fraction of the delay randomly added or removed
+BREAKER_FAILURE_THRESHOLD = (
+    5  # consecutive failed calls that open the breaker of a device
+)
+BREAKER_RESET_TIMEOUT = (
+    30.0  # s, time an open breaker rejects calls before letting one through
+)
+#: Session calls that read state and are safe to repeat
+RETRY_IDEMPOTENT_CALLS = ("get", "get_config")
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(RuntimeError):
+
+    """Raised instead of calling a device whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+
+    """Circuit breaker of a device. After ``failure_threshold`` consecutive failed calls it opens, and calls are rejected with :class:`CircuitOpenError` without reaching the device. Once ``reset_timeout`` has passed, one call is let through: the breaker closes if it succeeds and opens again if it fails.
+
+    :param device: Device name
+    :type device: str
+
+    :param failure_threshold: Consecutive failures that open the breaker
+    :type failure_threshold: int
+
+    :param reset_timeout: Time in seconds the breaker stays open
+    :type reset_timeout: float
+    """
+
+    def __init__(
+        self,
+        device,
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=BREAKER_RESET_TIMEOUT,
+    ):
+
+        self.device = device
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.counts = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def allow(self):
+        """Check that a call may go to the device, and count it.
+
+        :raises CircuitOpenError: If the breaker is open
+        """
+
+        with self.lock:
+            if self.state == BREAKER_OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.counts["rejected"] += 1
+                    raise CircuitOpenError(
+                        "Circuit breaker of %s is open after %d consecutive failures"
+                        % (self.device, self.failures)
+                    )
+                self.state = BREAKER_HALF_OPEN
+                self.trial = False
+            if self.state == BREAKER_HALF_OPEN:
+                if self.trial:
+                    self.counts["rejected"] += 1
+                    raise CircuitOpenError(
+                        "Circuit breaker of %s is waiting for a trial call"
+                        % self.device
+                    )
+                self.trial = True
+            self.counts["calls"] += 1
+
+    def record_success(self):
+        """Close the breaker after a successful call."""
+
+        with self.lock:
+            self.state = BREAKER_CLOSED
+            self.failures = 0
+            self.trial = False
+
+    def record_failure(self):
+        """Count a failed call, opening the breaker at the threshold or after a failed trial call."""
+
+        with self.lock:
+            self.failures += 1
+            self.counts["failures"] += 1
+            if self.state == BREAKER_HALF_OPEN or (
+                self.state == BREAKER_CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.state = BREAKER_OPEN
+                self.opened_at = time.monotonic()
+                self.counts["opened"] += 1
+            self.trial = False
+
+    def abandon(self):
+        """Forget a call that ended without telling whether the device works, letting another trial call through."""
+
+        with self.lock:
+            self.trial = False
+
+    def reset(self):
+        """Close the breaker and forget the failures."""
+
+        with self.lock:
+            self.state = BREAKER_CLOSED
+            self.failures = 0
+            self.trial = False
+
+    def to_dict(self):
+        """Get the state and counters of the breaker.
+
+        :return: State, consecutive failures, and counts of calls, failures, rejected calls and openings
+        :rtype: dict
+        """
+
+        with self.lock:
+            return dict(
+                self.counts, state=self.state, consecutive_failures=self.failures
+            )
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(device):
+    """Get the circuit breaker shared by all the users of a device, creating it on first use.
+
+    :param device: Device name
+    :type device: str
+
+    :return: Circuit breaker of the device
+    :rtype: CircuitBreaker
+    """
+
+    with _breakers_lock:
+        if device not in _breakers:
+            _breakers[device] = CircuitBreaker(device)
+        return _breakers[device]
+
+
+def breaker_states():
+    """Get the state and counters of the breaker of every device used so far.
+
+    :return: Breaker states (see :meth:`CircuitBreaker.to_dict`) keyed by device name
+    :rtype: dict
+    """
+
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {device: breakers[device].to_dict() for device in sorted(breakers)}
+
+
+class RetryPolicy:
+
+    """How a call to a device is retried: up to ``attempts`` attempts, waiting between two attempts an exponentially growing delay with random jitter, within an optional ``deadline`` for the whole call. Calls go through the circuit breaker of the device, which is asked once per call and counts a call as failed once its last attempt fails, so a device that keeps failing is rejected at once instead of being retried by every caller. The number of attempts of each call and the delays waited are recorded into the instrumentation registry under the 'retry' kind.
+
+    :param attempts: Maximum number of attempts
+    :type attempts: int
+
+    :param base_delay: Delay before the first retry in seconds
+    :type base_delay: float
+
+    :param max_delay: Largest delay between two attempts in seconds
+    :type max_delay: float
+
+    :param multiplier: Growth of the delay after every attempt
+    :type multiplier: float
+
+    :param jitter: Fraction of the delay randomly added or removed, so that callers failing together do not retry together
+    :type jitter: float
+
+    :param deadline: Time budget of a call in seconds, retries that would end after it are not made. No budget by default
+    :type deadline: float
+
+    :param retry_on: Exception types that are retried, others are raised at once
+    :type retry_on: tuple
+
+    :param ignore: Exception types raised at once without counting as a failure of the device, such as the errors the device replies with. Or a function returning them, called when a call first fails, so that the modules defining them are only imported when needed
+    :type ignore: tuple or callable
+
+    :param use_breaker: Whether calls go through the circuit breaker of the device
+    :type use_breaker: bool
+    """
+
+    def __init__(
+        self,
+        attempts=RETRY_ATTEMPTS,
+        base_delay=RETRY_BASE_DELAY,
+        max_delay=RETRY_MAX_DELAY,
+        multiplier=2.0,
+        jitter=RETRY_JITTER,
+        deadline=None,
+        retry_on=(Exception,),
+        ignore=(),
+        use_breaker=True,
+    ):
+
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retry_on = retry_on
+        self.ignore = ignore
+        self.use_breaker = use_breaker
+        self.random = random.Random()
+
+    def ignored(self):
+        """Get the exception types raised at once without counting as a failure of the device.
+
+        :return: Exception types
+        :rtype: tuple
+        """
+
+        if callable(self.ignore):
+            self.ignore = tuple(self.ignore())
+        return self.ignore
+
+    def delay(self, attempt):
+        """Get the delay to wait after a failed attempt.
+
+        :param attempt: Number of the failed attempt, from 1
+        :type attempt: int
+
+        :return: Delay in seconds
+        :rtype: float
+        """
+
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        if self.jitter:
+            delay *= 1.0 + self.random.uniform(-self.jitter, self.jitter)
+        return max(delay, 0.0)
+
+    def call(self, device, function, *args, name="", **kwargs):
+        """Call a function of a device under the policy.
+
+        :param device: Device name, selecting the circuit breaker and labelling the metrics
+        :type device: str
+
+        :param function: Function to call with the remaining arguments
+        :type function: callable
+
+        :param name: Name of the operation in the metrics, the name of the function by default
+        :type name: str
+
+        :return: Result of the function
+
+        :raises CircuitOpenError: If the breaker of the device is open
+        :raises Exception: The error of the last attempt, when every attempt failed or the deadline is reached
+        """
+
+        name = name or getattr(function, "__name__", "")
+        circuit = breaker(device) if self.use_breaker else None
+        # The breaker counts calls, so it is asked once and told the outcome of the call, not of every attempt
+        if circuit is not None:
+            try:
+                circuit.allow()
+            except CircuitOpenError:
+                REGISTRY.observe("attempts", device, "retry", name, 0)
+                raise
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = function(*args, **kwargs)
+            except self.ignored():
+                # The device answered with an error, or another thread held it
+                if circuit is not None:
+                    circuit.record_success()
+                REGISTRY.observe("attempts", device, "retry", name, attempt)
+                raise
+            except Exception as e:
+                delay = self.delay(attempt)
+                out_of_time = (
+                    self.deadline is not None
+                    and time.monotonic() - start + delay > self.deadline
+                )
+                if (
+                    not isinstance(e, self.retry_on)
+                    or attempt >= self.attempts
+                    or out_of_time
+                ):
+                    if circuit is not None:
+                        circuit.record_failure()
+                    REGISTRY.observe("attempts", device, "retry", name, attempt)
+                    raise
+                print(
+                    "%s: %s failed (%s), retrying in %.2f s, attempt %d of %d"
+                    % (device, name, e, delay, attempt + 1, self.attempts)
+                )
+                REGISTRY.observe("retry_delay_seconds", device, "retry", name, delay)
+                time.sleep(delay)
+            except BaseException:
+                # Interrupted, which says nothing about the device
+                if circuit is not None:
+                    circuit.abandon()
+                raise
+            else:
+                if circuit is not None:
+                    circuit.record_success()
+                REGISTRY.observe("attempts", device, "retry", name, attempt)
+                return result
+
+
+def _session_errors():
+    # Errors a NETCONF device replies with, which do not make it unhealthy, and calls rejected while another thread held the device.
+    # Resolved on the first failed call, as importing ncclient is slow
+    try:
+        from ncclient.operations.rpc import RPCError
+    except ImportError:
+        return (DeviceBusyError,)
+    return (RPCError, DeviceBusyError)
+
+
+#: Policy of the NETCONF sessions of the drivers
+SESSION_POLICY = RetryPolicy(ignore=_session_errors)
+
+
+class RetryingSession:
+
+    """Proxy of a NETCONF session calling the device under a :class:`RetryPolicy`. Reads (``get`` and ``get_config``) are retried; other calls, which change the device, are attempted once but still go through the circuit breaker of the device, so they fail fast while it is open. Other attributes are those of the session.
+
+    :param session: NETCONF session, e.g. an ncclient manager
+    :type session: ncclient.manager.Manager
+
+    :param device: Device name
+    :type device: str
+
+    :param policy: Retry policy of the reads
+    :type policy: RetryPolicy
+    """
+
+    def __init__(self, session, device, policy=SESSION_POLICY):
+
+        object.__setattr__(self, "session", session)
+        object.__setattr__(self, "device", device)
+        object.__setattr__(self, "policy", policy)
+        object.__setattr__(
+            self,
+            "once",
+            RetryPolicy(
+                attempts=1, ignore=policy.ignore, use_breaker=policy.use_breaker
+            ),
+        )
+
+    def __getattr__(self, name):
+        attribute = getattr(self.session, name)
+        if not callable(attribute) or name in ("close_session", "close"):
+            return attribute
+        policy = self.policy if name in RETRY_IDEMPOTENT_CALLS else self.once
+
+        def call(*args, **kwargs):
+            return policy.call(self.device, attribute, *args, name=name, **kwargs)
+
+        return call
+
+    def __setattr__(self, name, value):
+        # Settings such as raise_mode belong to the session
+        setattr(self.session, name, value)
+
+
+def retrying(session, device, policy=SESSION_POLICY):
+    """Wrap a NETCONF session to retry its reads and guard it with the circuit breaker of the device.
+
+    :param session: NETCONF session
+    :type session: ncclient.manager.Manager
+
+    :param device: Device name
+    :type device: str
+
+    :param policy: Retry policy of the reads
+    :type policy: RetryPolicy
+
+    :return: Retrying session
+    :rtype: RetryingSession
+    """
+
+    return RetryingSession(session, device, policy)
@@ -1,10 +1,10 @@
-from ncclient import manager
-from ncclient.xml_ import to_ele
-import xmltodict
+from instrumentation import instrument, parse_xml
+from retry import retrying
+from guard import guard, guarded
 import logging
 import time
 import sys
-from utils import check_patch_owners
+from utils import check_patch_owners, to_ele
 
 
 class TFlex:
@@ -34,6 +34,7 @@ class TFlex:
         if check_patch_owners(
             [(tf_name, tf_name)]
         ):  # We need to map individual line ports to patches and then configure check_patch_list for each set line_port method
+            from ncclient import manager
 
             self.conn = manager.connect(
                 host="10.10.10.92",
@@ -45,6 +46,10 @@ class TFlex:
                 look_for_keys=False,  # there is a bug in ncclient, which has a temporary workaround here, but ideally should raise a pull request to fix the bug
             )
             self.conn.raise_mode = 0  # on RPCError, do not throw any exceptions
+            self.conn = retrying(
+                guarded(instrument(self.conn, tf_name), tf_name), tf_name
+            )
+            self.guard = guard(tf_name)
             self._config = {}
             self.__get_config()
         else:
@@ -73,7 +78,7 @@ class TFlex:
         counter = 0
         while offline:
             response = self.get_operational_state()
-            response_details = xmltodict.parse(response.xml)
+            response_details = parse_xml(response.xml)
             status = response_details["rpc-reply"]["data"]["components"]["component"][
                 "state"
             ]["oper-status"]
@@ -152,23 +157,29 @@ class TFlex:
         """
 
         sleep_counter = 30
-        if self._config[self.line_port]["admin_state"] != "acor-stt:is":
-            self.set_interface_on()
-        if self._config[self.line_port]["logical_interface"] != logical_interface:
-            if self._config[self.line_port]["logical_interface"]:
-                self.delete_logical_interface()
-            self.create_logical_interface(logical_interface)
-            sleep_counter = 150
-        if self._config[self.line_port]["modulation"] != modulation:
-            self.__set_admin_maintenance(self.line_port + "/" + logical_interface)
-            self.set_interface_modulation(modulation)
-            self.__remove_admin_maintenance(self.line_port + "/" + logical_interface)
-            sleep_counter = 150
-        # if self._config[line_port]['fec'] != fec:
-        #     self.set_fec_algorithm(line_port, fec)
-        # if self._config[line_port]['filter-roll-off'] != rolloff:
-        #     self.set_filterrolloff(line_port, rolloff)
-        self.set_power_and_frequency(power=target_power, frequency=central_frequency)
+        # Other threads must not change the interface between the steps, e.g. while it is in maintenance
+        with self.guard:
+            if self._config[self.line_port]["admin_state"] != "acor-stt:is":
+                self.set_interface_on()
+            if self._config[self.line_port]["logical_interface"] != logical_interface:
+                if self._config[self.line_port]["logical_interface"]:
+                    self.delete_logical_interface()
+                self.create_logical_interface(logical_interface)
+                sleep_counter = 150
+            if self._config[self.line_port]["modulation"] != modulation:
+                self.__set_admin_maintenance(self.line_port + "/" + logical_interface)
+                self.set_interface_modulation(modulation)
+                self.__remove_admin_maintenance(
+                    self.line_port + "/" + logical_interface
+                )
+                sleep_counter = 150
+            # if self._config[line_port]['fec'] != fec:
+            #     self.set_fec_algorithm(line_port, fec)
+            # if self._config[line_port]['filter-roll-off'] != rolloff:
+            #     self.set_filterrolloff(line_port, rolloff)
+            self.set_power_and_frequency(
+                power=target_power, frequency=central_frequency
+            )
         return sleep_counter
 
     def return_current_config(self):
@@ -182,7 +193,7 @@ class TFlex:
 
     def __get_config(self):  # This should be done in a more efficient way
         response = self.get_interface()
-        response_details = xmltodict.parse(response.xml)
+        response_details = parse_xml(response.xml)
         config = response_details["rpc-reply"]["data"]["terminal-device"][
             "logical-channels"
         ]["channel"]
@@ -202,14 +213,14 @@ class TFlex:
         assert self._config[self.line_port]["logical_interface"] is not None
 
         response = self.get_port_admin_state()
-        response_details = xmltodict.parse(response.xml)
+        response_details = parse_xml(response.xml)
         self._config[self.line_port]["admin_state"] = response_details["rpc-reply"][
             "data"
         ]["managed-element"]["interface"]["physical-interface"]["state"]["admin-state"]
 
         # get modulation
         response = self.get_interface_modulation()
-        response_details = xmltodict.parse(response.xml)
+        response_details = parse_xml(response.xml)
         self._config[self.line_port]["modulation"] = response_details["rpc-reply"][
             "data"
         ]["managed-element"]["interface"]["logical-interface"]["otsia"]["otsi"][
@@ -220,7 +231,7 @@ class TFlex:
 
         # get rolloff
         response = self.get_filterrolloff()
-        response_details = xmltodict.parse(response.xml)
+        response_details = parse_xml(response.xml)
         try:
             self._config[self.line_port]["filter-roll-off"] = response_details[
                 "rpc-reply"
@@ -236,7 +247,7 @@ class TFlex:
 
         # read power and frequency
         response = self.get_power_and_frequency()
-        response_details = xmltodict.parse(response.xml)
+        response_details = parse_xml(response.xml)
         component_details = response_details["rpc-reply"]["data"]["components"][
             "component"
         ]
@@ -255,7 +266,7 @@ class TFlex:
 
         # read fec
         response = self.get_fec_algorithm()
-        response_details = xmltodict.parse(response.xml)
+        response_details = parse_xml(response.xml)
         component_details = response_details["rpc-reply"]["data"]["components"][
             "component"
         ]
@@ -336,9 +347,7 @@ class TFlex:
                 </nc:config>
                 """
         response = self.conn.edit_config(target="running", config=request)
-        assert "ok" in xmltodict.parse(response.xml)["rpc-reply"].keys(), print(
-            response
-        )
+        assert "ok" in parse_xml(response.xml)["rpc-reply"].keys(), print(response)
         self._config[self.line_port]["logical_interface"] = None
         return response
 
@@ -363,9 +372,7 @@ class TFlex:
                      </nc:config>
                      """
         response = self.conn.edit_config(target="running", config=request)
-        assert "ok" in xmltodict.parse(response.xml)["rpc-reply"].keys(), print(
-            response
-        )
+        assert "ok" in parse_xml(response.xml)["rpc-reply"].keys(), print(response)
         self._config[self.line_port]["logical_interface"] = logical_interface
         self._config[self.line_port]["modulation"] = self.get_interface_modulation()
         return response
@@ -434,9 +441,7 @@ class TFlex:
                               </nc:config>
                                 """
         response = self.conn.edit_config(target="running", config=request)
-        assert "ok" in xmltodict.parse(response.xml)["rpc-reply"].keys(), print(
-            response
-        )
+        assert "ok" in parse_xml(response.xml)["rpc-reply"].keys(), print(response)
         self._config[self.line_port]["modulation"] = modulation
         return response
 
@@ -494,9 +499,7 @@ class TFlex:
         </nc:config>
         """
         response = self.conn.edit_config(target="running", config=request)
-        assert "ok" in xmltodict.parse(response.xml)["rpc-reply"].keys(), print(
-            response
-        )
+        assert "ok" in parse_xml(response.xml)["rpc-reply"].keys(), print(response)
         self._config[self.line_port]["frequency"] = frequency
         self._config[self.line_port]["target-output-power"] = power
         return response
@@ -541,9 +544,7 @@ class TFlex:
         </nc:config>
         """
         response = self.conn.edit_config(target="running", config=request)
-        assert "ok" in xmltodict.parse(response.xml)["rpc-reply"].keys(), print(
-            response
-        )
+        assert "ok" in parse_xml(response.xml)["rpc-reply"].keys(), print(response)
         return response
 
     def get_interface_state(self):
@@ -662,7 +663,7 @@ class TFlex:
         """
 
         reply_pm_data = self.conn.dispatch(to_ele(request_pm_data))
-        perf_details = xmltodict.parse(reply_pm_data.xml)
+        perf_details = parse_xml(reply_pm_data.xml)
 
         perf_categories = perf_details["rpc-reply"]["pm-data"]["pm-current-data"]
 
@@ -697,7 +698,7 @@ class TFlex:
 
         reply_fec_ber = self.conn.dispatch(to_ele(request_fec_ber))
 
-        perf_details = xmltodict.parse(reply_fec_ber.xml)
+        perf_details = parse_xml(reply_fec_ber.xml)
         if "pm-data" in perf_details["rpc-reply"].keys():
             perf_categories = perf_details["rpc-reply"]["pm-data"]["pm-current-data"]
             for perf_cat in perf_categories:
@@ -780,9 +781,7 @@ class TFlex:
                                       </nc:config>
                                         """
         response = self.conn.edit_config(target="running", config=request)
-        assert "ok" in xmltodict.parse(response.xml)["rpc-reply"].keys(), print(
-            response
-        )
+        assert "ok" in parse_xml(response.xml)["rpc-reply"].keys(), print(response)
         self._config[self.line_port]["filter-roll-off"] = rolloff
         return response
 
@@ -866,8 +865,6 @@ class TFlex:
                     </components>
                     """
         response = self.conn.edit_config(target="running", config=request)
-        assert "ok" in xmltodict.parse(response.xml)["rpc-reply"].keys(), print(
-            response
-        )
+        assert "ok" in parse_xml(response.xml)["rpc-reply"].keys(), print(response)
         self._config[self.line_port]["fec"] = fec
         return response
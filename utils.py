@@ -1,13 +1,188 @@
-import mysql.connector
 import os
-import math
-import pkg_resources
-import pandas as pd
+import functools
 
 FIRST_CENTRAL_FREQ = 191350.0
 CHANNEL_SPACING = 50.0
 CHANNEL_WIDTH = 50.0
-wdm_channel_list = list(range(1, 96))
+CHANNEL_QUANTITY = 95
+wdm_channel_list = list(range(1, CHANNEL_QUANTITY + 1))
+
+
+class ChannelGrid:
+
+    """Fixed channel grid with the start, centre and end frequency of every channel computed once, as read-only arrays indexed by channel number minus one. Frequency lookups are binary searches on these arrays. Grids are shared, get them with :func:`channel_grid` rather than building them. numpy is only imported once a grid is used, to keep utils quick to import.
+
+    :param channel_width: Channel width in GHz
+    :type channel_width: float
+
+    :param channel_spacing: Channel spacing in GHz
+    :type channel_spacing: float
+
+    :param first_central_freq: Central frequency of channel 1 in GHz
+    :type first_central_freq: float
+
+    :param channel_quantity: Number of channels
+    :type channel_quantity: int
+    """
+
+    def __init__(
+        self,
+        channel_width=CHANNEL_WIDTH,
+        channel_spacing=CHANNEL_SPACING,
+        first_central_freq=FIRST_CENTRAL_FREQ,
+        channel_quantity=CHANNEL_QUANTITY,
+    ):
+
+        import numpy as np
+
+        self.channel_width = channel_width
+        self.channel_spacing = channel_spacing
+        self.first_central_freq = first_central_freq
+        self.channels = np.arange(1, channel_quantity + 1)
+        self.centre = first_central_freq + (self.channels - 1) * channel_spacing
+        self.start = self.centre - channel_width / 2.0
+        self.end = self.centre + channel_width / 2.0
+        for array in (self.channels, self.centre, self.start, self.end):
+            array.flags.writeable = False
+
+    def __len__(self):
+        return len(self.channels)
+
+    def range(self, channel):
+        """Get the frequency range of a channel. Channels outside the grid are extrapolated from it.
+
+        :param channel: Channel number
+        :type channel: int
+
+        :return: Start, central and end frequency of the channel in GHz
+        :rtype: tuple
+        """
+
+        if 1 <= channel <= len(self.channels):
+            i = int(channel) - 1
+            return float(self.start[i]), float(self.centre[i]), float(self.end[i])
+        centre = self.first_central_freq + (channel - 1) * self.channel_spacing
+        return (
+            centre - self.channel_width / 2.0,
+            centre,
+            centre + self.channel_width / 2.0,
+        )
+
+    def ranges(self, channels):
+        """Get the frequency ranges of several channels at once.
+
+        :param channels: Channel numbers
+        :type channels: list
+
+        :return: Start, central and end frequency in GHz of each channel, one row per channel
+        :rtype: numpy.ndarray
+        """
+
+        import numpy as np
+
+        channels = np.asarray(channels, dtype=int)
+        if channels.size and channels.min() >= 1 and channels.max() <= len(self):
+            i = channels - 1
+            return np.column_stack((self.start[i], self.centre[i], self.end[i]))
+        centre = self.first_central_freq + (channels - 1) * self.channel_spacing
+        return np.column_stack(
+            (
+                centre - self.channel_width / 2.0,
+                centre,
+                centre + self.channel_width / 2.0,
+            )
+        )
+
+    def channel_of(self, frequency):
+        """Get the channel whose band holds a frequency, the one with the nearest centre where bands overlap.
+
+        :param frequency: Frequency in GHz, e.g. the measured frequency of an OCM channel
+        :type frequency: float or list or numpy.ndarray
+
+        :return: Channel number, 0 for a frequency outside every band. An array for a list or an array
+        :rtype: int or numpy.ndarray
+        """
+
+        import numpy as np
+
+        f = np.asarray(frequency, dtype=np.float64)
+        # The nearest of the two centres around the frequency
+        upper = np.clip(np.searchsorted(self.centre, f), 0, len(self) - 1)
+        lower = np.maximum(upper - 1, 0)
+        i = np.where(f - self.centre[lower] <= self.centre[upper] - f, lower, upper)
+        inside = (self.start[i] <= f) & (f <= self.end[i])
+        channel = np.where(inside, self.channels[i], 0)
+        return int(channel) if channel.ndim == 0 else channel
+
+    def slots(self, start_freq, end_freq):
+        """Get the channels whose centre lies inside a frequency range, e.g. the grid channels a flex-grid connection carries.
+
+        :param start_freq: Start frequency of the range in GHz
+        :type start_freq: float
+
+        :param end_freq: End frequency of the range in GHz
+        :type end_freq: float
+
+        :return: Channel numbers
+        :rtype: numpy.ndarray
+        """
+
+        import numpy as np
+
+        lo = np.searchsorted(self.centre, start_freq, side="right")
+        hi = np.searchsorted(self.centre, end_freq, side="left")
+        return self.channels[lo:hi]
+
+    def span(self, channels):
+        """Get the frequency range covered by consecutive channels, e.g. a wide flex-grid channel.
+
+        :param channels: Channel numbers, in increasing order
+        :type channels: list
+
+        :return: Start frequency of the first channel and end frequency of the last one in GHz
+        :rtype: tuple
+        """
+
+        return self.range(channels[0])[0], self.range(channels[-1])[2]
+
+
+@functools.lru_cache(maxsize=None)
+def _channel_grid(channel_width, channel_spacing, first_central_freq, channel_quantity):
+    return ChannelGrid(
+        channel_width, channel_spacing, first_central_freq, channel_quantity
+    )
+
+
+def channel_grid(
+    channel_width=CHANNEL_WIDTH,
+    channel_spacing=CHANNEL_SPACING,
+    first_central_freq=FIRST_CENTRAL_FREQ,
+    channel_quantity=CHANNEL_QUANTITY,
+):
+    """Get the channel grid of a grid definition, built on first use and shared afterwards.
+
+    :param channel_width: Channel width in GHz
+    :type channel_width: float
+
+    :param channel_spacing: Channel spacing in GHz
+    :type channel_spacing: float
+
+    :param first_central_freq: Central frequency of channel 1 in GHz
+    :type first_central_freq: float
+
+    :param channel_quantity: Number of channels
+    :type channel_quantity: int
+
+    :return: Channel grid
+    :rtype: ChannelGrid
+    """
+
+    return _channel_grid(
+        float(channel_width),
+        float(channel_spacing),
+        float(first_central_freq),
+        int(channel_quantity),
+    )
 
 
 def get_freq_range(
@@ -28,27 +203,28 @@ def get_freq_range(
     :param channel_spacing: Channel spacing in GHz
     :type channel_spacing: float
 
-    :param first_central_freq: First central frequency in THz
+    :param first_central_freq: First central frequency in GHz
     :type first_central_freq: float
 
-    :return: Start frequency, central frequency, and end frequency of the channel in THz
+    :return: Start frequency, central frequency, and end frequency of the channel in GHz
     :rtype: tuple
     """
 
-    central_freq = first_central_freq + (channel_num - 1) * channel_spacing
-    start_freq = central_freq - channel_width / 2.0
-    end_freq = central_freq + channel_width / 2.0
-
-    return int(start_freq), int(central_freq), int(end_freq)
+    return channel_grid(channel_width, channel_spacing, first_central_freq).range(
+        channel_num
+    )
 
 
-def check_patch_owners(patch_list):
+def check_patch_owners(patch_list, connection=None):
 
     """Check if the ports in the patch list are available and are allocated to the running user.
 
     :param patch_list: A list of patches, where each patch is a list of ports.
     :type patch_list: list
 
+    :param connection: Open DB-API connection to the port database, left open afterwards. Default connects to the provisioning MySQL database.
+    :type connection: object
+
     :return: True if all ports are available and allocated to the running user, False otherwise.
     :rtype: bool
     """
@@ -58,10 +234,15 @@ def check_patch_owners(patch_list):
     if not unix_user:
         unix_user = os.getenv("USER")
 
-    # Connect to the MySQL database
-    conn = mysql.connector.connect(
-        host="127.0.0.1", user="testbed", password="mypassword", database="provdb"
-    )
+    if connection is not None:
+        conn = connection
+    else:
+        # Connect to the MySQL database
+        import mysql.connector
+
+        conn = mysql.connector.connect(
+            host="127.0.0.1", user="testbed", password="mypassword", database="provdb"
+        )
     cursor = conn.cursor()
 
     nonexistent_ports = []
@@ -87,7 +268,8 @@ def check_patch_owners(patch_list):
     if (len(nonexistent_ports) > 0) or (len(other_owners) > 0):
         # Close the cursor and connection
         cursor.close()
-        conn.close()
+        if connection is None:
+            conn.close()
 
         if nonexistent_ports:
             print("Nonexistent ports:", nonexistent_ports)
@@ -110,48 +292,55 @@ def check_patch_owners(patch_list):
 
         # Close the cursor and connection
         cursor.close()
-        conn.close()
+        if connection is None:
+            conn.close()
         return True
 
 
 def db_to_abs(db_value):
-    """Function to convert dB to absolute value
+    """Function to convert dB to absolute value, see :func:`conversions.db_to_linear`
 
     :param db_value
     :type db_value: list or float
 
-    :return: Absolute value in Watts
+    :return: Absolute value, an array for a list
     """
-    absolute_value = 10 ** (db_value / float(10))
-    return absolute_value
+    from conversions import db_to_linear
+
+    return db_to_linear(db_value)
 
 
 def abs_to_db(absolute_value):
 
-    """Function to convert absolute value to dB
+    """Function to convert absolute value to dB, see :func:`conversions.linear_to_db`. Values that are not positive give -99.99 dB
 
     :param absolute_value
     :type absolute_value: list or float
 
-    :return: dB value
+    :return: dB value, an array for a list
     """
-    db_value = 10 * math.log10(absolute_value)
-    return db_value
+    from conversions import linear_to_db
+
+    return linear_to_db(absolute_value)
 
 
 def abs_to_dbm(absolute_value):
-    """Function to convert absolute value to dBm
+    """Function to convert absolute value in Watts to dBm, see :func:`conversions.w_to_dbm`. Values that are not positive give -99.99 dBm
 
     :param absolute_value
     :type absolute_value: list or float
 
-    :return: dBm value
+    :return: dBm value, an array for a list
     """
-    dbm_value = 10 * math.log10(absolute_value / 1e-3)
-    return dbm_value
+    from conversions import w_to_dbm
+
+    return w_to_dbm(absolute_value)
 
 
 def load_csv_with_pandas(filename):
+    import pkg_resources
+    import pandas as pd
+
     # Get the path to the CSV file within the installed package
     csv_path = pkg_resources.resource_filename("tcdona3", filename)
 
@@ -159,3 +348,17 @@ def load_csv_with_pandas(filename):
     df = pd.read_csv(csv_path)
 
     return df
+
+
+def to_ele(xml):
+    """Convert an XML string to an ncclient element. ncclient is imported on first use, so the drivers can be imported without loading it.
+
+    :param xml: XML document
+    :type xml: str
+
+    :return: Element to dispatch to a NETCONF session
+    :rtype: lxml.etree._Element
+    """
+    from ncclient.xml_ import to_ele
+
+    return to_ele(xml)